@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as async_redis
 
 
 def get_redis_client():
@@ -17,3 +18,7 @@ def decode_bytes(obj):
         return tuple(decode_bytes(i) for i in obj)
     else:
         return obj
+
+
+def get_async_redis_client():
+    return async_redis.Redis(host="localhost", port=6379, db=0)
@@ -52,6 +52,14 @@ class UserDTO(AccountDTO):
     # disabled: bool | None = None
 
 
+class UserSummaryDTO(BaseModel):
+    id: Optional[int] = None
+    username: Optional[str] = None
+    title: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+
 class RoleDTA(BaseModel):
     id: Optional[int] = None
     role_name: str
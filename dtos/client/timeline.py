@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class TimelineEventDTO(BaseModel):
+    event_time: datetime
+    event_type: str
+    id: int
+    title: Optional[str] = None
+    detail: Optional[str] = None
+    reference_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class TimelineDTO(BaseModel):
+    data: List[TimelineEventDTO] = []
+    next_cursor: Optional[str] = None
@@ -3,7 +3,7 @@ from typing import Optional, List
 from pydantic import BaseModel
 from datetime import date
 
-from dtos.auth import UserDTO
+from dtos.auth import UserDTO, UserSummaryDTO
 
 
 class ScheduleDTO(BaseModel):
@@ -44,3 +44,9 @@ class ConsultantDTO(BaseModel):
         orm_mode = True
         from_attributes = True
 
+
+class ConsultantSummaryDTO(BaseModel):
+    id: int
+    title: Optional[str] = None
+    user: Optional[UserSummaryDTO] = None
+    specializations: List[SpecialismDTO] = []
@@ -4,8 +4,8 @@ from datetime import date, datetime as dtime
 from pydantic import BaseModel, field_validator
 from typing import Optional, List
 
-from dtos.consultant import ConsultantDTO
-from dtos.people import ClientDTO
+from dtos.consultant import ConsultantSummaryDTO
+from dtos.people import ClientSummaryDTO
 from dtos.pharmacy.prescription import PrescriptionDTO
 from dtos.service_dtos.client_cart_service import ClientServiceCartDTO
 from dtos.services import BusinessServiceDTO
@@ -56,6 +56,7 @@ class InHoursDTO(BaseModel):
     specialist_id: Optional[int] = None
     frequency: Optional[InHourFrequency]
     business_service: Optional[BusinessServiceDTO]
+    available_slots: Optional[List[str]] = None
 
     class Config:
         from_attributes = True
@@ -69,6 +70,13 @@ class BaseCaseDTO(BaseModel):
     case_status: Optional[CaseStatus] = CaseStatus.Open
 
 
+class SlotReservationDTO(BaseModel):
+    schedule_id: int
+    consultation_time: str
+    token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+
 class ConsultationQueueDTO(BaseModel):
     id: Optional[int] = None
     schedule_id: Optional[int] = None
@@ -81,6 +89,7 @@ class ConsultationQueueDTO(BaseModel):
     specialization_id: Optional[int] = None
     consultation_time: Optional[str] = None
     base_cases: List[BaseCaseDTO] = []
+    reservation: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -97,8 +106,8 @@ class ConsultationRoSDTO(BaseModel):
 
 
 class ConsultationAppointmentDTO(BaseModel):
-    specialist: Optional[ConsultantDTO]
-    client: Optional[ClientDTO]
+    specialist: Optional[ConsultantSummaryDTO]
+    client: Optional[ClientSummaryDTO]
     time_of_appointment: Optional[str] = None
     date_of_appointment: Optional[str] = None
     booking_id: Optional[int] = None
@@ -137,16 +146,6 @@ class ConsultationDTO(ConsultationBase):
         from_attributes = True
 
 
-class ConsultationRoSDTO(BaseModel):
-    id: Optional[int] = None
-    system: Optional[InternalSystems]
-    note: Optional[str] = ""
-    consultation_id: Optional[int] = None
-
-    class Config:
-        from_attributes = True
-
-
 class ConsultationDetailDTO(BaseModel):
     consultation: ConsultationDTO
     clinical_examination: Optional[ClinicalExaminationDTO] = None
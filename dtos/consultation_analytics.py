@@ -0,0 +1,41 @@
+from datetime import date
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class SymptomStatDTO(BaseModel):
+    symptom_id: int
+    symptom: Optional[str] = None
+    occurrences: int
+    by_severity: Dict[str, int] = {}
+
+
+class DiagnosisStatDTO(BaseModel):
+    head_code: Optional[str] = None
+    name: Optional[str] = None
+    consultations: int
+
+
+class SystemReviewStatDTO(BaseModel):
+    system: str
+    reviews: int
+
+
+class FollowUpStatDTO(BaseModel):
+    day: date
+    consultations: int
+    follow_ups: int
+    followed_up: int
+    follow_up_rate: float
+
+    class Config:
+        from_attributes = True
+
+
+class FollowUpReportDTO(BaseModel):
+    consultations: int = 0
+    follow_ups: int = 0
+    followed_up: int = 0
+    follow_up_rate: float = 0.0
+    data: List[FollowUpStatDTO] = []
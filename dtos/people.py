@@ -47,6 +47,17 @@ class PersonDTO(BaseModel):
     phone: str = Field(..., min_length=11, max_length=11, pattern=r"^\d{11}$")
 
 
+class ClientSummaryDTO(BaseModel):
+    id: int
+    first_name: Optional[str] = None
+    middle_name: Optional[str] = None
+    last_name: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    sex: Optional[Sex] = None
+    date_of_birth: Optional[date] = None
+
+
 class ClientDTO(PersonDTO):
     marital_status: MaritalStatus
     date_of_birth: date
@@ -19,11 +19,26 @@ class PrescriptionDetailDTO(BaseModel):
     form: Optional[Form]
     status: Optional[PrescriptionStatus] = None
     interval: Optional[str]
+    quantity: Optional[int] = None
+    quantity_dispensed: Optional[int] = None
 
     class Config:
         from_attributes=True
 
 
+class PrescriptionWarningDTO(BaseModel):
+    type: str
+    severity: Optional[str] = None
+    drug_id: int
+    other_drug_id: Optional[int] = None
+    message: str
+
+
+class PrescriptionCheckDTO(BaseModel):
+    client_id: Optional[int] = None
+    drug_ids: List[int]
+
+
 class PrescriptionDTO(BaseModel):
     id: Optional[int] = None
     status: Optional[PrescriptionStatus] = None
@@ -34,6 +49,7 @@ class PrescriptionDTO(BaseModel):
     instruction: Optional[str]
     consultant: Optional[ConsultantDTO] = None
     created_at: Optional[str] = None
+    warnings: Optional[List[PrescriptionWarningDTO]] = []
 
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,45 @@
+from datetime import date, datetime
+from typing import Optional, List
+
+from pydantic import BaseModel
+
+from models.pharmacy import Form
+
+
+class StockLotDTO(BaseModel):
+    id: Optional[int] = None
+    pharmacy_id: Optional[int] = None
+    drug_id: int
+    drug_form: Optional[Form] = None
+    package_id: Optional[int] = None
+    supply_detail_id: Optional[int] = None
+    manufacture_date: Optional[date] = None
+    expiry_date: Optional[date] = None
+    quantity_received: int
+    quantity_remaining: int
+    received_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class StockAllocationDTO(BaseModel):
+    id: Optional[int] = None
+    lot_id: int
+    prescription_detail_id: Optional[int] = None
+    quantity: int
+    expiry_date: Optional[date] = None
+
+    class Config:
+        from_attributes = True
+
+
+class DispenseItemDTO(BaseModel):
+    prescription_detail_id: int
+    package_id: Optional[int] = None
+    quantity: int
+
+
+class DispenseDTO(BaseModel):
+    items: List[DispenseItemDTO]
+    transaction_id: Optional[int] = None  # the sale the items are dispensed against, a new one when empty
@@ -1,3 +1,4 @@
+from datetime import date
 from typing import Optional, List
 
 from pydantic import BaseModel
@@ -27,3 +28,20 @@ class SupplyDTO(BaseModel):
     discount: float = 0.0
     payment: Optional[List[PaymentDTO]]
 
+
+
+class SupplyLineDTO(BaseModel):
+    """A delivered drug package, as read from a supply cart or a delivery note."""
+    drug_id: int
+    package_id: int
+    quantity: int
+    drug_form: Optional[Form] = None
+    buying_price: Optional[float] = None
+    manufacture_date: Optional[date] = None
+    expiry_date: Optional[date] = None
+
+
+class SupplyIntakeDTO(BaseModel):
+    supply_id: int
+    transaction_id: int
+    lines: int
@@ -3,7 +3,7 @@ from typing import Optional
 from pydantic import BaseModel
 from datetime import datetime, date
 
-from models.transaction import PaymentMethod
+from models.transaction import PaymentMethod, JournalEntryType
 
 
 class TransactionDTO(BaseModel):
@@ -30,10 +30,42 @@ class ReferredTransactionDTO(BaseModel):
     referral_id: int
 
 
+class ReferralSettlementRunDTO(BaseModel):
+    start_date: str
+    last_date: Optional[str] = ''
+    referral_id: Optional[int] = 0
+
+
 class TransactionPackageDTO(BaseModel):
     id: Optional[int] = None
     transaction_id: int
     package_id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class TransactionBalanceDTO(BaseModel):
+    transaction_id: int
+    total_billed: float = 0
+    discount: float = 0
+    bundle_discount: float = 0
+    total_paid: float = 0
+    outstanding: float = 0
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PaymentJournalDTO(BaseModel):
+    id: Optional[int] = None
+    payment_id: Optional[int] = None
+    transaction_id: int
+    user_id: Optional[int] = None
+    entry_type: JournalEntryType
+    amount: float
+    payment_method: Optional[PaymentMethod] = None
+    entry_time: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -1,14 +1,17 @@
+import asyncio
 import logging
 
 from fastapi import FastAPI, Request
 import uvicorn
 from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse
 
-from db import engine, Base
+from db import engine, Base, SessionLocal
 from routers import supply_router, service_router, transaction_router, consultation_router, security_router
+from routers import consultation_analytics_router
 from routers.client import organisation_router, client_router, referral_router
-from routers.client import vital_router, notification_router
+from routers.client import vital_router, notification_router, timeline_router
 from routers.lab import lab_router, queue_router, samples_router, result_router
 import bootstrap.db_data_init
 from fastapi.middleware.cors import CORSMiddleware
@@ -17,6 +20,9 @@ from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import ORJSONResponse
 import redis
 
+from repos.pharmacy.barcode_repository import BarcodeRepository
+from repos.client.icd10_repository import Icd10Repository
+from repos.consultation.analytics_repository import ConsultationAnalyticsRepository
 from routers.pharmacy.all_pharm_router import pharm_routers
 
 app = FastAPI(default_response_class=ORJSONResponse)
@@ -86,6 +92,8 @@ app.include_router(security_router.security_router)
 app.include_router(vital_router.vital_router)
 app.include_router(notification_router.notification_router)
 app.include_router(referral_router.referral_router)
+app.include_router(timeline_router.timeline_router)
+app.include_router(consultation_analytics_router.consultation_analytics_router)
 
 for route in pharm_routers:
     app.include_router(route, prefix='')
@@ -96,6 +104,53 @@ for route in pharm_routers:
 #     run_migrations()
 
 
+@app.on_event("startup")
+def warm_barcodes():
+    db = SessionLocal()
+    try:
+        logger.info(f"Loaded {BarcodeRepository(db).warm()} barcodes")
+    except Exception as e:
+        logger.error(f"Could not load barcodes: {e}")
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def warm_icd10():
+    db = SessionLocal()
+    try:
+        logger.info(f"Loaded {Icd10Repository(db).warm()} ICD-10 codes")
+    except Exception as e:
+        logger.error(f"Could not load ICD-10 codes: {e}")
+    finally:
+        db.close()
+
+
+ANALYTICS_REFRESH_SECONDS = 300
+
+
+def refresh_consultation_analytics():
+    db = SessionLocal()
+    try:
+        days = ConsultationAnalyticsRepository(db).refresh()
+        if days:
+            logger.info(f"Refreshed consultation analytics of {days} days")
+    except Exception as e:
+        logger.error(f"Could not refresh consultation analytics: {e}")
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+async def schedule_consultation_analytics():
+    async def run():
+        while True:
+            await run_in_threadpool(refresh_consultation_analytics)
+            await asyncio.sleep(ANALYTICS_REFRESH_SECONDS)
+
+    app.state.analytics_task = asyncio.create_task(run())
+
+
 # create tables
 def create_table():
     Base.metadata.create_all(bind=engine)
@@ -0,0 +1,36 @@
+"""add payment reconciliation indexes
+
+Revision ID: 5c2e8a1f7b34
+Revises: 41fc5aed1760
+Create Date: 2026-10-19 09:12:41.220193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e8a1f7b34'
+down_revision: Union[str, None] = '41fc5aed1760'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_payment_date_user_method', 'payment', ['payment_date', 'user_id', 'payment_method'])
+    op.create_index('ix_payment_transaction_id', 'payment', ['transaction_id'])
+    op.create_index('ix_transaction_transaction_date', 'transaction', ['transaction_date'])
+    op.create_index('ix_referred_transaction_settlement_created_at', 'referred_transaction_settlement',
+                    ['created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_referred_transaction_settlement_created_at', table_name='referred_transaction_settlement')
+    op.drop_index('ix_transaction_transaction_date', table_name='transaction')
+    op.drop_index('ix_payment_transaction_id', table_name='payment')
+    op.drop_index('ix_payment_date_user_method', table_name='payment')
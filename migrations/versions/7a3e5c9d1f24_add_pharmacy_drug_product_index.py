@@ -0,0 +1,30 @@
+"""add pharmacy drug product index
+
+Revision ID: 7a3e5c9d1f24
+Revises: e2b9f4a6c318
+Create Date: 2026-10-19 22:04:18.316527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3e5c9d1f24'
+down_revision: Union[str, None] = 'e2b9f4a6c318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # drug search joins the products matched by their trigram indexes back to their drugs
+    op.create_index('ix_pharmacy_drug_product_id', 'pharmacy_drug', ['product_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_pharmacy_drug_product_id', table_name='pharmacy_drug')
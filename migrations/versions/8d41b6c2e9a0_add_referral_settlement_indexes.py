@@ -0,0 +1,35 @@
+"""add referral settlement indexes
+
+Revision ID: 8d41b6c2e9a0
+Revises: 5c2e8a1f7b34
+Create Date: 2026-10-19 11:04:17.532810
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b6c2e9a0'
+down_revision: Union[str, None] = '5c2e8a1f7b34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_referred_transaction_status_referral', 'referred_transaction', ['status', 'referral_id'])
+    op.create_index('ix_referred_transaction_transaction_id', 'referred_transaction', ['transaction_id'])
+    op.create_index('ix_referred_transaction_settlement_detail_settlement_id', 'referred_transaction_settlement_detail',
+                    ['settlement_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_referred_transaction_settlement_detail_settlement_id',
+                  table_name='referred_transaction_settlement_detail')
+    op.drop_index('ix_referred_transaction_transaction_id', table_name='referred_transaction')
+    op.drop_index('ix_referred_transaction_status_referral', table_name='referred_transaction')
@@ -0,0 +1,41 @@
+"""add consultation queue slot index
+
+Revision ID: a5d2f8c1e437
+Revises: f3b8d0e6a215
+Create Date: 2026-10-19 16:32:08.114275
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5d2f8c1e437'
+down_revision: Union[str, None] = 'f3b8d0e6a215'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = "deleted_at IS NULL AND status <> 'Cancelled'"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # double bookings have to be resolved by the front desk, they are not cancelled here
+    duplicates = op.get_bind().execute(sa.text(
+        f"SELECT count(*) FROM (SELECT 1 FROM consultation_queue WHERE {ACTIVE} "
+        f"AND consultation_time IS NOT NULL "
+        f"GROUP BY schedule_id, consultation_time HAVING count(*) > 1) AS d"
+    )).scalar()
+    if duplicates:
+        raise RuntimeError(f"{duplicates} consultation slots are booked more than once, "
+                           f"cancel the extra bookings before upgrading")
+    op.create_index('ux_consultation_queue_slot', 'consultation_queue', ['schedule_id', 'consultation_time'],
+                    unique=True, postgresql_where=sa.text(ACTIVE))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_consultation_queue_slot', table_name='consultation_queue')
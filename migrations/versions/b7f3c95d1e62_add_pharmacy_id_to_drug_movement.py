@@ -0,0 +1,37 @@
+"""add pharmacy id to drug movement
+
+Revision ID: b7f3c95d1e62
+Revises: 8d41b6c2e9a0
+Create Date: 2026-10-19 12:21:05.184733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7f3c95d1e62'
+down_revision: Union[str, None] = '8d41b6c2e9a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('pharmacy_drug_movement', sa.Column('pharmacy_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('pharmacy_drug_movement_pharmacy_id_fkey', 'pharmacy_drug_movement', 'pharmacy',
+                          ['pharmacy_id'], ['id'], ondelete='cascade')
+    # movements so far were only written by supplies, which carry the pharmacy
+    op.execute(
+        "UPDATE pharmacy_drug_movement AS m SET pharmacy_id = s.pharmacy_id "
+        "FROM supply AS s WHERE s.transaction_id = m.transaction_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('pharmacy_drug_movement_pharmacy_id_fkey', 'pharmacy_drug_movement', type_='foreignkey')
+    op.drop_column('pharmacy_drug_movement', 'pharmacy_id')
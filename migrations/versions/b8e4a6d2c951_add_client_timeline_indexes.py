@@ -0,0 +1,43 @@
+"""add client timeline indexes
+
+Revision ID: b8e4a6d2c951
+Revises: a5d2f8c1e437
+Create Date: 2026-10-19 18:05:41.530817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e4a6d2c951'
+down_revision: Union[str, None] = 'a5d2f8c1e437'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_client_vital_timeline', 'client_vital', ['client_id', 'created_at'],
+                    postgresql_include=['vital_type', 'vital_value'])
+    op.create_index('ix_pharmacy_prescription_timeline', 'pharmacy_prescription', ['client_id', 'created_at'])
+    op.create_index('ix_client_service_cart_timeline', 'client_service_cart', ['client_id', 'created_at'])
+    op.create_index('ix_service_booking_client', 'service_booking', ['client_id', 'id'])
+    op.create_index('ix_consultation_queue_booking', 'consultation_queue', ['booking_id'])
+    op.create_index('ix_consultations_queue', 'consultations', ['queue_id'])
+    op.create_index('ix_approved_lab_booking_result_booking', 'approved_lab_booking_result',
+                    ['booking_id', 'approved_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_approved_lab_booking_result_booking', table_name='approved_lab_booking_result')
+    op.drop_index('ix_consultations_queue', table_name='consultations')
+    op.drop_index('ix_consultation_queue_booking', table_name='consultation_queue')
+    op.drop_index('ix_service_booking_client', table_name='service_booking')
+    op.drop_index('ix_client_service_cart_timeline', table_name='client_service_cart')
+    op.drop_index('ix_pharmacy_prescription_timeline', table_name='pharmacy_prescription')
+    op.drop_index('ix_client_vital_timeline', table_name='client_vital')
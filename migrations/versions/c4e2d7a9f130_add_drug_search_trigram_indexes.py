@@ -0,0 +1,42 @@
+"""add drug search trigram indexes
+
+Revision ID: c4e2d7a9f130
+Revises: b7f3c95d1e62
+Create Date: 2026-10-19 13:02:41.907215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e2d7a9f130'
+down_revision: Union[str, None] = 'b7f3c95d1e62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_INDEXES = [
+    ('ix_product_brand_name_trgm', 'product', 'brand_name'),
+    ('ix_product_product_name_trgm', 'product', 'product_name'),
+    ('ix_product_product_desc_trgm', 'product', 'product_desc'),
+    ('ix_product_manufacturer_trgm', 'product', 'manufacturer'),
+    ('ix_pharmacy_drug_active_ingredients_trgm', 'pharmacy_drug', 'active_ingredients'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # GIN trigram indexes serve both ILIKE '%term%' and the word similarity (<%) operator
+    for name, table, column in SEARCH_INDEXES:
+        op.create_index(name, table, [column], postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, column in reversed(SEARCH_INDEXES):
+        op.drop_index(name, table_name=table)
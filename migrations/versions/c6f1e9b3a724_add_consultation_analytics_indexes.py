@@ -0,0 +1,42 @@
+"""add consultation analytics indexes
+
+Revision ID: c6f1e9b3a724
+Revises: b8e4a6d2c951
+Create Date: 2026-10-19 19:12:08.204113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6f1e9b3a724'
+down_revision: Union[str, None] = 'b8e4a6d2c951'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_consultations_created_at', 'consultations', ['created_at'])
+    op.create_index('ix_consultation_clinical_examination_consultation', 'consultation_clinical_examination',
+                    ['consultation_id'])
+    op.create_index('ix_consultation_presenting_symptoms_examination', 'consultation_presenting_symptoms',
+                    ['clinical_examination_id'])
+    op.create_index('ix_consultation_review_of_system_consultation', 'consultation_review_of_system',
+                    ['consultation_id'])
+    op.create_index('ix_consultation_hierarchy_base', 'consultation_hierarchy', ['base_consultation_id'])
+    op.create_index('ix_consultation_hierarchy_follow_up', 'consultation_hierarchy', ['follow_up_consultation_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_consultation_hierarchy_follow_up', table_name='consultation_hierarchy')
+    op.drop_index('ix_consultation_hierarchy_base', table_name='consultation_hierarchy')
+    op.drop_index('ix_consultation_review_of_system_consultation', table_name='consultation_review_of_system')
+    op.drop_index('ix_consultation_presenting_symptoms_examination', table_name='consultation_presenting_symptoms')
+    op.drop_index('ix_consultation_clinical_examination_consultation', table_name='consultation_clinical_examination')
+    op.drop_index('ix_consultations_created_at', table_name='consultations')
@@ -0,0 +1,38 @@
+"""add prescription detail quantities
+
+Revision ID: d4a7c2e8f153
+Revises: c6f1e9b3a724
+Create Date: 2026-10-19 21:04:37.516208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a7c2e8f153'
+down_revision: Union[str, None] = 'c6f1e9b3a724'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('pharmacy_prescription_detail', sa.Column('quantity', sa.Integer(), nullable=True))
+    op.add_column('pharmacy_prescription_detail',
+                  sa.Column('quantity_dispensed', sa.Integer(), nullable=False, server_default='0'))
+    # what has been dispensed so far is recorded in the stock allocations of each item
+    op.execute(
+        "UPDATE pharmacy_prescription_detail AS d SET quantity_dispensed = a.quantity "
+        "FROM (SELECT prescription_detail_id, SUM(quantity) AS quantity FROM pharmacy_stock_allocation "
+        "GROUP BY prescription_detail_id) AS a WHERE a.prescription_detail_id = d.id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('pharmacy_prescription_detail', 'quantity_dispensed')
+    op.drop_column('pharmacy_prescription_detail', 'quantity')
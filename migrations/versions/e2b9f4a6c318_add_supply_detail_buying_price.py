@@ -0,0 +1,29 @@
+"""add supply detail buying price
+
+Revision ID: e2b9f4a6c318
+Revises: d4a7c2e8f153
+Create Date: 2026-10-19 21:26:52.907114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b9f4a6c318'
+down_revision: Union[str, None] = 'd4a7c2e8f153'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('supply_detail', sa.Column('buying_price', sa.Double(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('supply_detail', 'buying_price')
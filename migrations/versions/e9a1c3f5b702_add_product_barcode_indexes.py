@@ -0,0 +1,36 @@
+"""add product barcode indexes
+
+Revision ID: e9a1c3f5b702
+Revises: c4e2d7a9f130
+Create Date: 2026-10-19 13:41:09.316540
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9a1c3f5b702'
+down_revision: Union[str, None] = 'c4e2d7a9f130'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # a barcode must resolve to one package, keep the first registration of any duplicate
+    op.execute(
+        "DELETE FROM product_barcode AS a USING product_barcode AS b "
+        "WHERE a.barcode = b.barcode AND a.id > b.id"
+    )
+    op.create_index('ix_product_barcode_barcode', 'product_barcode', ['barcode'], unique=True)
+    op.create_index('ix_product_barcode_packaging_id', 'product_barcode', ['product_packaging_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_barcode_packaging_id', table_name='product_barcode')
+    op.drop_index('ix_product_barcode_barcode', table_name='product_barcode')
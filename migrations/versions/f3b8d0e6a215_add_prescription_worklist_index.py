@@ -0,0 +1,30 @@
+"""add prescription worklist index
+
+Revision ID: f3b8d0e6a215
+Revises: e9a1c3f5b702
+Create Date: 2026-10-19 14:10:52.608113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d0e6a215'
+down_revision: Union[str, None] = 'e9a1c3f5b702'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_pharmacy_prescription_worklist', 'pharmacy_prescription',
+                    ['pharmacy_id', 'status', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_pharmacy_prescription_worklist', table_name='pharmacy_prescription')
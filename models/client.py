@@ -274,6 +274,11 @@ class Vitals(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     client_id = Column(Integer, ForeignKey("client.id", ondelete="cascade"))
 
+    __table_args__ = (
+        Index('ix_client_vital_timeline', 'client_id', 'created_at',
+              postgresql_include=['vital_type', 'vital_value']),
+    )
+
 
 class PrivacyType(str, Enum):
     Complete = 'Complete_Anonymity'
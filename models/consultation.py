@@ -2,7 +2,7 @@ import datetime
 from typing import Optional
 
 from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Date, Enum as SqlEnum, Text, BLOB, \
-    BIGINT, Index, Double
+    BIGINT, Index, Double, text
 from sqlalchemy.orm import relationship, aliased
 from db import Base
 from enum import Enum
@@ -110,6 +110,10 @@ class ConsultationQueue(Base, SoftDeleteMixin):
 
     # Index for faster queries
     Index('ix_schedule_status', schedule_id, status)
+    Index('ix_consultation_queue_booking', booking_id)
+    # One active booking per appointment slot
+    Index('ux_consultation_queue_slot', schedule_id, consultation_time, unique=True,
+          postgresql_where=text("deleted_at IS NULL AND status <> 'Cancelled'"))
 
 
 class ConsultationType(str, Enum):
@@ -137,6 +141,9 @@ class Consultations(Base, SoftDeleteMixin):
     preliminary_diagnosis = Column(String(250), nullable=True)
     case_status = Column(SqlEnum(CaseStatus), default=CaseStatus.Open)
 
+    Index('ix_consultations_queue', queue_id)
+    Index('ix_consultations_created_at', created_at)
+
     queue = relationship("ConsultationQueue", back_populates="consultations", passive_deletes=True)
     creator = relationship("Specialist", back_populates="consultant", passive_deletes=True)
 
@@ -156,6 +163,8 @@ class ConsultationClinicalExamination(Base, SoftDeleteMixin):
     consultation_id = Column(Integer, ForeignKey("consultations.id", ondelete="cascade"))
     clinical_examination_id = Column(Integer, ForeignKey("clinical_examination.id", ondelete="cascade"))
 
+    Index('ix_consultation_clinical_examination_consultation', consultation_id)
+
     consultation = relationship(
         "Consultations",
         back_populates="consultation_clinical_examinations",
@@ -185,6 +194,9 @@ class ConsultationHierarchy(Base):
     base_consultation_id = Column(Integer, ForeignKey("consultations.id", ondelete="cascade"))
     follow_up_consultation_id = Column(Integer, ForeignKey("consultations.id", ondelete="cascade"))
 
+    Index('ix_consultation_hierarchy_base', base_consultation_id)
+    Index('ix_consultation_hierarchy_follow_up', follow_up_consultation_id)
+
 
 class InternalSystems(str, Enum):
     respiratory = 'respiratory'
@@ -208,6 +220,8 @@ class ConsultationRoS(Base, SoftDeleteMixin):
     system = Column(SqlEnum(InternalSystems))
     note = Column(Text, nullable=True)
 
+    Index('ix_consultation_review_of_system_consultation', consultation_id)
+
     consultation = relationship("Consultations", back_populates="review_of_systems", lazy='select')
 
 
@@ -247,6 +261,7 @@ class PresentingSymptom(Base, SoftDeleteMixin):
     clinical_examination = relationship("ClinicalExamination", back_populates="symptoms", lazy='select')
 
     # Index('ix_symptom_frequency', symptom_id, frequency)
+    Index('ix_consultation_presenting_symptoms_examination', clinical_examination_id)
 
 
 class ClinicalExamination(Base, SoftDeleteMixin):
@@ -269,3 +284,68 @@ class ClinicalExamination(Base, SoftDeleteMixin):
     symptoms = relationship("PresentingSymptom", back_populates="clinical_examination", lazy='select')
     # Index('ix_transaction_id', transaction_id)
     Index('ix_exam_conducted_by', conducted_by)
+
+
+class ConsultationAnalyticsMark(Base):
+    """
+    A day whose consultation aggregates are out of date. Written in the same transaction as the
+    consultation change; ConsultationAnalyticsRepository.refresh recomputes the marked days and
+    deletes the marks it has seen. Append only, so concurrent writers never conflict.
+    """
+    __tablename__ = "consultation_analytics_mark"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    marked_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class ConsultationSymptomDaily(Base):
+    """Presenting symptoms per consultation day, symptom and severity."""
+    __tablename__ = "consultation_symptom_daily"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    symptom_id = Column(Integer, ForeignKey("symptom.id", ondelete="cascade"), nullable=False)
+    severity = Column(SqlEnum(Severity), nullable=True)
+    occurrences = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ux_consultation_symptom_daily', 'day', 'symptom_id', 'severity', unique=True),
+    )
+
+
+class ConsultationSystemDaily(Base):
+    """Review of systems entries per consultation day and system."""
+    __tablename__ = "consultation_system_daily"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    system = Column(SqlEnum(InternalSystems), nullable=False)
+    reviews = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ux_consultation_system_daily', 'day', 'system', unique=True),
+    )
+
+
+class ConsultationDiagnosisDaily(Base):
+    """Consultations per day and ICD-10 head code of their preliminary diagnosis; no code when it is not coded."""
+    __tablename__ = "consultation_diagnosis_daily"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    head_code = Column(String(10), nullable=True)
+    consultations = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ux_consultation_diagnosis_daily', 'day', 'head_code', unique=True),
+    )
+
+
+class ConsultationFollowUpDaily(Base):
+    """
+    Consultations per day, how many of them were follow-ups of an earlier case, and how many have
+    been followed up since.
+    """
+    __tablename__ = "consultation_follow_up_daily"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, unique=True)
+    consultations = Column(Integer, nullable=False, default=0)
+    follow_ups = Column(Integer, nullable=False, default=0)
+    followed_up = Column(Integer, nullable=False, default=0)
@@ -2,7 +2,7 @@
 import datetime
 
 from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Enum as SqlEnum, Text, \
-    UniqueConstraint
+    UniqueConstraint, Index
 
 from db import Base
 from enum import Enum
@@ -271,5 +271,9 @@ class ApprovedLabBookingResult(Base):
     comment = Column(Text)
     status = Column(SqlEnum(ResultStatus))
 
+    __table_args__ = (
+        Index('ix_approved_lab_booking_result_booking', 'booking_id', 'approved_at'),
+    )
+
     class Config:
         orm_mode = True
@@ -11,7 +11,7 @@ from sqlalchemy import (
     String,
     Date,
     Enum as SqlEnum,
-    Double, Text, Index, DateTime, BIGINT,
+    Double, Text, Index, DateTime, BIGINT, text,
 )
 from sqlalchemy.orm import relationship, backref, Mapped, mapped_column
 from db import Base
@@ -108,7 +108,7 @@ class DrugGroupTag(Base, SoftDeleteMixin):
 class Drug(Base, SoftDeleteMixin):
     __tablename__ = "pharmacy_drug"
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("product.id", ondelete="cascade"))
+    product_id = Column(Integer, ForeignKey("product.id", ondelete="cascade"), index=True)
 
     active_ingredients = Column(Text)  # Active ingredients in the drug
     storage_conditions = Column(String(255))  # Storage conditions
@@ -136,6 +136,76 @@ class PharmacyDrugMovement(Base):
     quantity = Column(Integer)
     moved_at = Column(DateTime, default=datetime.utcnow)
     transaction_id = Column(BIGINT, ForeignKey("transaction.id", ondelete="cascade"))
+    pharmacy_id = Column(Integer, ForeignKey("pharmacy.id", ondelete="cascade"), nullable=True)
+
+
+class PharmacyStock(Base):
+    """
+    Stock on hand per pharmacy, drug, form and package: the running SUM of pharmacy_drug_movement.
+
+    Written in the same transaction as every movement (see StockRepository.record_movement) and
+    rebuilt from the movement history with StockRepository.rebuild. pharmacy_id, drug_form and
+    package_id may be NULL, which a unique index over them would not compare, so the key is also
+    kept as one non-null string for the upsert to conflict on.
+    """
+    __tablename__ = "pharmacy_stock"
+    id = Column(Integer, primary_key=True, index=True)
+    stock_key = Column(String(64), nullable=False)  # "pharmacy:drug:form:package", '' for NULL
+    pharmacy_id = Column(Integer, ForeignKey("pharmacy.id", ondelete="cascade"), nullable=True)
+    drug_id = Column(Integer, ForeignKey("pharmacy_drug.id", ondelete="cascade"), nullable=False)
+    drug_form = Column(SqlEnum(Form), nullable=True)
+    package_id = Column(Integer, ForeignKey("product_package.id", ondelete="cascade"), nullable=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_pharmacy_stock_key', 'stock_key', unique=True),
+        Index('ix_pharmacy_stock_drug', 'drug_id', 'package_id'),
+    )
+
+
+class PharmacyStockLot(Base):
+    """
+    A received batch of a drug package in a pharmacy, with what is left of it.
+
+    Dispensing draws from lots first-expiry-first-out. Lots with nothing remaining are kept for
+    traceability but fall out of the partial indexes, which only cover available stock.
+    pharmacy_id and package_id may be NULL, which an index lookup cannot match with =, so the
+    indexes are on pharmacy_key and package_key instead: the id, or 0 when there is none.
+    """
+    __tablename__ = "pharmacy_stock_lot"
+    id = Column(Integer, primary_key=True, index=True)
+    pharmacy_key = Column(Integer, nullable=False, default=0)
+    package_key = Column(Integer, nullable=False, default=0)
+    pharmacy_id = Column(Integer, ForeignKey("pharmacy.id", ondelete="cascade"), nullable=True)
+    drug_id = Column(Integer, ForeignKey("pharmacy_drug.id", ondelete="cascade"), nullable=False)
+    drug_form = Column(SqlEnum(Form), nullable=True)
+    package_id = Column(Integer, ForeignKey("product_package.id", ondelete="cascade"), nullable=True)
+    supply_detail_id = Column(Integer, ForeignKey("supply_detail.id", ondelete="set null"), nullable=True)
+    manufacture_date = Column(Date, nullable=True)
+    expiry_date = Column(Date, nullable=True)
+    quantity_received = Column(Integer, nullable=False)
+    quantity_remaining = Column(Integer, nullable=False)
+    received_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_pharmacy_stock_lot_fefo', 'pharmacy_key', 'drug_id', 'package_key', 'expiry_date',
+              postgresql_where=text('quantity_remaining > 0'), sqlite_where=text('quantity_remaining > 0')),
+        Index('ix_pharmacy_stock_lot_expiry', 'expiry_date', 'pharmacy_id',
+              postgresql_where=text('quantity_remaining > 0'), sqlite_where=text('quantity_remaining > 0')),
+        Index('ix_pharmacy_stock_lot_key', 'pharmacy_key', 'drug_id', 'package_key'),
+    )
+
+
+class PharmacyStockAllocation(Base):
+    __tablename__ = "pharmacy_stock_allocation"
+    id = Column(Integer, primary_key=True, index=True)
+    lot_id = Column(Integer, ForeignKey("pharmacy_stock_lot.id", ondelete="cascade"), index=True)
+    prescription_detail_id = Column(Integer, ForeignKey("pharmacy_prescription_detail.id", ondelete="cascade"),
+                                    nullable=True, index=True)
+    quantity = Column(Integer, nullable=False)
+    allocated_by = Column(Integer, ForeignKey("users.id", ondelete="set null"), nullable=True)
+    allocated_at = Column(DateTime, default=datetime.utcnow)
 
 
 class DrugForm(Base, SoftDeleteMixin):
@@ -182,6 +252,31 @@ class Prescription(Base, SoftDeleteMixin):
     client = relationship("Client")
     consultant = relationship("Specialist")
 
+    __table_args__ = (
+        Index('ix_pharmacy_prescription_worklist', 'pharmacy_id', 'status', 'created_at', 'id'),
+        Index('ix_pharmacy_prescription_timeline', 'client_id', 'created_at'),
+    )
+
+
+class PrescriptionStatusCount(Base):
+    """
+    Number of prescriptions per pharmacy and status, kept in step with every status change.
+
+    pharmacy_id may be NULL, which a unique index would not compare, so the upsert conflicts on
+    pharmacy_key instead: the pharmacy id, or 0 for prescriptions without a pharmacy.
+    """
+    __tablename__ = "pharmacy_prescription_status_count"
+    id = Column(Integer, primary_key=True, index=True)
+    pharmacy_key = Column(Integer, nullable=False, default=0)
+    pharmacy_id = Column(Integer, ForeignKey("pharmacy.id", ondelete="cascade"), nullable=True)
+    status = Column(SqlEnum(PrescriptionStatus), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_pharmacy_prescription_status_count_key', 'pharmacy_key', 'status', unique=True),
+    )
+
 
 class PrescriptionDetail(Base, SoftDeleteMixin):
     __tablename__ = "pharmacy_prescription_detail"
@@ -196,3 +291,5 @@ class PrescriptionDetail(Base, SoftDeleteMixin):
     duration = Column(String(20))
     status = Column(SqlEnum(PrescriptionStatus), default=PrescriptionStatus.Pending)
     is_prn = Column(Boolean, default=False)
+    quantity = Column(Integer, nullable=True)  # units prescribed, NULL when the prescriber did not say
+    quantity_dispensed = Column(Integer, nullable=False, default=0, server_default='0')
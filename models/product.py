@@ -65,3 +65,8 @@ class Barcode(Base, SoftDeleteMixin):
     product_packaging_id = Column(Integer, ForeignKey("pharmacy_drug_form_package.id", ondelete="cascade" ))  # FIXED
 
     pharmacy_drug_form_package = relationship("PharmDrugFormPackage", back_populates="product_barcode")
+
+    __table_args__ = (
+        Index('ix_product_barcode_barcode', 'barcode', unique=True),
+        Index('ix_product_barcode_packaging_id', 'product_packaging_id'),
+    )
@@ -1,5 +1,5 @@
 import datetime
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Enum as SqlEnum, BIGINT, Text
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Enum as SqlEnum, BIGINT, Text, Index
 from sqlalchemy.orm import relationship
 from db import Base
 from models.consultation import SoftDeleteMixin
@@ -34,6 +34,10 @@ class ClientServiceCart(Base):
         cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        Index('ix_client_service_cart_timeline', 'client_id', 'created_at'),
+    )
+
 
 class ClientServiceCartPackage(Base, SoftDeleteMixin):
     __tablename__ = "client_service_cart_package"
@@ -1,7 +1,7 @@
 import datetime
 
 from sqlalchemy import Boolean, Column, ForeignKey, Integer, Double, String, DateTime, Date, Enum as SqlEnum, Text, \
-    BLOB, BIGINT
+    BLOB, BIGINT, Index
 
 from db import Base
 from enum import Enum
@@ -67,6 +67,10 @@ class ServiceBooking(Base):
     booking_status = Column(SqlEnum(BookingStatus), default=BookingStatus.Processing)
     # booking_type = Column(SqlEnum(BookingType), default=BookingType.Laboratory)
 
+    __table_args__ = (
+        Index('ix_service_booking_client', 'client_id', 'id'),
+    )
+
 
 class ServiceBookingDetail(Base):
     __tablename__ = "service_booking_detail"
@@ -32,6 +32,7 @@ class SupplyDetail(Base, SoftDeleteMixin):
     manufacture_date = Column(Date)
     expiry_date = Column(Date)
     quantity = Column(Double)
+    buying_price = Column(Double, nullable=True)  # per package, as invoiced by the supplier
     supply_id = Column(Integer, ForeignKey("supply.id", ondelete="cascade"))  # FIXED
     product_packaging_id = Column(Integer, ForeignKey("product_package.id", ondelete="cascade"))  # FIXED
 
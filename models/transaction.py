@@ -2,7 +2,7 @@ from enum import Enum
 
 from sqlalchemy import Column, Enum as SqlEnum, ForeignKey, Double, Integer, String, DateTime, Date, \
     Enum as SqlEnum, Text, \
-    BLOB, Float, BIGINT
+    BLOB, Float, BIGINT, Index
 from sqlalchemy.orm import relationship
 from models.mixins import SoftDeleteMixin
 
@@ -30,7 +30,7 @@ class Transaction(Base, SoftDeleteMixin):
 
     id = Column(BIGINT, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="cascade"))
-    transaction_date = Column(Date, default=datetime.date.today())
+    transaction_date = Column(Date, default=datetime.date.today, index=True)
     transaction_time = Column(DateTime, default=datetime.datetime.utcnow)
     discount = Column(Float)  # float is recommended against double
     transaction_status = Column(SqlEnum(TransactionType), default=TransactionType.Open)
@@ -55,12 +55,17 @@ class Payments(Base, SoftDeleteMixin):
     __tablename__ = "payment"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="cascade"))
-    payment_date = Column(Date, default=datetime.date.today())
+    payment_date = Column(Date, default=datetime.date.today)
     payment_time = Column(DateTime, default=datetime.datetime.utcnow)
     amount = Column(Float)
     transaction_id = Column(BIGINT, ForeignKey("transaction.id", ondelete="cascade"))
     payment_method = Column(SqlEnum(PaymentMethod), default=PaymentMethod.Cash)
 
+    __table_args__ = (
+        Index('ix_payment_date_user_method', 'payment_date', 'user_id', 'payment_method'),
+        Index('ix_payment_transaction_id', 'transaction_id'),
+    )
+
 
 class PackageTransaction(Base, SoftDeleteMixin):
     __tablename__ = "package_transaction"
@@ -77,18 +82,67 @@ class ReferredTransaction(Base, SoftDeleteMixin):
                                          ))  # A client may have been referred multiple times by different refferals
     status = Column(SqlEnum(ReferredTransactionStatus), default=ReferredTransactionStatus.UnSettled)
 
+    __table_args__ = (
+        Index('ix_referred_transaction_status_referral', 'status', 'referral_id'),
+        Index('ix_referred_transaction_transaction_id', 'transaction_id'),
+    )
+
 
 class ReferredTransactionSettlement(Base, SoftDeleteMixin):
     __tablename__ = "referred_transaction_settlement"
     id = Column(Integer, primary_key=True, index=True)
     created_for = Column(Integer, ForeignKey("client_referral.id", ondelete="cascade"
                                          ))  # A client may have been referred multiple times by different refferals
-    created_at = Column(Date, default=datetime.date.today())
+    created_at = Column(Date, default=datetime.date.today, index=True)
     created_by = Column(Integer, ForeignKey("users.id", ondelete="cascade"))
 
 
 class ReferredTransactionSettlementDetail(Base, SoftDeleteMixin):
     __tablename__ = "referred_transaction_settlement_detail"
     id = Column(Integer, primary_key=True, index=True)
-    settlement_id = Column(Integer, ForeignKey("referred_transaction_settlement.id", ondelete="cascade"))
-    ref_transaction_id = Column(Integer, ForeignKey("referred_transaction.id", ondelete="cascade"))
\ No newline at end of file
+    settlement_id = Column(Integer, ForeignKey("referred_transaction_settlement.id", ondelete="cascade"), index=True)
+    ref_transaction_id = Column(Integer, ForeignKey("referred_transaction.id", ondelete="cascade"))
+
+class JournalEntryType(str, Enum):
+    Payment = 'Payment'
+    Reversal = 'Reversal'  # Negates an earlier entry when a payment is edited or removed
+
+
+class PaymentJournal(Base):
+    """Append-only record of every movement of money against a transaction."""
+    __tablename__ = "payment_journal"
+    id = Column(Integer, primary_key=True, index=True)
+    payment_id = Column(Integer, ForeignKey("payment.id", ondelete="SET NULL"), nullable=True)
+    transaction_id = Column(BIGINT, ForeignKey("transaction.id", ondelete="cascade"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="cascade"))
+    entry_type = Column(SqlEnum(JournalEntryType), default=JournalEntryType.Payment)
+    amount = Column(Float)  # signed, reversals are negative
+    payment_method = Column(SqlEnum(PaymentMethod))
+    entry_time = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_payment_journal_transaction_time', 'transaction_id', 'entry_time'),
+    )
+
+
+class TransactionBalance(Base):
+    """
+    Running balance snapshot of a transaction, maintained alongside the payment journal.
+
+    Rewritten on every payment and whenever the bill changes: bookings added or removed, a bundle
+    bought or the transaction discount edited (see LedgerRepository.refresh_balance).
+    """
+    __tablename__ = "transaction_balance"
+    transaction_id = Column(BIGINT, ForeignKey("transaction.id", ondelete="cascade"), primary_key=True)
+    client_id = Column(Integer, ForeignKey("client.id", ondelete="set null"), nullable=True)
+    total_billed = Column(Float, default=0)
+    discount = Column(Float, default=0)
+    bundle_discount = Column(Float, default=0)
+    total_paid = Column(Float, default=0)
+    outstanding = Column(Float, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_transaction_balance_outstanding', 'outstanding'),
+        Index('ix_transaction_balance_client', 'client_id', 'outstanding'),
+    )
@@ -1,18 +1,85 @@
 # repositories/base.py
 
-from sqlalchemy.orm import Session
+from typing import Iterator, List
 
+from sqlalchemy.orm import Session, Query
+
+# rows fetched per round trip when a query is streamed
+STREAM_BATCH_SIZE = 500
+
+
+def stream(query: Query, batch_size: int = STREAM_BATCH_SIZE) -> Iterator:
+    """
+    Iterate a query through a server-side (named) cursor, fetching batch_size rows at a time.
+
+    Peak memory is bounded by the batch size instead of the size of the result. Eager loading of
+    collections is not compatible with this mode; use selectinload or load them per batch instead.
+    """
+    yield from query.execution_options(stream_results=True, max_row_buffer=batch_size).yield_per(batch_size)
+
+
+class UnitOfWork:
+    """
+    Commit once at the boundary of a block of repository writes.
+
+        with UnitOfWork(db):
+            repo.add(a)
+            repo.add_all([b, c])
+
+    Inside the block BaseRepository writes on the same session only flush, so generated ids are
+    available but nothing is committed. The block commits on exit, or rolls back if it raises.
+    Blocks can be nested; only the outermost one commits.
+    """
 
-class BaseRepository:
     def __init__(self, db: Session):
         self.db = db
 
+    def __enter__(self):
+        self.db.info['unit_of_work'] = self.db.info.get('unit_of_work', 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        depth = self.db.info['unit_of_work'] - 1
+        self.db.info['unit_of_work'] = depth
+        if depth == 0:
+            if exc_type is None:
+                self.db.commit()
+            else:
+                self.db.rollback()
+        return False
+
+
+def in_unit_of_work(db: Session) -> bool:
+    return db.info.get('unit_of_work', 0) > 0
+
+
+class BaseRepository:
+    def __init__(self, db: Session, autocommit: bool = True):
+        """With autocommit=False writes only flush and the caller commits, see UnitOfWork."""
+        self.db = db
+        self.autocommit = autocommit
+
+    def _commits(self) -> bool:
+        return self.autocommit and not in_unit_of_work(self.db)
+
     def add(self, obj):
         self.db.add(obj)
-        self.db.commit()
-        self.db.refresh(obj)
+        if self._commits():
+            self.db.commit()
+            self.db.refresh(obj)
+        else:
+            self.db.flush()
         return obj
 
+    def add_all(self, objs: List):
+        """Add many objects with one flush (and one commit outside a unit of work)."""
+        self.db.add_all(objs)
+        if self._commits():
+            self.db.commit()
+        else:
+            self.db.flush()
+        return objs
+
     def get(self, model, obj_id):
         return self.db.query(model).filter(model.id == obj_id).first()
 
@@ -21,7 +88,13 @@ class BaseRepository:
 
     def delete(self, obj):
         self.db.delete(obj)
-        self.db.commit()
+        if self._commits():
+            self.db.commit()
+        else:
+            self.db.flush()
 
     def update(self):
-        self.db.commit()
+        if self._commits():
+            self.db.commit()
+        else:
+            self.db.flush()
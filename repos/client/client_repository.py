@@ -13,11 +13,13 @@ import logging
 from datetime import datetime
 
 from repos.auth_repository import UserRepository
+from repos.base_repository import stream
 from repos.client.drug_allergy_repository import DrugAllergyRepository
 from repos.client.food_allergy_repository import FoodAllergyRepository
 from repos.client.life_style_repository import ClientLifestyleRepository
 from repos.client.notification_repository import NotificationRepository
 from repos.client.vital_rpository import VitalsRepository
+from repos.consultation.queue_detail_cache import invalidate_client_queue_details
 
 logger = logging.getLogger(__name__)
 
@@ -158,6 +160,7 @@ class ClientRepository:
             # Commit once for atomic update
             self.session.commit()
             self.session.refresh(client)
+            invalidate_client_queue_details(client_id)
 
             return client
 
@@ -336,6 +339,39 @@ class ClientRepository:
     #         logger.error("Error retrieving clients: %s", e, exc_info=True)
     #         raise
 
+    def export_clients(self, keyword: str = '', batch_size: int = 1000):
+        """Yields every client matching the keyword for export, read through a server-side cursor."""
+        cols = [
+            Client.id,
+            Person.first_name,
+            Person.middle_name,
+            Person.last_name,
+            Person.sex,
+            Client.date_of_birth,
+            Client.marital_status,
+            Client.blood_group,
+            Person.phone,
+            Person.email,
+            Client.address,
+            Occupation.occupation,
+            Person.enrollment_date
+        ]
+        query = self.session.query(*cols) \
+            .join(Person, Person.id == Client.person_id) \
+            .outerjoin(Occupation, Client.occupation_id == Occupation.id)
+
+        if len(keyword) > 3:
+            query = query.filter(
+                or_(Person.first_name.ilike(f"%{keyword}%"),
+                    Person.last_name.ilike(f"%{keyword}%"),
+                    Person.phone.ilike(f"%{keyword}%"),
+                    cast(Client.date_of_birth, String).ilike(f"%{keyword}%")
+                    )
+            )
+
+        for row in stream(query.order_by(Client.id), batch_size):
+            yield tuple(row)
+
     def get_client_count(self, keyword: str = ''):
         if keyword:
             search = f"%{keyword}%"
@@ -354,6 +390,19 @@ class ClientRepository:
 
     def get_client(self, client_id: int):
         # print('client id', client_id)
+        client = self.get_clients([client_id]).get(client_id)
+        if client is None:
+            raise ValueError(f"Client with ID {client_id} not found.")
+        return client
+
+    def get_clients(self, client_ids) -> Dict[int, dict]:
+        """
+        Full profiles of several clients keyed by id. Each part of the profile is loaded with one
+        query for all the clients.
+        """
+        client_ids = [client_id for client_id in set(client_ids) if client_id]
+        if not client_ids:
+            return {}
 
         drug_allergy_repository = DrugAllergyRepository(self.session)
         food_allergy_repository = FoodAllergyRepository(self.session)
@@ -374,42 +423,65 @@ class ClientRepository:
             Person.enrollment_date,
             # Client.marital_status,
             Lga.lga,
-            Lga.state_id,
+            State.id.label("state_id"),
+            State.state,
             Lga.id.label("lga_id"),
             Occupation.id.label("occupation_id"),
+            Occupation.occupation,
         ]
         rs = self.session.query(*cols).select_from(Client) \
             .join(Person, Person.id == Client.person_id) \
             .join(Lga, Lga.id == Client.lga_id) \
+            .outerjoin(State, State.id == Lga.state_id) \
             .join(Occupation, Occupation.id == Client.occupation_id) \
-            .filter(Client.id == client_id).one_or_none()
-
-        if rs:
-            return {
-                'id': rs.id,
-                'first_name': rs.first_name,
-                'last_name': rs.last_name,
-                'middle_name': rs.middle_name,
-                'email': rs.email,
-                'phone': rs.phone,
-                'photo': rs.photo,
-                'date_of_birth': rs.date_of_birth,
-                'address': rs.address,
-                'blood_group': rs.blood_group,
-                'sex': rs.sex,
-                'enrollment_date': rs.enrollment_date,
+            .filter(Client.id.in_(client_ids)).all()
+        if not rs:
+            return {}
+
+        client_ids = [row.id for row in rs]
+        notifications = self.notification.get_subscriptions_by_clients(client_ids, 100, 0)
+        vitals = self.vital_repository.get_recent_vitals_by_client_ids(client_ids, 100)
+        food_allergies = food_allergy_repository.get_by_clients(client_ids)
+        drug_allergies = drug_allergy_repository.get_by_clients(client_ids)
+        lifestyles = lifestyle_repository.get_by_patients(client_ids)
+
+        return {
+            row.id: {
+                'id': row.id,
+                'first_name': row.first_name,
+                'last_name': row.last_name,
+                'middle_name': row.middle_name,
+                'email': row.email,
+                'phone': row.phone,
+                'photo': row.photo,
+                'date_of_birth': row.date_of_birth,
+                'address': row.address,
+                'blood_group': row.blood_group,
+                'sex': row.sex,
+                'enrollment_date': row.enrollment_date,
                 'marital_status': 'Single',
-                'locality': (self.get_lga(rs.lga_id)).__dict__,
-                'occupation': (self.get_occupation(rs.occupation_id)).__dict__,
-                'notifications': self.notification.get_subscriptions_by_client(rs.id, 100, 0),
-                'vitals': self.vital_repository.get_vitals_by_client_id(rs.id, 0, 100)['data'],
-                'food_allergy': food_allergy_repository.get_by_client(rs.id),
-                'drug_allergy': drug_allergy_repository.get_by_client(rs.id),
-                'lifestyle': lifestyle_repository.get_by_patient(rs.id)
+                'locality': LocalityDTO(lga_id=row.lga_id, state_id=row.state_id, state=row.state,
+                                        lga=row.lga).__dict__,
+                'occupation': OccupationDTO(id=row.occupation_id, occupation=row.occupation).__dict__,
+                'notifications': notifications.get(row.id, []),
+                'vitals': vitals.get(row.id, []),
+                'food_allergy': food_allergies.get(row.id, []),
+                'drug_allergy': drug_allergies.get(row.id, []),
+                'lifestyle': lifestyles.get(row.id, [])
             }
-        else:
-            raise ValueError(f"Client with ID {client_id} not found.")
-            return None
+            for row in rs
+        }
+
+    def get_client_summaries(self, client_ids) -> Dict[int, dict]:
+        """Name, contact, sex and date of birth of several clients keyed by id, in one query."""
+        client_ids = [client_id for client_id in client_ids if client_id]
+        if not client_ids:
+            return {}
+        rs = self.session.query(Client.id, Person.first_name, Person.last_name, Person.middle_name, Person.phone,
+                                Person.email, Person.sex, Client.date_of_birth) \
+            .join(Person, Person.id == Client.person_id) \
+            .filter(Client.id.in_(client_ids)).all()
+        return {row.id: row._asdict() for row in rs}
 
     def get_occupation(self, occupation_id: int) -> Optional[OccupationDTO]:
         occupation = self.session.query(Occupation).filter(Occupation.id == occupation_id).one_or_none()
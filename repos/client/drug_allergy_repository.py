@@ -1,10 +1,12 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from dtos.client.allergy import DrugAllergyDTO, DrugAllergyCreate, DrugAllergyUpdate
 from models.client import DrugAllergy
 from models.pharmacy import Drug
 from models.product import Product
+from repos.consultation.queue_detail_cache import invalidate_client_queue_details
+from repos.pharmacy.safety_repository import invalidate_client_allergies
 
 
 class DrugAllergyRepository:
@@ -16,16 +18,22 @@ class DrugAllergyRepository:
         return DrugAllergyDTO.from_orm(obj) if obj else None
 
     def get_by_client(self, client_id: int) -> List[DrugAllergyDTO]:
+        return self.get_by_clients([client_id]).get(client_id, [])
+
+    def get_by_clients(self, client_ids) -> Dict[int, List[DrugAllergyDTO]]:
+        client_ids = [client_id for client_id in client_ids if client_id]
+        if not client_ids:
+            return {}
         cols = [DrugAllergy, Product.product_name.label('drug')]
         objs = self.db.query(*cols).join(Drug, DrugAllergy.drug_id == Drug.id) \
             .join(Product, Product.id == Drug.product_id) \
-            .filter(DrugAllergy.client_id == client_id).all()
+            .filter(DrugAllergy.client_id.in_(client_ids)).all()
 
-        result = []
+        result = {}
         for obj, drug_name in objs:  # unpack the tuple
             dto = DrugAllergyDTO.from_orm(obj)
             dto.drug_name = drug_name  # set the extra field
-            result.append(dto)
+            result.setdefault(obj.client_id, []).append(dto)
         return result
 
     def create(self, payload: DrugAllergyCreate) -> DrugAllergyDTO:
@@ -33,6 +41,8 @@ class DrugAllergyRepository:
         self.db.add(obj)
         self.db.commit()
         self.db.refresh(obj)
+        invalidate_client_allergies(obj.client_id)
+        invalidate_client_queue_details(obj.client_id)
         return DrugAllergyDTO.from_orm(obj)
 
     def update(self, db_obj: DrugAllergy, payload: DrugAllergyUpdate) -> DrugAllergyDTO:
@@ -41,8 +51,13 @@ class DrugAllergyRepository:
         self.db.add(db_obj)
         self.db.commit()
         self.db.refresh(db_obj)
+        invalidate_client_allergies(db_obj.client_id)
+        invalidate_client_queue_details(db_obj.client_id)
         return DrugAllergyDTO.from_orm(db_obj)
 
     def delete(self, db_obj: DrugAllergy) -> None:
+        client_id = db_obj.client_id
         self.db.delete(db_obj)
         self.db.commit()
+        invalidate_client_allergies(client_id)
+        invalidate_client_queue_details(client_id)
@@ -1,8 +1,9 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from dtos.client.allergy import FoodAllergyDTO, FoodAllergyUpdate, FoodAllergyCreate
 from models.client import FoodAllergy
+from repos.consultation.queue_detail_cache import invalidate_client_queue_details
 
 
 class FoodAllergyRepository:
@@ -14,14 +15,23 @@ class FoodAllergyRepository:
         return FoodAllergyDTO.from_orm(obj) if obj else None
 
     def get_by_client(self, client_id: int) -> List[FoodAllergyDTO]:
-        objs = self.db.query(FoodAllergy).filter(FoodAllergy.client_id == client_id).all()
-        return [FoodAllergyDTO.from_orm(obj) for obj in objs]
+        return self.get_by_clients([client_id]).get(client_id, [])
+
+    def get_by_clients(self, client_ids) -> Dict[int, List[FoodAllergyDTO]]:
+        client_ids = [client_id for client_id in client_ids if client_id]
+        if not client_ids:
+            return {}
+        allergies = {}
+        for obj in self.db.query(FoodAllergy).filter(FoodAllergy.client_id.in_(client_ids)).all():
+            allergies.setdefault(obj.client_id, []).append(FoodAllergyDTO.from_orm(obj))
+        return allergies
 
     def create(self, payload: FoodAllergyCreate) -> FoodAllergyDTO:
         obj = FoodAllergy(**payload.dict())
         self.db.add(obj)
         self.db.commit()
         self.db.refresh(obj)
+        invalidate_client_queue_details(obj.client_id)
         return FoodAllergyDTO.from_orm(obj)
 
     def update(self, db_obj: FoodAllergy, payload: FoodAllergyUpdate) -> FoodAllergyDTO:
@@ -30,8 +40,11 @@ class FoodAllergyRepository:
         self.db.add(db_obj)
         self.db.commit()
         self.db.refresh(db_obj)
+        invalidate_client_queue_details(db_obj.client_id)
         return FoodAllergyDTO.from_orm(db_obj)
 
     def delete(self, db_obj: FoodAllergy) -> None:
+        client_id = db_obj.client_id
         self.db.delete(db_obj)
         self.db.commit()
+        invalidate_client_queue_details(client_id)
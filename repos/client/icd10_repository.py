@@ -1,53 +1,206 @@
+import re
+import weakref
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from sqlalchemy import or_
 
 from dtos.client.icd10 import Icd10DTO, Icd10Response
 from models.client import Icd10
 
+# pg_trgm's default similarity_threshold, to find candidates for a misspelt word
+FUZZY_THRESHOLD = 0.3
+# and how close a candidate has to be to count as a match
+EDIT_THRESHOLD = 0.5
+
+_WORD = re.compile(r'[^\W_]+')
+_CODE = re.compile(r'^[a-z]\d{0,2}(\.\d*)?$')
+
+# search indexes by engine; the ICD-10 head codes are static, so each worker loads them once
+_indexes = weakref.WeakKeyDictionary()
+
+
+def words(text: Optional[str]) -> List[str]:
+    return _WORD.findall((text or '').lower())
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_similarity(first: str, second: str) -> float:
+    """1 less the edit distance (adjacent transpositions count as one edit) over the longer length."""
+    previous, current = None, list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return 1 - current[-1] / max(len(first), len(second), 1)
+
+
+class CodeTrie:
+    """Head codes by prefix: every node keeps the entries below it, so a prefix lookup is one walk."""
+
+    def __init__(self):
+        self.root = ({}, [])
+
+    def insert(self, code: str, position: int):
+        children, positions = self.root
+        positions.append(position)
+        for char in code:
+            node = children.setdefault(char, ({}, []))
+            children, positions = node
+            positions.append(position)
+
+    def prefixed(self, prefix: str) -> List[int]:
+        children, positions = self.root
+        for char in prefix:
+            if char not in children:
+                return []
+            children, positions = children[char]
+        return positions
+
+
+class Icd10SearchIndex:
+    """
+    The ICD-10 head codes held in memory.
+
+    Codes are matched by prefix through a trie; names through an inverted index of their words,
+    where a query word matches a name word exactly, as its prefix, or, when misspelt, a word found
+    by trigram similarity and ranked by edit distance. Every query word has to match; entries are
+    ranked by how well they do.
+    """
+
+    def __init__(self, rows):
+        self.entries = [Icd10DTO(id=row.id, url=row.url, head_code=row.head_code or '', name=row.name or '')
+                        for row in sorted(rows, key=lambda row: row.id)]
+        self.by_id = {entry.id: entry for entry in self.entries}
+        self.by_code = {}
+        self.by_name = {}
+        self.codes = CodeTrie()
+        self.postings: Dict[str, Set[int]] = {}
+        for position, entry in enumerate(self.entries):
+            code = entry.head_code.lower()
+            self.by_code.setdefault(code, entry)
+            self.by_name.setdefault(entry.name.lower(), entry)
+            self.codes.insert(code, position)
+            for word in words(entry.name):
+                self.postings.setdefault(word, set()).add(position)
+
+        self.vocabulary = sorted(self.postings)
+        self.grams: Dict[str, List[str]] = {}
+        self.gram_counts: Dict[str, int] = {}
+        for word in self.vocabulary:
+            grams = trigrams(word)
+            self.gram_counts[word] = len(grams)
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(word)
+        self.names = [entry.name.lower() for entry in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _code_scores(self, word: str) -> Dict[int, float]:
+        if not _CODE.match(word):
+            return {}
+        code = word.split('.')[0]
+        return {position: 2.0 if self.entries[position].head_code.lower() == code else 1.5
+                for position in self.codes.prefixed(code)}
+
+    def _word_scores(self, word: str) -> Dict[int, float]:
+        scores = self._code_scores(word)
+
+        def score(candidate: str, value: float):
+            for position in self.postings[candidate]:
+                if value > scores.get(position, 0.0):
+                    scores[position] = value
+
+        start = bisect_left(self.vocabulary, word)
+        for candidate in self.vocabulary[start:]:
+            if not candidate.startswith(word):
+                break
+            # an exact word scores 1, a prefix less the more of the word it leaves out
+            score(candidate, 0.5 + 0.5 * len(word) / len(candidate))
+
+        if len(word) >= 3 and not scores:
+            grams = trigrams(word)
+            shared = Counter(candidate for gram in grams for candidate in self.grams.get(gram, ()))
+            for candidate, count in shared.items():
+                if count / (len(grams) + self.gram_counts[candidate] - count) < FUZZY_THRESHOLD:
+                    continue
+                similarity = edit_similarity(word, candidate)
+                if similarity >= EDIT_THRESHOLD:
+                    score(candidate, 0.7 * similarity)
+        return scores
+
+    def search(self, text: str) -> List[Icd10DTO]:
+        text = text.strip().lower()
+        is_code = _CODE.match(text) is not None
+        query = [text] if is_code else words(text)
+        if not query:
+            return []
+
+        totals = None
+        for word in dict.fromkeys(query):
+            scores = self._word_scores(word)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {position: total + scores[position]
+                          for position, total in totals.items() if position in scores}
+            if not totals:
+                return []
+
+        if is_code:
+            ranked = sorted(totals, key=lambda position: (-totals[position], self.entries[position].head_code))
+        else:
+            phrase = ' '.join(query)
+            ranked = sorted(totals, key=lambda position: (
+                -(totals[position] + (0.5 if self.names[position].startswith(phrase) else 0.0)),
+                len(self.names[position]),
+                self.entries[position].head_code
+            ))
+        return [self.entries[position] for position in ranked]
+
 
 class Icd10Repository:
+    """
+    ICD-10 head codes. They never change at runtime, so the whole table is loaded into an
+    Icd10SearchIndex with one query the first time it is needed and reads are served from memory.
+    """
+
     def __init__(self, db: Session):
         self.db = db
 
-    def get(self, icd10_id: int) -> Optional[Icd10DTO]:
-        obj = self.db.query(Icd10).filter(Icd10.id == icd10_id).first()
-        return Icd10DTO.from_orm(obj) if obj else None
+    def index(self) -> Icd10SearchIndex:
+        bind = self.db.get_bind()
+        index = _indexes.get(bind)
+        if index is None:
+            index = Icd10SearchIndex(self.db.query(Icd10.id, Icd10.url, Icd10.head_code, Icd10.name).all())
+            # an empty table is not kept, it is probably still being seeded
+            if len(index):
+                _indexes[bind] = index
+        return index
 
-    def get_by_code(self, head_code: str) -> Optional[Icd10DTO]:
-        obj = self.db.query(Icd10).filter(Icd10.head_code == head_code).first()
-        return Icd10DTO.from_orm(obj) if obj else None
-
-    def list(self, skip: int = 0, limit: int = 100) -> List[Icd10Response]:
-        objs = self.db.query(Icd10).offset(skip).limit(limit).all()
-        return Icd10Response(
-            data=[Icd10DTO.from_orm(obj) for obj in objs],
-            total=self.db.query(Icd10).count()
-        )
-
-    def search(self, query: str, skip: int = 0, limit: int = 50) -> List[Icd10Response]:
-        """Search ICD-10 codes by partial code or name."""
-        objs = (
-            self.db.query(Icd10)
-            .filter(
-                or_(
-                    Icd10.head_code.ilike(f"%{query}%"),
-                    Icd10.name.ilike(f"%{query}%"),
-                )
-            )
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
-        total = self.db.query(Icd10).filter(
-            or_(
-                Icd10.head_code.ilike(f"%{query}%"),
-                Icd10.name.ilike(f"%{query}%"),
-            )
-        ).count()
-        data = [Icd10DTO.from_orm(obj) for obj in objs]
-        return Icd10Response(total=total, data=data)
+    def warm(self) -> int:
+        return len(self.index())
 
+    def get(self, icd10_id: int) -> Optional[Icd10DTO]:
+        return self.index().by_id.get(icd10_id)
 
+    def get_by_code(self, head_code: str) -> Optional[Icd10DTO]:
+        return self.index().by_code.get((head_code or '').strip().lower())
 
+    def list(self, skip: int = 0, limit: int = 100) -> Icd10Response:
+        entries = self.index().entries
+        return Icd10Response(data=entries[skip:skip + limit], total=len(entries))
 
+    def search(self, query: str, skip: int = 0, limit: int = 50) -> Icd10Response:
+        """Search ICD-10 codes by code prefix or name words, best match first."""
+        hits = self.index().search(query)
+        return Icd10Response(total=len(hits), data=hits[skip:skip + limit])
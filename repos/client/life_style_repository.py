@@ -1,10 +1,11 @@
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 from dtos.client.lifestyle import ClientLifestyleDTO
 from models.client import LifestyleFactor, ClientLifestyle
 from sqlalchemy.orm import Session
 
 from repos.client.icd10_repository import Icd10Repository
+from repos.consultation.queue_detail_cache import invalidate_client_queue_details
 
 
 class ClientLifestyleRepository:
@@ -46,6 +47,7 @@ class ClientLifestyleRepository:
                 self.session.add(record)
 
         self.db.commit()
+        invalidate_client_queue_details(data.patient_id)
 
         return {"message": "Lifestyle data submitted successfully"}
 
@@ -57,6 +59,7 @@ class ClientLifestyleRepository:
         self.db.add(obj)
         self.db.commit()
         self.db.refresh(obj)
+        invalidate_client_queue_details(patient_id)
         return ClientLifestyleDTO.from_orm(obj)
 
     # -----------------------
@@ -67,15 +70,22 @@ class ClientLifestyleRepository:
         return ClientLifestyleDTO.from_orm(obj) if obj else None
 
     def get_by_patient(self, patient_id: int) -> List[ClientLifestyleDTO]:
+        return self.get_by_patients([patient_id]).get(patient_id, [])
+
+    def get_by_patients(self, patient_ids) -> Dict[int, List[ClientLifestyleDTO]]:
+        patient_ids = [patient_id for patient_id in patient_ids if patient_id]
+        if not patient_ids:
+            return {}
         objs = (
             self.db.query(ClientLifestyle)
             .join(LifestyleFactor)
-            .filter(ClientLifestyle.patient_id == patient_id)
+            .filter(ClientLifestyle.patient_id.in_(patient_ids))
             .all()
         )
-        styles = [ClientLifestyleDTO.from_orm(obj) for obj in objs]
 
-        for life_style in styles:
+        styles = {}
+        for obj in objs:
+            life_style = ClientLifestyleDTO.from_orm(obj)
             if life_style.factor.id == 1 or life_style.factor.id == 6 or life_style.factor.id==7 or life_style.factor.id==8:
                 # get icd10 data
                 icd_ids = [int(x) for x in life_style.value.split(",") if x.isdigit()]
@@ -85,6 +95,7 @@ class ClientLifestyleRepository:
                     if icd_data:
                         val.append(icd_data)
                 life_style.value = val
+            styles.setdefault(obj.patient_id, []).append(life_style)
 
         return styles
 
@@ -103,6 +114,7 @@ class ClientLifestyleRepository:
             obj.factor_id = factor_id
         self.db.commit()
         self.db.refresh(obj)
+        invalidate_client_queue_details(obj.patient_id)
         return ClientLifestyleDTO.from_orm(obj)
 
     # -----------------------
@@ -112,6 +124,8 @@ class ClientLifestyleRepository:
         obj = self.db.query(ClientLifestyle).filter(ClientLifestyle.id == lifestyle_id).first()
         if not obj:
             return False
+        patient_id = obj.patient_id
         self.db.delete(obj)
         self.db.commit()
+        invalidate_client_queue_details(patient_id)
         return True
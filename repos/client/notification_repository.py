@@ -1,10 +1,11 @@
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 from sqlalchemy.exc import SQLAlchemyError, NoResultFound
 from sqlalchemy.orm import Session
 
 from dtos.people import ClientNotificationDTO
 from models.client import ClientNotification, ClientNotificationSubscription, MsgType
+from repos.consultation.queue_detail_cache import invalidate_client_queue_details
 
 
 class NotificationRepository:
@@ -88,6 +89,7 @@ class NotificationRepository:
         try:
             self.session.add(new_subscription)
             self.session.commit()
+            invalidate_client_queue_details(client_id)
             return new_subscription
         except SQLAlchemyError as e:
             self.session.rollback()
@@ -97,43 +99,39 @@ class NotificationRepository:
         """
         Get all subscriptions for a specific client with pagination.
         """
-        # Retrieve all notification types
-        notification_types = self.get_all(limit=limit, offset=offset)
-
-        # Ensure notification_types contains dictionaries or appropriate mappings
-        subs = []
+        return self.get_subscriptions_by_clients([client_id], limit, offset).get(client_id, [])
 
-        for notification_type in notification_types:
-            # Safely extract the notification_id (ensure the structure matches the return type of self.get_all())
-            notification_id = notification_type['id'] if isinstance(notification_type, dict) else notification_type.id
-            notification_name = notification_type['notification'] if isinstance(notification_type,
-                                                                                dict) else notification_type.notification
+    def get_subscriptions_by_clients(self, client_ids, limit: int = 100, offset: int = 0) -> Dict[int, List[dict]]:
+        """
+        Subscriptions of several clients keyed by client id, grouped by notification type. The
+        subscriptions of all the clients are loaded with one query.
+        """
+        client_ids = [client_id for client_id in client_ids if client_id]
+        if not client_ids:
+            return {}
+        notification_types = self.get_all(limit=limit, offset=offset)
 
-            # Get all subscriptions for the given client and notification type
-            type_subscriptions = (
-                self.session.query(ClientNotificationSubscription)
-                .filter_by(client_id=client_id, notification_id=notification_id)
-                .all()
-            )
+        type_subscriptions = {}
+        for t_sub in self.session.query(ClientNotificationSubscription).filter(
+                ClientNotificationSubscription.client_id.in_(client_ids),
+                ClientNotificationSubscription.notification_id.in_([nt.id for nt in notification_types])).all():
+            type_subscriptions.setdefault((t_sub.client_id, t_sub.notification_id), []).append({
+                'id': t_sub.id,
+                'msg_type': t_sub.msg_type,
+                'created_at': t_sub.created_at.isoformat()  # Serialize datetime
+            })
 
-            # Construct the subscription list
-            subscriptions = [
+        return {
+            client_id: [
                 {
-                    'id': t_sub.id,
-                    'msg_type': t_sub.msg_type,
-                    'created_at': t_sub.created_at.isoformat()  # Serialize datetime
+                    'notification_id': notification_type.id,
+                    'notify': notification_type.notification,
+                    'subscriptions': type_subscriptions.get((client_id, notification_type.id), []),
                 }
-                for t_sub in type_subscriptions
+                for notification_type in notification_types
             ]
-
-            # Append the result for the current notification type
-            subs.append({
-                'notification_id': notification_id,
-                'notify': notification_name,
-                'subscriptions': subscriptions,
-            })
-
-        return subs
+            for client_id in client_ids
+        }
 
     def delete_subscription(self, subscription_id: int) -> bool:
         """
@@ -166,6 +164,7 @@ class NotificationRepository:
                 subscription.state = state
 
             self.session.commit()
+            invalidate_client_queue_details(client_id)
             return subscription
         except SQLAlchemyError as e:
             self.session.rollback()
@@ -27,7 +27,8 @@ class ReferralRepository:
         """Get all active (non-deleted) referrals with joined Person and Organization."""
         return (
             self.db.query(Referral)
-            .options(joinedload(Referral.person), joinedload(Referral.organization))
+            .options(joinedload(Referral.organization_people).joinedload(OrganizationPeople.person),
+                     joinedload(Referral.organization_people).joinedload(OrganizationPeople.organization))
             .filter(Referral.deleted_at.is_(None))
             .all()
         )
@@ -138,6 +139,36 @@ class ReferralRepository:
             }
         return None
 
+    def get_referred_transactions_referral(self, transaction_ids: List[int]) -> dict:
+        """Same as get_referred_transaction_referral for a page of transactions, keyed by transaction id."""
+        if not transaction_ids:
+            return {}
+        cols = [
+            ReferredTransaction.transaction_id,
+            Referral.id,
+            Person.first_name,
+            Person.last_name,
+            Person.middle_name,
+            ReferredTransaction.status
+        ]
+        rs = self.db.query(*cols).select_from(OrganizationPeople) \
+            .join(Referral, Referral.org_people_id == OrganizationPeople.id) \
+            .join(Person, Person.id == OrganizationPeople.person_id) \
+            .join(ReferredTransaction, ReferredTransaction.referral_id == Referral.id) \
+            .filter(ReferredTransaction.transaction_id.in_(transaction_ids)) \
+            .order_by(ReferredTransaction.id).all()
+
+        referrals = {}
+        for row in rs:
+            referrals.setdefault(row.transaction_id, {
+                'first_name': row.first_name,
+                'last_name': row.last_name,
+                'middle_name': row.middle_name,
+                'referral_id': row.id,
+                'status': row.status
+            })
+        return referrals
+
     def get_referred_transaction(self, transaction_id: int):
         return self.db.query(ReferredTransaction).filter(ReferredTransaction.id == transaction_id).first()
 
@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from datetime import date, datetime
+
+from sqlalchemy import func, insert, update, select, or_
+from sqlalchemy.orm import Session
+
+from models.client import Referral, OrganizationPeople, Person
+from models.transaction import Transaction, ReferredTransaction, ReferredTransactionStatus, \
+    ReferredTransactionSettlement, ReferredTransactionSettlementDetail
+from repos.ledger_repository import LedgerRepository
+
+
+class ReferralSettlementRepository:
+    """
+    Settles referred transactions in batches.
+
+    A run reads every unsettled referred transaction in the date range together with its billed total
+    in one query, inserts one settlement per referrer and the detail rows in bulk, then flips the
+    statuses with a single UPDATE, all in one database transaction.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+        self.ledger_repository = LedgerRepository(db_session)
+
+    def unsettled_query(self, start_date: date, last_date: date, referral_id: int = 0):
+        # priced like every other bill, over the transactions in the range only
+        unsettled = select(ReferredTransaction.transaction_id) \
+            .join(Transaction, Transaction.id == ReferredTransaction.transaction_id) \
+            .where(ReferredTransaction.status == ReferredTransactionStatus.UnSettled,
+                   Transaction.transaction_date.between(start_date, last_date))
+        if referral_id != 0:
+            unsettled = unsettled.where(ReferredTransaction.referral_id == referral_id)
+        billing = self.ledger_repository.billed_query(unsettled).subquery()
+        cols = [
+            ReferredTransaction.id,
+            ReferredTransaction.transaction_id,
+            ReferredTransaction.referral_id,
+            Transaction.transaction_date,
+            Transaction.discount,
+            Person.first_name,
+            Person.last_name,
+            func.coalesce(billing.c.total_billed, 0).label('total_billed'),
+            func.coalesce(billing.c.line_discount, 0).label('line_discount')
+        ]
+        rs = self.db_session.query(*cols).select_from(ReferredTransaction) \
+            .join(Transaction, Transaction.id == ReferredTransaction.transaction_id) \
+            .join(Referral, Referral.id == ReferredTransaction.referral_id) \
+            .outerjoin(OrganizationPeople, OrganizationPeople.id == Referral.org_people_id) \
+            .outerjoin(Person, Person.id == OrganizationPeople.person_id) \
+            .outerjoin(billing, billing.c.transaction_id == ReferredTransaction.transaction_id) \
+            .filter(ReferredTransaction.status == ReferredTransactionStatus.UnSettled,
+                    or_(ReferredTransaction.is_deleted.is_(None), ReferredTransaction.is_deleted == False),
+                    Transaction.transaction_date.between(start_date, last_date))
+
+        if referral_id != 0:
+            rs = rs.filter(ReferredTransaction.referral_id == referral_id)
+        return rs.order_by(ReferredTransaction.referral_id, ReferredTransaction.id)
+
+    @staticmethod
+    def net_total(row) -> float:
+        total_billed = float(row.total_billed)
+        return total_billed - float(row.line_discount) - total_billed * (row.discount or 0) / 100
+
+    def group_by_referral(self, rows) -> OrderedDict:
+        referrals = OrderedDict()
+        for row in rows:
+            referral = referrals.setdefault(row.referral_id, {
+                'referral_id': row.referral_id,
+                'referral_first_name': row.first_name,
+                'referral_last_name': row.last_name,
+                'transaction_count': 0,
+                'total_billed': 0,
+                'net_total': 0,
+                'referred_transaction_ids': []
+            })
+            referral['transaction_count'] += 1
+            referral['total_billed'] += float(row.total_billed)
+            referral['net_total'] += self.net_total(row)
+            referral['referred_transaction_ids'].append(row.id)
+        return referrals
+
+    def get_unsettled(self, start_date: str, last_date: str = '', referral_id: int = 0):
+        """Preview of what a settlement run over the same range would settle, grouped per referrer."""
+        start, last = self.parse_range(start_date, last_date)
+        referrals = self.group_by_referral(self.unsettled_query(start, last, referral_id).all())
+        return {
+            'start_date': start,
+            'last_date': last,
+            'total': sum(referral['transaction_count'] for referral in referrals.values()),
+            'volume': sum(referral['net_total'] for referral in referrals.values()),
+            'data': list(referrals.values())
+        }
+
+    def settle(self, start_date: str, last_date: str, user_id: int, referral_id: int = 0):
+        start, last = self.parse_range(start_date, last_date)
+
+        # Lock the referred transactions being settled so a concurrent run cannot pick them up as well
+        rows = self.unsettled_query(start, last, referral_id) \
+            .with_for_update(of=ReferredTransaction).all()
+        referrals = self.group_by_referral(rows)
+        if not referrals:
+            return {'start_date': start, 'last_date': last, 'total': 0, 'volume': 0, 'data': []}
+
+        try:
+            settlements = self.db_session.execute(
+                insert(ReferredTransactionSettlement).returning(
+                    ReferredTransactionSettlement.id, ReferredTransactionSettlement.created_for),
+                [{'created_for': rid, 'created_by': user_id, 'created_at': date.today()} for rid in referrals]
+            ).all()
+            settlement_ids = {row.created_for: row.id for row in settlements}
+
+            self.db_session.execute(
+                insert(ReferredTransactionSettlementDetail),
+                [
+                    {'settlement_id': settlement_ids[rid], 'ref_transaction_id': ref_transaction_id}
+                    for rid, referral in referrals.items()
+                    for ref_transaction_id in referral['referred_transaction_ids']
+                ]
+            )
+
+            self.db_session.execute(
+                update(ReferredTransaction)
+                .where(ReferredTransaction.id.in_(
+                    select(ReferredTransactionSettlementDetail.ref_transaction_id)
+                    .where(ReferredTransactionSettlementDetail.settlement_id.in_(list(settlement_ids.values())))
+                ))
+                .values(status=ReferredTransactionStatus.Settled),
+                execution_options={'synchronize_session': False}
+            )
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+
+        data = []
+        for rid, referral in referrals.items():
+            referral = dict(referral, settlement_id=settlement_ids[rid])
+            del referral['referred_transaction_ids']
+            data.append(referral)
+
+        return {
+            'start_date': start,
+            'last_date': last,
+            'total': len(rows),
+            'volume': sum(referral['net_total'] for referral in data),
+            'data': data
+        }
+
+    @staticmethod
+    def parse_range(start_date: str, last_date: str = ''):
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        last = datetime.strptime(last_date, "%Y-%m-%d").date() if last_date else start
+        if last < start:
+            start, last = last, start
+        return start, last
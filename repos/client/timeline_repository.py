@@ -0,0 +1,120 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import select, union_all, literal, cast, null, String, Text, Integer, or_, and_
+from sqlalchemy.orm import Session
+
+from dtos.client.timeline import TimelineDTO, TimelineEventDTO
+from models.client import Vitals
+from models.consultation import Consultations, ConsultationQueue
+from models.lab.lab import ApprovedLabBookingResult
+from models.pharmacy import Prescription
+from models.services.service_cart import ClientServiceCart
+from models.services.services import ServiceBooking, ServiceBookingDetail
+
+MAX_PAGE = 200
+
+
+def encode_cursor(event: TimelineEventDTO) -> str:
+    return f"{event.event_time.isoformat()}|{event.event_type}|{event.id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str, int]:
+    try:
+        event_time, event_type, event_id = cursor.rsplit('|', 2)
+        return datetime.fromisoformat(event_time), event_type, int(event_id)
+    except ValueError:
+        raise ValueError(f"Invalid timeline cursor '{cursor}'")
+
+
+def _event(event_time, event_type: str, event_id, title, detail, reference_id):
+    return [
+        event_time.label('event_time'),
+        literal(event_type, String).label('event_type'),
+        event_id.label('id'),
+        cast(title, String).label('title'),
+        cast(detail, Text).label('detail'),
+        cast(reference_id, Integer).label('reference_id')
+    ]
+
+
+class TimelineRepository:
+    """
+    A client's history as one feed, newest first: consultations, approved lab results, vitals,
+    prescriptions and referrals.
+
+    Every stream is a slim projection filtered on the client and the cursor and cut to the newest
+    limit + 1 events in its own (time, id) order, so each reads at most a page from its index; they
+    are merged with one UNION ALL and paged by (event_time, event_type, id), so a page costs one
+    query however long the history is.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def streams(client_id: int, after: Optional[Tuple[datetime, str, int]], limit: int):
+        def page(stream, event_type: str, event_time, event_id):
+            # keep only the events past the cursor, and of those only the newest that can make the page
+            if after is None:
+                stream = stream.where(event_time.is_not(None))
+            else:
+                cursor_time, cursor_type, cursor_id = after
+                if event_type < cursor_type:
+                    stream = stream.where(event_time <= cursor_time)
+                elif event_type == cursor_type:
+                    stream = stream.where(or_(event_time < cursor_time,
+                                              and_(event_time == cursor_time, event_id < cursor_id)))
+                else:
+                    stream = stream.where(event_time < cursor_time)
+            stream = stream.order_by(event_time.desc(), event_id.desc()).limit(limit + 1)
+            return select(stream.subquery())
+
+        consultations = select(*_event(Consultations.created_at, 'consultation', Consultations.id,
+                                       Consultations.preliminary_diagnosis, Consultations.reason_for_visit,
+                                       Consultations.queue_id)) \
+            .join(ConsultationQueue, ConsultationQueue.id == Consultations.queue_id) \
+            .join(ServiceBookingDetail, ServiceBookingDetail.id == ConsultationQueue.booking_id) \
+            .join(ServiceBooking, ServiceBooking.id == ServiceBookingDetail.booking_id) \
+            .where(ServiceBooking.client_id == client_id, Consultations.deleted_at.is_(None))
+
+        lab_results = select(*_event(ApprovedLabBookingResult.approved_at, 'lab_result', ApprovedLabBookingResult.id,
+                                     ApprovedLabBookingResult.status, ApprovedLabBookingResult.comment,
+                                     ApprovedLabBookingResult.booking_id)) \
+            .join(ServiceBooking, ServiceBooking.id == ApprovedLabBookingResult.booking_id) \
+            .where(ServiceBooking.client_id == client_id)
+
+        vitals = select(*_event(Vitals.created_at, 'vital', Vitals.id, Vitals.vital_type, Vitals.vital_value,
+                                null())) \
+            .where(Vitals.client_id == client_id)
+
+        prescriptions = select(*_event(Prescription.created_at, 'prescription', Prescription.id,
+                                       Prescription.status, Prescription.instruction, Prescription.pharmacy_id)) \
+            .where(Prescription.client_id == client_id, Prescription.is_deleted.is_not(True))
+
+        referrals = select(*_event(ClientServiceCart.created_at, 'referral', ClientServiceCart.id,
+                                   ClientServiceCart.cart_status, null(), ClientServiceCart.referral_id)) \
+            .where(ClientServiceCart.client_id == client_id, ClientServiceCart.referral_id.is_not(None))
+
+        return [
+            page(consultations, 'consultation', Consultations.created_at, Consultations.id),
+            page(lab_results, 'lab_result', ApprovedLabBookingResult.approved_at, ApprovedLabBookingResult.id),
+            page(vitals, 'vital', Vitals.created_at, Vitals.id),
+            page(prescriptions, 'prescription', Prescription.created_at, Prescription.id),
+            page(referrals, 'referral', ClientServiceCart.created_at, ClientServiceCart.id)
+        ]
+
+    def get_timeline(self, client_id: int, cursor: Optional[str] = None, limit: int = 50) -> TimelineDTO:
+        """A page of the client's history. Pass the returned next_cursor to get older events."""
+        limit = max(1, min(limit, MAX_PAGE))
+        after = decode_cursor(cursor) if cursor else None
+
+        events = union_all(*self.streams(client_id, after, limit)).subquery('timeline')
+        rs = self.db.execute(
+            select(events)
+            .order_by(events.c.event_time.desc(), events.c.event_type.desc(), events.c.id.desc())
+            .limit(limit + 1)
+        ).all()
+
+        data = [TimelineEventDTO(**row._asdict()) for row in rs[:limit]]
+        return TimelineDTO(data=data, next_cursor=encode_cursor(data[-1]) if len(rs) > limit else None)
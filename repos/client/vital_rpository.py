@@ -1,10 +1,12 @@
 from sqlalchemy.orm.query import Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 from dtos.people import VitalDTO, VitalsDTO
 from models.client import Vitals
+from repos.consultation.queue_detail_cache import invalidate_client_queue_details
 
 
 class VitalsRepository:
@@ -23,6 +25,7 @@ class VitalsRepository:
         self.db.add(new_vital)
         self.db.commit()
         self.db.refresh(new_vital)
+        invalidate_client_queue_details(new_vital.client_id)
         return new_vital
 
     def get_vital_by_id(self, vital_id: int) -> Optional[Vitals]:
@@ -50,6 +53,25 @@ class VitalsRepository:
             'total': self.vital_count(vital_type)
         }
 
+    def get_recent_vitals_by_client_ids(self, client_ids, limit: int = 10) -> Dict[int, List[VitalsDTO]]:
+        """
+        The latest vitals of several clients keyed by client id, at most limit per client, in one query.
+        """
+        client_ids = [client_id for client_id in client_ids if client_id]
+        if not client_ids:
+            return {}
+        rank = func.row_number().over(partition_by=Vitals.client_id,
+                                      order_by=(Vitals.created_at.desc(), Vitals.id.desc())).label('rank')
+        ranked = self.db.query(Vitals.id, rank).filter(Vitals.client_id.in_(client_ids)).subquery()
+        rs = self.db.query(Vitals).join(ranked, ranked.c.id == Vitals.id) \
+            .filter(ranked.c.rank <= limit) \
+            .order_by(Vitals.created_at.desc(), Vitals.id.desc()).all()
+
+        vitals = {}
+        for vital in rs:
+            vitals.setdefault(vital.client_id, []).append(VitalsDTO.from_orm(vital))
+        return vitals
+
     def vital_count(self, vital_type: str = None):
         if vital_type:
             return self.db.query(Vitals).filter(Vitals.vital_type == vital_type).count()
@@ -62,12 +84,16 @@ class VitalsRepository:
         vital = self.get_vital_by_id(vital_id)
         if not vital:
             return None
+        previous_client_id = vital.client_id
         vital.vital_type = vital_dto.vital_type
         vital.vital_value = vital_dto.vital_value
         vital.client_id = vital_dto.client_id
         vital.created_at = datetime.utcnow()  # Update the timestamp
         self.db.commit()
         self.db.refresh(vital)
+        invalidate_client_queue_details(previous_client_id)
+        if vital.client_id != previous_client_id:
+            invalidate_client_queue_details(vital.client_id)
         return vital
 
     def delete_vital(self, vital_id: int) -> bool:
@@ -77,6 +103,8 @@ class VitalsRepository:
         vital = self.get_vital_by_id(vital_id)
         if not vital:
             return False
+        client_id = vital.client_id
         self.db.delete(vital)
         self.db.commit()
+        invalidate_client_queue_details(client_id)
         return True
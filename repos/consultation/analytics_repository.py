@@ -0,0 +1,313 @@
+import logging
+import re
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Set
+
+from redis import RedisError
+from sqlalchemy import func, select, insert, delete, exists, case, and_, or_, Date
+from sqlalchemy.orm import Session, aliased
+
+from cache.redis import get_redis_client
+from dtos.consultation_analytics import SymptomStatDTO, DiagnosisStatDTO, SystemReviewStatDTO, \
+    FollowUpStatDTO, FollowUpReportDTO
+from models.consultation import Consultations, ConsultationClinicalExamination, ConsultationHierarchy, \
+    ConsultationRoS, PresentingSymptom, Symptom, ConsultationAnalyticsMark, ConsultationSymptomDaily, \
+    ConsultationSystemDaily, ConsultationDiagnosisDaily, ConsultationFollowUpDaily
+from repos.client.icd10_repository import Icd10Repository
+from repos.consultation.schedule_repository import parse_day
+from repos.consultation.slot_repository import RELEASE_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+# one worker refreshes at a time
+REFRESH_LOCK_KEY = "consultation:analytics:refresh"
+REFRESH_LOCK_SECONDS = 600
+MAX_RANGE_DAYS = 366
+
+_HEAD_CODE = re.compile(r'\b([A-Za-z]\d{2})(?:\.\d+)?\b')
+
+
+def diagnosis_codes(diagnosis: Optional[str], index) -> List[Optional[str]]:
+    """
+    ICD-10 head codes of a preliminary diagnosis: codes written in it, ICD-10 ids (comma separated,
+    as lifestyle values are stored) or an ICD-10 name. [None] when it cannot be coded.
+    """
+    text = (diagnosis or '').strip()
+    if not text:
+        return []
+    parts = [part.strip() for part in text.split(',') if part.strip()]
+    if parts and all(part.isdigit() for part in parts):
+        codes = [index.by_id[int(part)].head_code for part in parts if int(part) in index.by_id]
+    else:
+        codes = [code.upper() for code in _HEAD_CODE.findall(text) if code.lower() in index.by_code]
+        if not codes:
+            entry = index.by_name.get(text.lower())
+            codes = [entry.head_code] if entry else []
+    return list(dict.fromkeys(codes)) or [None]
+
+
+def mark_days(db_session: Session, days: Iterable[date]):
+    """Mark days for the next refresh. Does not commit, it belongs to the caller's transaction."""
+    days = {day.date() if isinstance(day, datetime) else day for day in days if day}
+    if days:
+        db_session.execute(insert(ConsultationAnalyticsMark), [{'day': day} for day in sorted(days)])
+
+
+def parse_range(start_date, end_date):
+    last_day = parse_day(end_date) if end_date else date.today()
+    first_day = parse_day(start_date) if start_date else last_day - timedelta(days=29)
+    if first_day > last_day:
+        raise ValueError("start date is after end date")
+    if (last_day - first_day).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"A report can cover at most {MAX_RANGE_DAYS} days")
+    return first_day, last_day
+
+
+class ConsultationAnalyticsRepository:
+    """
+    Daily aggregates of consultations: presenting symptoms by severity, review of systems, diagnoses
+    by ICD-10 head code and follow-ups, all by the day the consultation was created.
+
+    Writes to consultations and their examinations mark the days they touch (mark_consultations,
+    mark_examinations); refresh recomputes only
+    the marked days, one grouped INSERT ... SELECT per aggregate, and is what the periodic job runs.
+    Reports read the aggregate tables only.
+    """
+
+    def __init__(self, db_session: Session, redis=None):
+        self.db_session = db_session
+        self.redis = redis
+
+    def _redis(self):
+        return self.redis or get_redis_client()
+
+    def consultation_days(self, consultation_ids: Iterable[int]) -> Set[date]:
+        """Days whose aggregates depend on the consultations: their own and those of linked base and follow-up cases."""
+        consultation_ids = list(consultation_ids)
+        if not consultation_ids:
+            return set()
+        linked = aliased(Consultations)
+        rs = self.db_session.query(Consultations.created_at, linked.created_at.label('linked_created_at')) \
+            .outerjoin(ConsultationHierarchy, or_(ConsultationHierarchy.follow_up_consultation_id == Consultations.id,
+                                                  ConsultationHierarchy.base_consultation_id == Consultations.id)) \
+            .outerjoin(linked, and_(linked.id.in_([ConsultationHierarchy.base_consultation_id,
+                                                   ConsultationHierarchy.follow_up_consultation_id]),
+                                    linked.id != Consultations.id)) \
+            .filter(Consultations.id.in_(consultation_ids)).all()
+        return {moment.date() for row in rs for moment in (row.created_at, row.linked_created_at) if moment}
+
+    def mark_consultations(self, consultation_ids: Iterable[int]):
+        mark_days(self.db_session, self.consultation_days(consultation_ids))
+
+    def mark_examinations(self, examination_ids: Iterable[int]):
+        """Mark the days of the consultations the clinical examinations are linked to."""
+        examination_ids = [examination_id for examination_id in examination_ids if examination_id]
+        if not examination_ids:
+            return
+        rs = self.db_session.query(ConsultationClinicalExamination.consultation_id) \
+            .filter(ConsultationClinicalExamination.clinical_examination_id.in_(examination_ids)).distinct().all()
+        self.mark_consultations([row.consultation_id for row in rs])
+
+    @staticmethod
+    def _day(column):
+        return func.date(column, type_=Date)
+
+    def _in_days(self, days: Optional[List[date]]):
+        if days is None:
+            return Consultations.created_at.is_not(None)
+        # the range lets the created_at index narrow the rows before the day match
+        return and_(Consultations.created_at >= datetime.combine(days[0], datetime.min.time()),
+                    Consultations.created_at < datetime.combine(days[-1] + timedelta(days=1), datetime.min.time()),
+                    self._day(Consultations.created_at).in_(days))
+
+    def _recompute(self, days: Optional[List[date]]):
+        day = self._day(Consultations.created_at).label('day')
+        live = and_(self._in_days(days), Consultations.deleted_at.is_(None))
+
+        for table in (ConsultationSymptomDaily, ConsultationSystemDaily, ConsultationDiagnosisDaily,
+                      ConsultationFollowUpDaily):
+            statement = delete(table)
+            if days is not None:
+                statement = statement.where(table.day.in_(days))
+            self.db_session.execute(statement)
+
+        self.db_session.execute(insert(ConsultationSymptomDaily).from_select(
+            ['day', 'symptom_id', 'severity', 'occurrences'],
+            select(day, PresentingSymptom.symptom_id, PresentingSymptom.severity, func.count())
+            .select_from(Consultations)
+            .join(ConsultationClinicalExamination,
+                  ConsultationClinicalExamination.consultation_id == Consultations.id)
+            .join(PresentingSymptom,
+                  PresentingSymptom.clinical_examination_id == ConsultationClinicalExamination.clinical_examination_id)
+            .where(live, ConsultationClinicalExamination.deleted_at.is_(None),
+                   PresentingSymptom.deleted_at.is_(None), PresentingSymptom.symptom_id.is_not(None))
+            .group_by(day, PresentingSymptom.symptom_id, PresentingSymptom.severity)
+        ))
+
+        self.db_session.execute(insert(ConsultationSystemDaily).from_select(
+            ['day', 'system', 'reviews'],
+            select(day, ConsultationRoS.system, func.count())
+            .select_from(Consultations)
+            .join(ConsultationRoS, ConsultationRoS.consultation_id == Consultations.id)
+            .where(live, ConsultationRoS.deleted_at.is_(None), ConsultationRoS.system.is_not(None))
+            .group_by(day, ConsultationRoS.system)
+        ))
+
+        follow_up = aliased(Consultations)
+        is_follow_up = exists().where(ConsultationHierarchy.follow_up_consultation_id == Consultations.id)
+        followed_up = exists().where(ConsultationHierarchy.base_consultation_id == Consultations.id,
+                                     follow_up.id == ConsultationHierarchy.follow_up_consultation_id,
+                                     follow_up.deleted_at.is_(None))
+        self.db_session.execute(insert(ConsultationFollowUpDaily).from_select(
+            ['day', 'consultations', 'follow_ups', 'followed_up'],
+            select(day, func.count(),
+                   func.sum(case((is_follow_up, 1), else_=0)),
+                   func.sum(case((followed_up, 1), else_=0)))
+            .where(live)
+            .group_by(day)
+        ))
+
+        # diagnoses are free text, coded in memory against the ICD-10 index
+        index = Icd10Repository(self.db_session).index()
+        counts = Counter()
+        for row in self.db_session.execute(
+                select(day, Consultations.preliminary_diagnosis)
+                .where(live, Consultations.preliminary_diagnosis.is_not(None))):
+            for code in diagnosis_codes(row.preliminary_diagnosis, index):
+                counts[(row.day, code)] += 1
+        if counts:
+            self.db_session.execute(insert(ConsultationDiagnosisDaily), [
+                {'day': key[0], 'head_code': key[1], 'consultations': total}
+                for key, total in counts.items()
+            ])
+
+    def _lock(self) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            if not self._redis().set(REFRESH_LOCK_KEY, token, nx=True, ex=REFRESH_LOCK_SECONDS):
+                return None
+        except RedisError:
+            # without the lock a concurrent refresh fails on the unique indexes and is rolled back
+            pass
+        return token
+
+    def _unlock(self, token: str):
+        try:
+            self._redis().eval(RELEASE_SCRIPT, 1, REFRESH_LOCK_KEY, token)
+        except RedisError:
+            logger.warning("Could not release the consultation analytics lock")
+
+    def refresh(self) -> int:
+        """Recompute the marked days; returns how many. Safe to run from several workers."""
+        token = self._lock()
+        if token is None:
+            return 0
+        try:
+            last_mark = self.db_session.query(func.max(ConsultationAnalyticsMark.id)).scalar()
+            if last_mark is None:
+                return 0
+            days = sorted(row.day for row in self.db_session.query(ConsultationAnalyticsMark.day)
+                          .filter(ConsultationAnalyticsMark.id <= last_mark).distinct())
+            self._recompute(days)
+            # marks added while this ran are kept for the next refresh
+            self.db_session.execute(delete(ConsultationAnalyticsMark)
+                                    .where(ConsultationAnalyticsMark.id <= last_mark))
+            self.db_session.commit()
+            return len(days)
+        except Exception:
+            self.db_session.rollback()
+            raise
+        finally:
+            self._unlock(token)
+
+    def rebuild(self) -> int:
+        """Recompute every day from the clinical tables, e.g. once after deploying the aggregates."""
+        token = self._lock()
+        if token is None:
+            raise ValueError("Consultation analytics are being refreshed, try again later")
+        try:
+            last_mark = self.db_session.query(func.max(ConsultationAnalyticsMark.id)).scalar()
+            self._recompute(None)
+            if last_mark is not None:
+                self.db_session.execute(delete(ConsultationAnalyticsMark)
+                                        .where(ConsultationAnalyticsMark.id <= last_mark))
+            self.db_session.commit()
+            return self.db_session.query(func.count(ConsultationFollowUpDaily.id)).scalar()
+        except Exception:
+            self.db_session.rollback()
+            raise
+        finally:
+            self._unlock(token)
+
+    def get_symptoms(self, start_date=None, end_date=None, limit: int = 20) -> List[SymptomStatDTO]:
+        """Most frequent presenting symptoms of the range, with their counts by severity."""
+        first_day, last_day = parse_range(start_date, end_date)
+        rs = self.db_session.query(
+            ConsultationSymptomDaily.symptom_id,
+            ConsultationSymptomDaily.severity,
+            func.sum(ConsultationSymptomDaily.occurrences).label('occurrences')
+        ).filter(ConsultationSymptomDaily.day.between(first_day, last_day)) \
+            .group_by(ConsultationSymptomDaily.symptom_id, ConsultationSymptomDaily.severity).all()
+
+        totals, by_severity = Counter(), defaultdict(dict)
+        for row in rs:
+            totals[row.symptom_id] += int(row.occurrences)
+            severity = row.severity.value if row.severity else 'Unknown'
+            by_severity[row.symptom_id][severity] = int(row.occurrences)
+
+        top = [symptom_id for symptom_id, _ in sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+        names = dict(self.db_session.query(Symptom.id, Symptom.symptom).filter(Symptom.id.in_(top)).all()) \
+            if top else {}
+        return [
+            SymptomStatDTO(symptom_id=symptom_id, symptom=names.get(symptom_id), occurrences=totals[symptom_id],
+                           by_severity=by_severity[symptom_id])
+            for symptom_id in top
+        ]
+
+    def get_diagnoses(self, start_date=None, end_date=None, limit: int = 20) -> List[DiagnosisStatDTO]:
+        """Most frequent ICD-10 head codes of the range; uncoded diagnoses are counted without a code."""
+        first_day, last_day = parse_range(start_date, end_date)
+        total = func.sum(ConsultationDiagnosisDaily.consultations).label('consultations')
+        rs = self.db_session.query(ConsultationDiagnosisDaily.head_code, total) \
+            .filter(ConsultationDiagnosisDaily.day.between(first_day, last_day)) \
+            .group_by(ConsultationDiagnosisDaily.head_code) \
+            .order_by(total.desc(), ConsultationDiagnosisDaily.head_code).limit(limit).all()
+
+        icd10 = Icd10Repository(self.db_session)
+        data = []
+        for row in rs:
+            entry = icd10.get_by_code(row.head_code) if row.head_code else None
+            data.append(DiagnosisStatDTO(head_code=row.head_code, name=entry.name if entry else None,
+                                         consultations=int(row.consultations)))
+        return data
+
+    def get_systems(self, start_date=None, end_date=None) -> List[SystemReviewStatDTO]:
+        first_day, last_day = parse_range(start_date, end_date)
+        total = func.sum(ConsultationSystemDaily.reviews).label('reviews')
+        rs = self.db_session.query(ConsultationSystemDaily.system, total) \
+            .filter(ConsultationSystemDaily.day.between(first_day, last_day)) \
+            .group_by(ConsultationSystemDaily.system).order_by(total.desc()).all()
+        return [SystemReviewStatDTO(system=row.system.value, reviews=int(row.reviews)) for row in rs]
+
+    def get_follow_ups(self, start_date=None, end_date=None) -> FollowUpReportDTO:
+        """Daily consultations and follow-ups of the range; the rate is the share of consultations followed up."""
+        first_day, last_day = parse_range(start_date, end_date)
+        rs = self.db_session.query(ConsultationFollowUpDaily) \
+            .filter(ConsultationFollowUpDaily.day.between(first_day, last_day)) \
+            .order_by(ConsultationFollowUpDaily.day).all()
+
+        def rate(followed_up: int, consultations: int) -> float:
+            return round(followed_up / consultations, 4) if consultations else 0.0
+
+        data = [
+            FollowUpStatDTO(day=row.day, consultations=row.consultations, follow_ups=row.follow_ups,
+                            followed_up=row.followed_up, follow_up_rate=rate(row.followed_up, row.consultations))
+            for row in rs
+        ]
+        consultations = sum(row.consultations for row in data)
+        followed_up = sum(row.followed_up for row in data)
+        return FollowUpReportDTO(consultations=consultations, follow_ups=sum(row.follow_ups for row in data),
+                                 followed_up=followed_up, follow_up_rate=rate(followed_up, consultations),
+                                 data=data)
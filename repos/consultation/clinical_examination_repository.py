@@ -1,16 +1,91 @@
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 
-from dtos.consultation import ClinicalExaminationDTO
-from models.consultation import ClinicalExamination
+from dtos.consultation import ClinicalExaminationDTO, PresentingSymptomDTO
+from models.consultation import ClinicalExamination, PresentingSymptom
+from repos.base_repository import in_unit_of_work
+from repos.consultation.analytics_repository import ConsultationAnalyticsRepository
+
+SYMPTOM_COLUMNS = [
+    PresentingSymptom.id,
+    PresentingSymptom.clinical_examination_id,
+    PresentingSymptom.symptom_id,
+    PresentingSymptom.severity,
+    PresentingSymptom.frequency,
+]
 
 
 class ClinicalExaminationRepository:
+    """
+    Clinical examinations with their presenting symptoms.
+
+    create writes the examination and all of its symptoms with bulk INSERT ... RETURNING and
+    commits once. On PostgreSQL the examination insert is a CTE of the symptom insert, so the
+    whole examination is a single statement.
+    """
+
     def __init__(self, db: Session):
         self.db = db
 
-    def create(self, clinical_examination_data: ClinicalExaminationDTO) -> ClinicalExaminationDTO:
-        db_clinical_examination = ClinicalExamination(**clinical_examination_data.dict())
-        self.db.add(db_clinical_examination)
-        self.db.commit()
-        self.db.refresh(db_clinical_examination)
-        return ClinicalExaminationDTO(**db_clinical_examination.__dict__)
+    def create(self, clinical_examination_data: ClinicalExaminationDTO, conducted_by: Optional[int] = None,
+               commit: bool = True) -> ClinicalExaminationDTO:
+        """With commit=False (or inside a UnitOfWork) the rows are only written and the caller commits."""
+        examination = {
+            'presenting_complaints': clinical_examination_data.presenting_complaints,
+            'conducted_at': clinical_examination_data.conducted_at or date.today(),
+            'transaction_id': clinical_examination_data.transaction_id,
+            'conducted_by': conducted_by or clinical_examination_data.conducted_by,
+        }
+        symptoms = [
+            {
+                'symptom_id': symptom.symptom_id,
+                'severity': symptom.severity,
+                'frequency': symptom.frequency,
+            }
+            for symptom in clinical_examination_data.symptoms or []
+        ]
+
+        try:
+            if symptoms and self.db.get_bind().dialect.name == 'postgresql':
+                examination_id, rows = self._insert_together(examination, symptoms)
+            else:
+                examination_id = self.db.execute(
+                    insert(ClinicalExamination).values(**examination).returning(ClinicalExamination.id)
+                ).scalar_one()
+                rows = sorted(self.db.execute(
+                    insert(PresentingSymptom).returning(*SYMPTOM_COLUMNS),
+                    [dict(symptom, clinical_examination_id=examination_id) for symptom in symptoms]
+                ).all(), key=lambda row: row.id) if symptoms else []
+            if commit and not in_unit_of_work(self.db):
+                # a caller that commits itself, like a consultation, marks the days of its own links
+                ConsultationAnalyticsRepository(self.db).mark_examinations([examination_id])
+                self.db.commit()
+        except Exception:
+            if commit:
+                self.db.rollback()
+            raise
+
+        return ClinicalExaminationDTO(
+            id=examination_id,
+            symptoms=[PresentingSymptomDTO(
+                clinical_examination_id=row.clinical_examination_id,
+                symptom_id=row.symptom_id,
+                severity=row.severity.value if row.severity else None,
+                frequency=row.frequency.value if row.frequency else None
+            ) for row in rows],
+            **examination
+        )
+
+    def _insert_together(self, examination: dict, symptoms: List[dict]):
+        exam = insert(ClinicalExamination).values(**examination).returning(ClinicalExamination.id).cte('exam')
+        examination_id = select(exam.c.id).scalar_subquery()
+        rows = self.db.execute(
+            insert(PresentingSymptom)
+            .values([dict(symptom, clinical_examination_id=examination_id) for symptom in symptoms])
+            .add_cte(exam)
+            .returning(*SYMPTOM_COLUMNS)
+        ).all()
+        return rows[0].clinical_examination_id, sorted(rows, key=lambda row: row.id)
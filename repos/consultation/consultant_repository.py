@@ -1,25 +1,41 @@
-from datetime import timedelta, datetime
-from typing import List, Optional
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
 
-from sqlalchemy import and_, cast, DateTime
+from redis import RedisError
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from dtos.consultant import SpecialismDTO
-from dtos.consultation import SymptomDTO, ClinicalExaminationDTO, PresentingSymptomDTO, ConsultantDTO, \
+from cache.redis import get_redis_client
+from dtos.consultant import ConsultantDTO
+from dtos.consultation import SymptomDTO, ClinicalExaminationDTO, PresentingSymptomDTO, \
     InHoursDTO, ConsultationQueueDTO, ConsultationAppointmentDTO, BaseCaseDTO
 from dtos.services import PriceCodeDTO
 from models.consultation import Symptom, ClinicalExamination, PresentingSymptom, Specialist, Specialism, \
-    SpecialistSpecialization, InHours, InHourFrequency, ConsultationQueue, InternalSystems, Consultations
+    SpecialistSpecialization, InHours, ConsultationQueue, InternalSystems, Consultations
 from models.lab.lab import QueueStatus
 from models.services.services import PriceCode, BusinessServices, StoreVisibility, ServiceType, ServiceBooking, \
     ServiceBookingDetail, BookingType
 from models.transaction import Transaction
 from repos.auth_repository import UserRepository
 from repos.client.client_repository import ClientRepository
+from repos.consultation.analytics_repository import ConsultationAnalyticsRepository
+from repos.consultation.clinical_examination_repository import ClinicalExaminationRepository
+from repos.consultation.queue_detail_cache import QUEUE_DETAIL_KEY, cache_queue_details
+from repos.consultation.roster_repository import RosterRepository, invalidate_roster
+from repos.consultation.schedule_repository import ScheduleRepository, invalidate_schedule
+from repos.consultation.slot_repository import SlotRepository, parse_slot, invalidate_free_slots
 from repos.services.price_repository import PriceRepository
 from repos.services.service_repository import ServiceRepository
 
 
+logger = logging.getLogger(__name__)
+
+# patients whose detail is cached ahead when a consultant opens their board
+PREFETCH_QUEUE_DETAILS = 5
+
+
 class ConsultantRepository:
     def __init__(self, db: Session):
         self.db = db
@@ -27,6 +43,9 @@ class ConsultantRepository:
         self.service_repository = ServiceRepository(db)
         self.price_repository = PriceRepository(db)
         self.client_repository = ClientRepository(db)
+        self.schedule_repository = ScheduleRepository(db)
+        self.slot_repository = SlotRepository(db)
+        self.roster_repository = RosterRepository(db)
 
         cols = [
             Transaction.transaction_time,
@@ -37,7 +56,7 @@ class ConsultantRepository:
             ServiceBooking.client_id,
             ServiceBookingDetail.booking_id,
             ConsultationQueue.scheduled_at,
-            ConsultationQueue.id.label("schedule_id"),
+            ConsultationQueue.schedule_id,
             ConsultationQueue.specialization_id.label("specialization_id"),
             ConsultationQueue.consultation_time,
             ConsultationQueue.notes,
@@ -94,59 +113,28 @@ class ConsultantRepository:
         self.db.add(hours)
         self.db.commit()
         self.db.refresh(hours)
+        invalidate_schedule(hours.specialist_id)
+        invalidate_free_slots(hours.specialist_id)
         return self.in_hours_dto(hours)
 
     def get_expanded_in_hours(self, start_date: str, end_date: str, consultant_id: int) -> List[InHoursDTO]:
-        days: List[InHoursDTO] = []
-
-        current = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S")
-        end = current + timedelta(days=6)
-
-        # Validate that start_time is before or equal to end_time
-        if current > end:
-            print("Error: start_time is after end_time. No schedule to expand.")
-            return days
-
-        while current <= end:
-
-            in_hour_schedule = self.db.query(InHours).filter(
-                and_(
-                    InHours.start_time <= current,
-                    InHours.end_time <= end
-                )).all()
-
-            for ih in in_hour_schedule:
-                st_time = ih.start_time.time()
-                ed_time = ih.end_time.time()
-
-                weekday = current.weekday()  # 0 = Monday, 6 = Sunday
-                add = False
-
-                if ih.frequency == InHourFrequency.Daily:
-                    add = True
-                elif ih.frequency == InHourFrequency.Weekly:
-                    add = current.weekday() == ih.start_time.weekday()
-                elif ih.frequency == InHourFrequency.EveryDayOfTheWeek:
-                    add = True
-                elif ih.frequency == InHourFrequency.EveryWeekDay:
-                    add = weekday < 5
-
-                if add:
-                    slot = InHoursDTO(
-                        id=ih.id,
-                        specialist_id=ih.specialist_id,
-                        business_service=self.service_repository.get_business_service_by_id(ih.service_id),
-                        frequency=ih.frequency.value,
-                        start_time=current.strftime("%Y-%m-%d") + " " + str(st_time),
-                        end_time=current.strftime("%Y-%m-%d") + " " + str(ed_time),
-                    )
-                    days.append(slot)
-
-            current += timedelta(days=1)
-
-        return days
+        """Sessions of a consultant between two dates (inclusive) that still have free appointment slots."""
+        return self.schedule_repository.get_expanded_in_hours(consultant_id, start_date, end_date)
 
     def add_consultant_queue(self, consultant_queue: ConsultationQueueDTO):
+        """
+        Book a consultation. A timed booking needs a free slot: pass the token from reserving it,
+        or the slot is reserved here. Raises ValueError when the slot cannot be booked.
+        """
+        reservation = consultant_queue.reservation
+        if consultant_queue.consultation_time:
+            if reservation:
+                self.slot_repository.confirm(consultant_queue.schedule_id, consultant_queue.consultation_time,
+                                             reservation)
+            else:
+                reservation = self.slot_repository.reserve(consultant_queue.schedule_id,
+                                                           consultant_queue.consultation_time).token
+
         try:
             obj = ConsultationQueue(
                 schedule_id=consultant_queue.schedule_id,
@@ -155,26 +143,34 @@ class ConsultantRepository:
                 booking_id=consultant_queue.booking_id,
                 specialization_id=consultant_queue.specialization_id,
                 notes=consultant_queue.notes,
-                consultation_time=consultant_queue.consultation_time
+                consultation_time=parse_slot(consultant_queue.consultation_time)
+                if consultant_queue.consultation_time else None
             )
             self.db.add(obj)
             self.db.commit()
             self.db.refresh(obj)
-            res = ConsultationQueueDTO(
-                id=obj.id,
-                schedule_id=obj.schedule_id,
-                # scheduled_at=consultant_queue.scheduled_at.strftime("%Y-%m-%d"),
-                # consultation_time=consultant_queue.consultation_time.strftime("%Y-%m-%d %H:%M:%S"),
-                status=obj.status,
-                booking_id=obj.booking_id,
-                specialization_id=obj.specialization_id,
-                notes=obj.notes
-            )
-
-            return res
         except Exception as e:
             self.db.rollback()
+            if reservation:
+                self.slot_repository.release(consultant_queue.schedule_id, consultant_queue.consultation_time,
+                                             reservation)
+            if isinstance(e, IntegrityError) and consultant_queue.consultation_time:
+                raise ValueError("This appointment slot is already booked")
             print(f"Error adding consultant queue: {e}")
+            return None
+
+        if obj.consultation_time:
+            self.slot_repository.booked(obj.schedule_id, obj.consultation_time, reservation)
+        return ConsultationQueueDTO(
+            id=obj.id,
+            schedule_id=obj.schedule_id,
+            # scheduled_at=consultant_queue.scheduled_at.strftime("%Y-%m-%d"),
+            consultation_time=obj.consultation_time.strftime("%Y-%m-%d %H:%M:%S") if obj.consultation_time else None,
+            status=obj.status,
+            booking_id=obj.booking_id,
+            specialization_id=obj.specialization_id,
+            notes=obj.notes
+        )
 
     def get_consultant_queue(
             self,
@@ -183,8 +179,14 @@ class ConsultantRepository:
             start_date: Optional[str] = None,
             last_date: Optional[str] = None,
             in_hour_id: int = 0,
-            status: Optional[str] = None
+            status: Optional[str] = None,
+            skip: int = 0,
+            limit: int = 100
     ) -> List[ConsultationAppointmentDTO]:
+        """
+        A page of the appointment board. Specialists and clients of the whole page are loaded
+        with one query per kind as slim projections.
+        """
         query = self.queue
 
         # Apply consultant filter
@@ -200,7 +202,7 @@ class ConsultantRepository:
             query = query.filter(ServiceBooking.client_id == client_id)
 
         # Apply status filter
-        if status:
+        if status and status != QueueStatus.All:
             query = query.filter(ConsultationQueue.status == status)
 
         # Helper to safely convert to datetime
@@ -229,21 +231,25 @@ class ConsultantRepository:
                 ConsultationQueue.scheduled_at <= last_dt
             ))
 
-        # Execute the query
-        res = query.all()
+        res = query.order_by(ConsultationQueue.consultation_time, ConsultationQueue.id) \
+            .offset(skip).limit(limit).all()
+
+        specialists = self.roster_repository.get_many({booking.specialist_id for booking in res})
+        clients = self.client_repository.get_client_summaries({booking.client_id for booking in res})
 
-        # Process results
         bookings = []
         for booking in res:
+            appointment_time = booking.consultation_time or booking.start_time
             bookings.append(
                 ConsultationAppointmentDTO(
-                    specialist=self.get_consultant(booking.specialist_id),
-                    client=self.client_repository.get_client(booking.client_id),
-                    time_of_appointment=booking.consultation_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    date_of_appointment=booking.start_time.strftime("%Y-%m-%d"),
+                    specialist=specialists.get(booking.specialist_id),
+                    client=clients.get(booking.client_id),
+                    time_of_appointment=booking.consultation_time.strftime("%Y-%m-%d %H:%M:%S")
+                    if booking.consultation_time else None,
+                    date_of_appointment=appointment_time.strftime("%Y-%m-%d") if appointment_time else None,
                     booking_id=booking.booking_id,
                     transaction_id=booking.transaction_id,
-                    scheduled_at=booking.scheduled_at.strftime("%Y-%m-%d %H:%M:%S"),
+                    scheduled_at=booking.scheduled_at.strftime("%Y-%m-%d %H:%M:%S") if booking.scheduled_at else None,
                     status=booking.status,
                     id=booking.id
                 )
@@ -252,6 +258,13 @@ class ConsultantRepository:
         return bookings
 
     def get_consultation_service_booking(self, transaction_id: int):
+        return self.get_consultation_service_bookings([transaction_id]).get(transaction_id, [])
+
+    def get_consultation_service_bookings(self, transaction_ids) -> Dict[int, List[dict]]:
+        """Appointment booking lines of several transactions keyed by transaction id."""
+        transaction_ids = [transaction_id for transaction_id in transaction_ids if transaction_id]
+        if not transaction_ids:
+            return {}
         cols = [
             ServiceBooking.id.label("booking_id"),
             ServiceBookingDetail.price_code,
@@ -276,13 +289,15 @@ class ConsultantRepository:
             join(BusinessServices, BusinessServices.service_id == InHours.service_id). \
             filter(ServiceBookingDetail.booking_type == BookingType.Appointment)
 
-        res = app_res.filter(ServiceBooking.transaction_id == transaction_id).all()
+        res = app_res.filter(ServiceBooking.transaction_id.in_(transaction_ids)).all()
+        consultants = self.roster_repository.get_many({result.specialist_id for result in res})
 
-        cos = []
+        cos = {}
         for result in res:
-            consultant = self.get_consultant(result.specialist_id)
-            service_desc = result.department + " Consultation with " + consultant.user.first_name + " " + consultant.user.last_name
-            cos.append({
+            user = (consultants.get(result.specialist_id) or {}).get('user') or {}
+            service_desc = f"{result.department} Consultation with {user.get('first_name') or ''} " \
+                           f"{user.get('last_name') or ''}".rstrip()
+            cos.setdefault(result.transaction_id, []).append({
                 'booking_details_id': result.booking_detail_id,
                 'service_id': result.service_id,
                 'lab_service_name': service_desc,
@@ -293,86 +308,26 @@ class ConsultantRepository:
             })
         return cos
 
-    def get_clinical_examination(db: Session, clinical_examination_id: int) -> ClinicalExaminationDTO:
-        db_clinical_examination = db.query(ClinicalExamination).filter(
-            ClinicalExamination.id == clinical_examination_id).first()
-        return ClinicalExaminationDTO(**db_clinical_examination.__dict__) if db_clinical_examination else None
-
-    def update_clinical_examination(db: Session, db_clinical_examination: ClinicalExamination,
-                                    clinical_examination_data: ClinicalExaminationDTO) -> ClinicalExaminationDTO:
-        for field, value in clinical_examination_data.dict().items():
-            setattr(db_clinical_examination, field, value)
-        db.commit()
-        db.refresh(db_clinical_examination)
-        return ClinicalExaminationDTO(**db_clinical_examination.__dict__)
-
-    def create_presenting_symptom(db: Session, presenting_symptom_data: PresentingSymptomDTO) -> PresentingSymptomDTO:
-        db_presenting_symptom = PresentingSymptom(**presenting_symptom_data.dict())
-        db.add(db_presenting_symptom)
-        db.commit()
-        db.refresh(db_presenting_symptom)
-        return PresentingSymptomDTO(**db_presenting_symptom.__dict__)
-
-    def get_presenting_symptom(db: Session, presenting_symptom_id: int) -> PresentingSymptomDTO:
-        db_presenting_symptom = db.query(PresentingSymptom).filter(
+    def get_presenting_symptom(self, presenting_symptom_id: int) -> Optional[PresentingSymptomDTO]:
+        db_presenting_symptom = self.db.query(PresentingSymptom).filter(
             PresentingSymptom.id == presenting_symptom_id).first()
-        return PresentingSymptomDTO(**db_presenting_symptom.__dict__) if db_presenting_symptom else None
+        return PresentingSymptomDTO.from_orm(db_presenting_symptom) if db_presenting_symptom else None
 
-    def update_presenting_symptom(db: Session, db_presenting_symptom: PresentingSymptom,
+    def update_presenting_symptom(self, db_presenting_symptom: PresentingSymptom,
                                   presenting_symptom_data: PresentingSymptomDTO) -> PresentingSymptomDTO:
+        examination_ids = [db_presenting_symptom.clinical_examination_id]
         for field, value in presenting_symptom_data.dict().items():
             setattr(db_presenting_symptom, field, value)
-        db.commit()
-        db.refresh(db_presenting_symptom)
-        return PresentingSymptomDTO(**db_presenting_symptom.__dict__)
-
-    # PresentingSymptom Repository
-    def create_presenting_symptom(db: Session, presenting_symptom: PresentingSymptomDTO) -> ClinicalExaminationDTO:
-        db_presenting_symptom = PresentingSymptom(**presenting_symptom.dict())
-        db.add(db_presenting_symptom)
-        db.commit()
-        db.refresh(db_presenting_symptom)
-        return {
-            'id': db_presenting_symptom.id,
-            'severity': db_presenting_symptom.severity,
-            'frequency': db_presenting_symptom.frequency,
-            'symptom_id': db_presenting_symptom.symptom_id,
-            'clinical_examination_id': db_presenting_symptom.clinical_examination_id
-        }
+        examination_ids.append(db_presenting_symptom.clinical_examination_id)
+        ConsultationAnalyticsRepository(self.db).mark_examinations(set(examination_ids))
+        self.db.commit()
+        self.db.refresh(db_presenting_symptom)
+        return PresentingSymptomDTO.from_orm(db_presenting_symptom)
 
     # ClinicalExamination Repository
     def create_clinical_examination(self, clinical_examination: ClinicalExaminationDTO) -> ClinicalExaminationDTO:
-        # db_clinical_examination = ClinicalExamination(**clinical_examination.dict())
-        db_clinical_examination = ClinicalExamination(
-            presenting_complaints=clinical_examination.presenting_complaints,
-            transaction_id=clinical_examination.transaction_id,
-            conducted_by=1
-        )
-        self.db.add(db_clinical_examination)
-        self.db.commit()
-        self.db.refresh(db_clinical_examination)
-
-        sym: List[PresentingSymptomDTO] = []
-        for symp in clinical_examination.symptoms:
-            sym.append(
-                self.create_presenting_symptom(
-                    PresentingSymptomDTO(
-                        symptom_id=symp.symptom_id,
-                        clinical_examination_id=db_clinical_examination.id,
-                        severity=symp.severity,
-                        frequency=symp.frequency
-                    )
-                )
-            )
-
-        return {
-            'id': db_clinical_examination.id,
-            'transaction_id': db_clinical_examination.transaction_id,
-            'conducted_by': db_clinical_examination.conducted_by,
-            'symptoms': sym,
-            'conducted_at': db_clinical_examination.conducted_at,
-            'presenting_complaints': db_clinical_examination.presenting_complaints
-        }
+        """The examination and all of its symptoms in one transaction, see ClinicalExaminationRepository."""
+        return ClinicalExaminationRepository(self.db).create(clinical_examination, conducted_by=1)
 
     def get_clinical_examination(self, clinical_examination_id: int) -> Optional[ClinicalExamination]:
         return self.db.query(ClinicalExamination).filter(ClinicalExamination.id == clinical_examination_id).first()
@@ -385,6 +340,7 @@ class ConsultantRepository:
             update_data = clinical_examination.dict(exclude_unset=True)
             for key, value in update_data.items():
                 setattr(db_clinical_examination, key, value)
+            ConsultationAnalyticsRepository(self.db).mark_examinations([clinical_examination_id])
             self.db.commit()
             self.db.refresh(db_clinical_examination)
         return db_clinical_examination
@@ -393,6 +349,7 @@ class ConsultantRepository:
         db_clinical_examination = self.db.query(ClinicalExamination).filter(
             ClinicalExamination.id == clinical_examination_id).first()
         if db_clinical_examination:
+            ConsultationAnalyticsRepository(self.db).mark_examinations([clinical_examination_id])
             self.db.delete(db_clinical_examination)
             self.db.commit()
         return db_clinical_examination
@@ -413,6 +370,7 @@ class ConsultantRepository:
             self.db.add(spec)
             self.db.commit()
             self.db.refresh(spec)
+            invalidate_roster()
             return spec
         return None
 
@@ -429,6 +387,7 @@ class ConsultantRepository:
 
             for specialization in consultant_dto.specializations:
                 self.add_consultant_specialization(consultant.id, specialization.id)
+            invalidate_roster()
 
             return ConsultantDTO(
                 id=consultant.id,
@@ -462,6 +421,7 @@ class ConsultantRepository:
                 if spec.specialism_id not in new_spec_ids:
                     self.db.delete(spec)
             self.db.commit()
+            invalidate_roster()
 
             return ConsultantDTO(
                 id=consultant.id,
@@ -471,48 +431,55 @@ class ConsultantRepository:
             )
         return None
 
-    def get_consultants(self, skip: int = 0, limit: int = 100) -> List[ConsultantDTO]:
+    def get_consultants(self, skip: int = 0, limit: int = 100,
+                        specialism_id: Optional[int] = None) -> List[ConsultantDTO]:
+        return [self.roster_repository.consultant_dto(consultant)
+                for consultant in self.roster_repository.list(skip, limit, specialism_id)]
+
+    def get_consultation_queue_by_id(self, queue_id: int) -> Optional[ConsultationQueueDTO]:
+        return self.get_consultation_queues([queue_id]).get(queue_id)
+
+    def get_consultation_queues(self, queue_ids) -> Dict[int, ConsultationQueueDTO]:
+        """
+        Queue entries with their booking, client and previous cases keyed by id. Bookings, client
+        profiles and cases of all the entries are loaded together.
+        """
+        queue_ids = [queue_id for queue_id in queue_ids if queue_id]
+        if not queue_ids:
+            return {}
+        rs = self.queue.filter(ConsultationQueue.id.in_(queue_ids)).all()
+        bookings = self.get_consultation_service_bookings({qu.transaction_id for qu in rs})
+        client_ids = {qu.client_id for qu in rs if qu.client_id}
+        clients = self.client_repository.get_clients(client_ids)
+        base_cases = self.get_base_cases_by_client_ids(client_ids)
 
-        query = self.db.query(Specialist).offset(skip).limit(limit).all()
-        consultants = []
-        for consultant in query:
-            specializations = self.db.query(Specialism).join(SpecialistSpecialization,
-                                                             Specialism.id == SpecialistSpecialization.specialism_id).filter(
-                SpecialistSpecialization.specialist_id == consultant.id).all()
-
-            consultants.append(
-                ConsultantDTO(
-                    id=consultant.id,
-                    user=self.user_repository.get_usr_by_id(consultant.user_id),
-                    title=consultant.title,
-                    specializations=[
-                        SpecialismDTO(id=spec.id, department=spec.department, specialist_title=spec.specialist_title)
-                        for spec in specializations]
-                )
+        return {
+            qu.id: ConsultationQueueDTO(
+                id=qu.id,
+                schedule_id=qu.schedule_id,
+                scheduled_at=qu.scheduled_at.strftime("%Y-%m-%d %H:%M:%S") if qu.scheduled_at else None,
+                consultation_time=qu.consultation_time.strftime("%Y-%m-%d %H:%M:%S")
+                if qu.consultation_time else None,
+                status=qu.status,
+                booking_detail=next(iter(bookings.get(qu.transaction_id, [])), None),
+                client=clients.get(qu.client_id),
+                booking_id=qu.booking_id,
+                specialization_id=qu.specialization_id,
+                notes=qu.notes,
+                base_cases=base_cases.get(qu.client_id, [])
             )
-        return consultants
-
-    def get_consultation_queue_by_id(self, queue_id: int):
-        qu = self.queue.filter(ConsultationQueue.id == queue_id).first()
-        booking_details = self.get_consultation_service_booking(qu.transaction_id)[0]
-        client = self.client_repository.get_client(qu.client_id)
-        return ConsultationQueueDTO(
-            id=qu.id,
-            schedule_id=qu.schedule_id,
-            scheduled_at=qu.scheduled_at.strftime("%Y-%m-%d %H:%M:%S"),
-            consultation_time=qu.consultation_time.strftime("%Y-%m-%d %H:%M:%S"),
-            status=qu.status,
-            booking_detail=booking_details,
-            client=client,
-            booking_id=qu.booking_id,
-            specialization_id=qu.specialization_id,
-            notes=qu.notes,
-            base_cases=self.get_base_cases_by_client_id(client["id"])
-        )
+            for qu in rs
+        }
 
     def get_base_cases_by_client_id(self, client_id: int) -> List[BaseCaseDTO]:
-        base_cases = []
+        return self.get_base_cases_by_client_ids([client_id]).get(client_id, [])
+
+    def get_base_cases_by_client_ids(self, client_ids) -> Dict[int, List[BaseCaseDTO]]:
+        client_ids = [client_id for client_id in client_ids if client_id]
+        if not client_ids:
+            return {}
         cols = [
+            ServiceBooking.client_id,
             Consultations.id,
             Consultations.reason_for_visit,
             Consultations.preliminary_diagnosis,
@@ -523,10 +490,11 @@ class ConsultantRepository:
             .join(ConsultationQueue, ConsultationQueue.id == Consultations.queue_id) \
             .join(ServiceBookingDetail, ConsultationQueue.booking_id == ServiceBookingDetail.id) \
             .join(ServiceBooking, ServiceBooking.id == ServiceBookingDetail.booking_id) \
-            .filter(ServiceBooking.client_id == client_id).all()
+            .filter(ServiceBooking.client_id.in_(client_ids)).all()
 
+        base_cases = {}
         for q in queue:
-            base_cases.append(
+            base_cases.setdefault(q.client_id, []).append(
                 BaseCaseDTO(
                     consultation_id=q.id,
                     presenting_complaint=q.reason_for_visit,
@@ -537,21 +505,44 @@ class ConsultantRepository:
             )
         return base_cases
 
-    def get_consultant(self, consultant_id: int):
-        consultant = self.db.query(Specialist).filter(Specialist.id == consultant_id).one_or_none()
+    def get_upcoming_queue_ids(self, consultant_id: int, limit: int) -> List[int]:
+        """The next patients waiting for a consultant, from today on."""
+        rs = self.db.query(ConsultationQueue.id).select_from(ConsultationQueue) \
+            .join(InHours, InHours.id == ConsultationQueue.schedule_id) \
+            .filter(InHours.specialist_id == consultant_id,
+                    ConsultationQueue.deleted_at.is_(None),
+                    ConsultationQueue.status.in_([QueueStatus.Waiting, QueueStatus.Processing]),
+                    ConsultationQueue.consultation_time >= datetime.combine(datetime.today(), datetime.min.time())) \
+            .order_by(ConsultationQueue.consultation_time, ConsultationQueue.id) \
+            .limit(limit).all()
+        return [row.id for row in rs]
+
+    def prefetch_queue_details(self, consultant_id: int, limit: int = PREFETCH_QUEUE_DETAILS, redis=None) -> int:
+        """
+        Cache the detail of the consultant's next patients that are not cached yet. Returns how many
+        were built.
+        """
+        redis = redis or get_redis_client()
+        queue_ids = self.get_upcoming_queue_ids(consultant_id, limit)
+        if not queue_ids:
+            return 0
+        try:
+            cached = redis.mget([QUEUE_DETAIL_KEY.format(queue_id=queue_id) for queue_id in queue_ids])
+        except RedisError:
+            return 0
 
-        if consultant:
-            specializations = self.db.query(Specialism) \
-                .join(SpecialistSpecialization, Specialism.id == SpecialistSpecialization.specialism_id) \
-                .filter(SpecialistSpecialization.specialist_id == consultant_id).all()
-            return ConsultantDTO(
-                id=consultant.id,
-                user=self.user_repository.get_usr_by_id(consultant.user_id),
-                title=consultant.title,
-                specializations=[
-                    SpecialismDTO(id=spec.id, department=spec.department, specialist_title=spec.specialist_title)
-                    for spec in specializations]
-            )
+        missing = [queue_id for queue_id, value in zip(queue_ids, cached) if value is None]
+        details = self.get_consultation_queues(missing)
+        try:
+            cache_queue_details(details, redis)
+        except RedisError:
+            logger.warning(f"Could not cache queue details of consultant {consultant_id}")
+            return 0
+        return len(details)
+
+    def get_consultant(self, consultant_id: int) -> Optional[ConsultantDTO]:
+        consultant = self.roster_repository.get(consultant_id)
+        return self.roster_repository.consultant_dto(consultant) if consultant else None
 
     def get_internal_systems(self) -> List[str]:
         # get enum internal systems
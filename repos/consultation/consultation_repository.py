@@ -1,16 +1,21 @@
 # repositories/consultations_repository.py
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 
 from dtos.auth import UserDTO
-from dtos.consultation import ConsultationDTO, ConsultationCreate, ConsultationUpdate, ConsultationDetailDTO, \
+from dtos.consultation import ConsultationDTO, ConsultationUpdate, ConsultationDetailDTO, \
     PresentingSymptomDTO, ClinicalExaminationDTO, ConsultationRoSDTO
 from dtos.pharmacy.prescription import PrescriptionDTO, PrescriptionDetailDTO
-from models.consultation import Consultations, ClinicalExamination, ConsultationClinicalExamination, PresentingSymptom, \
+from models.consultation import Consultations, ClinicalExamination, ConsultationClinicalExamination, \
     ConsultationRoS, ConsultationQueue, ConsultationPrescription, ConsultationHierarchy
 from models.lab.lab import QueueStatus
 from models.pharmacy import Prescription
+from models.services.services import ServiceBooking, ServiceBookingDetail
 from models.transaction import Transaction
+from repos.base_repository import UnitOfWork
+from repos.consultation.analytics_repository import ConsultationAnalyticsRepository
+from repos.consultation.clinical_examination_repository import ClinicalExaminationRepository
+from repos.consultation.queue_detail_cache import invalidate_queue_detail, invalidate_client_queue_details
 from repos.pharmacy.prescription_repository import PrescriptionRepository
 from repos.services.service_cart_repository import ServiceCartRepository
 from utils.functions import generate_transaction_id
@@ -21,6 +26,8 @@ class ConsultationsRepository:
     def __init__(self, db: Session):
         self.db = db
         self.service_cart_repository = ServiceCartRepository(db)
+        self.analytics_repository = ConsultationAnalyticsRepository(db)
+        self.clinical_examination_repository = ClinicalExaminationRepository(db)
 
     def get(self, consultation_id: int) -> Optional[ConsultationDTO]:
         consultation = (
@@ -30,83 +37,96 @@ class ConsultationsRepository:
         )
         return ConsultationDTO.from_orm(consultation) if consultation else None
 
-    def get_all(self, skip: int = 0, limit: int = 100, client_id: int = 0) -> List[ConsultationDetailDTO]:
-        query = (
-            self.db.query(Consultations)
-            .options(
-                joinedload(Consultations.queue),
-                joinedload(Consultations.creator),
-                joinedload(Consultations.consultation_clinical_examinations)
-                .joinedload(ConsultationClinicalExamination.clinical_examination)
-                .joinedload(ClinicalExamination.symptoms),
-                joinedload(Consultations.consultation_prescriptions)
-                .joinedload(ConsultationPrescription.prescription)
-                .joinedload(Prescription.details),  # make sure this matches your model
-                joinedload(Consultations.review_of_systems),
-            )
-            .offset(skip)
-            .limit(limit)
-        )
+    def get_all(self, skip: int = 0, limit: int = 100, client_id: int = 0,
+                detail: bool = False) -> List[ConsultationDetailDTO]:
+        """
+        A page of consultations, newest first. Only the consultations are returned unless detail is
+        set; then the page's examinations, prescriptions and reviews of systems are loaded with one
+        query per collection for the IDs of the page.
+        """
+        query = self.db.query(Consultations).filter(Consultations.deleted_at.is_(None))
 
         if client_id:
-            query = query.join(Consultations.queue).filter(ConsultationQueue.client_id == client_id)
-
-        consultations = query.all()
-        result = []
-        for c in consultations:
-            # Clinical Examination (first one if any)
-            clinical_examination = None
-            clinical_examinations = [
-                ccx.clinical_examination for ccx in getattr(c, "consultation_clinical_examinations", [])
-                if ccx.clinical_examination
-            ]
-            if clinical_examinations:
-                ce = clinical_examinations[0]
-                symptoms = [PresentingSymptomDTO.from_orm(symptom) for symptom in getattr(ce, "symptoms", [])]
-                clinical_examination = ClinicalExaminationDTO(
-                    id=ce.id,
-                    presenting_complaints=ce.presenting_complaints,
-                    conducted_at=ce.conducted_at,
-                    conducted_by=ce.conducted_by,
-                    symptoms=symptoms,
-                    transaction_id=ce.transaction_id,
-                )
-
-            # Prescription (first one if any, with items)
-            prescription = None
-            prescriptions = [
-                cp.prescription for cp in getattr(c, "consultation_prescriptions", [])
-                if cp.prescription
-            ]
-            if prescriptions:
-                pres = prescriptions[0]
-                items = [PrescriptionDetailDTO.from_orm(item) for item in getattr(pres, "items", [])]
-                prescription = PrescriptionDTO(
-                    # fill in other prescription fields as needed
-                    id=pres.id,
-                    issued_by=pres.issued_by,
-                    issued_at=pres.issued_at,
-                    items=items,
-                    # ... add other fields from your PrescriptionDTO as needed
-                )
+            query = query.join(ConsultationQueue, ConsultationQueue.id == Consultations.queue_id) \
+                .join(ServiceBookingDetail, ServiceBookingDetail.id == ConsultationQueue.booking_id) \
+                .join(ServiceBooking, ServiceBooking.id == ServiceBookingDetail.booking_id) \
+                .filter(ServiceBooking.client_id == client_id)
+
+        if detail:
+            query = query.options(*self.detail_options())
+
+        consultations = query.order_by(Consultations.created_at.desc(), Consultations.id.desc()) \
+            .offset(skip).limit(limit).all()
+
+        if not detail:
+            return [ConsultationDetailDTO(consultation=ConsultationDTO.from_orm(c)) for c in consultations]
+        return [self.detail_dto(c) for c in consultations]
+
+    def get_detail(self, consultation_id: int) -> Optional[ConsultationDetailDTO]:
+        consultation = self.db.query(Consultations).options(*self.detail_options()) \
+            .filter(Consultations.id == consultation_id).first()
+        return self.detail_dto(consultation) if consultation else None
+
+    @staticmethod
+    def detail_options():
+        return [
+            selectinload(Consultations.consultation_clinical_examinations)
+            .selectinload(ConsultationClinicalExamination.clinical_examination)
+            .selectinload(ClinicalExamination.symptoms),
+            selectinload(Consultations.consultation_prescriptions)
+            .selectinload(ConsultationPrescription.prescription)
+            .selectinload(Prescription.details),
+            selectinload(Consultations.review_of_systems),
+        ]
+
+    @staticmethod
+    def detail_dto(c: Consultations) -> ConsultationDetailDTO:
+        # Clinical Examination (first one if any)
+        clinical_examination = None
+        clinical_examinations = [
+            ccx.clinical_examination for ccx in c.consultation_clinical_examinations
+            if ccx.clinical_examination
+        ]
+        if clinical_examinations:
+            ce = clinical_examinations[0]
+            clinical_examination = ClinicalExaminationDTO(
+                id=ce.id,
+                presenting_complaints=ce.presenting_complaints,
+                conducted_at=ce.conducted_at,
+                conducted_by=ce.conducted_by,
+                symptoms=[PresentingSymptomDTO.from_orm(symptom) for symptom in ce.symptoms],
+                transaction_id=ce.transaction_id,
+            )
 
-            # Review of Systems
-            review_of_systems = [
-                ConsultationRoSDTO.from_orm(ros)
-                for ros in getattr(c, "review_of_systems", [])
-            ]
-
-            detail = ConsultationDetailDTO(
-                consultation=ConsultationDTO.from_orm(c),
-                clinical_examination=clinical_examination,
-                prescription=prescription,
-                review_of_systems=review_of_systems,
+        # Prescription (first one if any, with items)
+        prescription = None
+        prescriptions = [cp.prescription for cp in c.consultation_prescriptions if cp.prescription]
+        if prescriptions:
+            pres = prescriptions[0]
+            prescription = PrescriptionDTO(
+                id=pres.id,
+                status=pres.status,
+                note=pres.note,
+                instruction=pres.instruction,
+                pharmacy_id=pres.pharmacy_id,
+                created_at=pres.created_at.strftime("%Y-%m-%d %H:%M:%S") if pres.created_at else None,
+                prescriptions=[PrescriptionDetailDTO.from_orm(item) for item in pres.details],
             )
-            result.append(detail)
-        return result
+
+        return ConsultationDetailDTO(
+            consultation=ConsultationDTO.from_orm(c),
+            clinical_examination=clinical_examination,
+            prescription=prescription,
+            review_of_systems=[ConsultationRoSDTO.from_orm(ros) for ros in c.review_of_systems],
+        )
 
     def create(self, consultation_data_detail: ConsultationDetailDTO, created_by: UserDTO) -> ConsultationDTO:
-        try:
+        """
+        The consultation, its transaction, clinical examination, review of systems, service cart,
+        prescription and queue status are committed in one UnitOfWork; a failure leaves none of them.
+        """
+        prescription_id = None
+        with UnitOfWork(self.db):
             consultation_data = consultation_data_detail.consultation
             consultation_data.created_by = created_by.id
 
@@ -136,31 +156,19 @@ class ConsultationsRepository:
             self.db.add(transaction)
             self.db.flush()
 
-            # create clinical examination if provided. use repository later
+            # clinical examination and its symptoms
             clinical_examination_data = consultation_data_detail.clinical_examination
             clinical_examination_data.transaction_id = transaction.id
-            ced = clinical_examination_data.dict()
-
-            # exclude symptoms to avoid issues with serialization
-            ced.pop('symptoms', None)
-            cedr = ClinicalExamination(**ced)
-            cedr.conducted_by = created_by.id
-            self.db.add(cedr)
-            self.db.flush()
+            clinical_examination = self.clinical_examination_repository.create(
+                clinical_examination_data, conducted_by=created_by.id, commit=False
+            )
 
             # link clinical examination to consultation
             self.db.add(ConsultationClinicalExamination(
                 consultation_id=consultation.id,
-                clinical_examination_id=cedr.id
+                clinical_examination_id=clinical_examination.id
             ))
 
-            # add symptoms if any
-            for symptom in clinical_examination_data.symptoms or []:
-                symptom.clinical_examination_id = cedr.id
-                self.db.add(
-                    PresentingSymptom(**symptom.dict())
-                )
-
             review_of_systems = consultation_data_detail.review_of_systems or []
             for ros in review_of_systems:
                 ros.consultation_id = consultation.id
@@ -171,20 +179,21 @@ class ConsultationsRepository:
             consultation_data_detail.client_service_cart.transaction_id = transaction.id
             consultation_data_detail.client_service_cart.created_by = created_by.id
             self.service_cart_repository.create_client_service_cart(
-                consultation_data_detail.client_service_cart
+                consultation_data_detail.client_service_cart, commit=False
             )
 
             # process prescription if any
             prescription = consultation_data_detail.prescription
             if prescription:
                 prescription_repository = PrescriptionRepository(self.db)
-                prescription_id = prescription_repository.create(prescription, created_by)
-                if prescription_id:
+                created_prescription = prescription_repository.create(prescription, created_by)
+                if created_prescription:
+                    prescription_id = created_prescription.id
                     # link prescription to consultation
                     self.db.add(
                         ConsultationPrescription(
                             consultation_id=consultation.id,
-                            prescription_id=prescription_id.id
+                            prescription_id=prescription_id
                         )
                     )
 
@@ -195,12 +204,17 @@ class ConsultationsRepository:
                 consultation_queue.status = QueueStatus.Processed
                 self.db.add(consultation_queue)
 
-            self.db.commit()
-            self.db.refresh(consultation)
-            return ConsultationDTO.from_orm(consultation)
-        except Exception as e:
-            self.db.rollback()
-            raise e
+            self.db.flush()
+            self.analytics_repository.mark_consultations([consultation.id])
+
+        self.db.refresh(consultation)
+        if prescription_id:
+            PrescriptionRepository(self.db).publish(prescription_id, 'created')
+        if consultation_queue:
+            invalidate_queue_detail(consultation_queue.id)
+        # the new case is listed on every other queue entry of the client
+        invalidate_client_queue_details(self.client_of_queue(consultation.queue_id))
+        return ConsultationDTO.from_orm(consultation)
 
     def update(self, consultation_id: int, consultation_data: ConsultationUpdate) -> Optional[ConsultationDTO]:
         consultation = self.db.query(Consultations).filter(Consultations.id == consultation_id).first()
@@ -208,14 +222,25 @@ class ConsultationsRepository:
             return None
         for field, value in consultation_data.dict(exclude_unset=True).items():
             setattr(consultation, field, value)
+        self.analytics_repository.mark_consultations([consultation_id])
         self.db.commit()
         self.db.refresh(consultation)
+        invalidate_client_queue_details(self.client_of_queue(consultation.queue_id))
         return ConsultationDTO.from_orm(consultation)
 
     def delete(self, consultation_id: int) -> bool:
         consultation = self.db.query(Consultations).filter(Consultations.id == consultation_id).first()
         if not consultation:
             return False
+        client_id = self.client_of_queue(consultation.queue_id)
+        self.analytics_repository.mark_consultations([consultation_id])
         self.db.delete(consultation)
         self.db.commit()
+        invalidate_client_queue_details(client_id)
         return True
+
+    def client_of_queue(self, queue_id: int) -> Optional[int]:
+        return self.db.query(ServiceBooking.client_id).select_from(ConsultationQueue) \
+            .join(ServiceBookingDetail, ServiceBookingDetail.id == ConsultationQueue.booking_id) \
+            .join(ServiceBooking, ServiceBooking.id == ServiceBookingDetail.booking_id) \
+            .filter(ConsultationQueue.id == queue_id).scalar()
@@ -0,0 +1,53 @@
+import json
+import logging
+from typing import Dict
+
+from fastapi.encoders import jsonable_encoder
+from redis import RedisError
+
+from cache.redis import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DETAIL_KEY = "consultation:{queue_id}"
+QUEUE_DETAIL_TTL = 900
+# queue entries of a client whose detail is cached, so they can be dropped when the client or their cases change
+CLIENT_QUEUE_DETAILS_KEY = "consultation:client:{client_id}:queues"
+
+
+def cache_queue_details(details: Dict[int, object], redis=None):
+    """Cache queue details and index each one under its client. Redis errors are left to the caller."""
+    pipeline = (redis or get_redis_client()).pipeline()
+    for queue_id, detail in details.items():
+        data = jsonable_encoder(detail)
+        pipeline.set(QUEUE_DETAIL_KEY.format(queue_id=queue_id), json.dumps(data), ex=QUEUE_DETAIL_TTL)
+        client_id = (data.get('client') or {}).get('id')
+        if client_id:
+            client_key = CLIENT_QUEUE_DETAILS_KEY.format(client_id=client_id)
+            pipeline.sadd(client_key, queue_id)
+            pipeline.expire(client_key, QUEUE_DETAIL_TTL)
+    pipeline.execute()
+
+
+def invalidate_queue_detail(queue_id: int, redis=None):
+    try:
+        (redis or get_redis_client()).delete(QUEUE_DETAIL_KEY.format(queue_id=queue_id))
+    except RedisError:
+        logger.warning(f"Could not invalidate cached detail of queue {queue_id}")
+
+
+def invalidate_client_queue_details(client_id: int, redis=None):
+    """Drop the cached detail of every queue entry of a client."""
+    if not client_id:
+        return
+    redis = redis or get_redis_client()
+    client_key = CLIENT_QUEUE_DETAILS_KEY.format(client_id=client_id)
+    try:
+        queue_ids = redis.smembers(client_key)
+        keys = [
+            QUEUE_DETAIL_KEY.format(queue_id=queue_id.decode('utf-8') if isinstance(queue_id, bytes) else queue_id)
+            for queue_id in queue_ids
+        ]
+        redis.delete(client_key, *keys)
+    except RedisError:
+        logger.warning(f"Could not invalidate cached queue details of client {client_id}")
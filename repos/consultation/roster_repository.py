@@ -0,0 +1,167 @@
+import logging
+import time
+from typing import Dict, List, Optional
+
+from redis import RedisError
+from sqlalchemy.orm import Session
+
+from cache.redis import get_redis_client
+from dtos.auth import UserDTO
+from dtos.consultant import ConsultantDTO, SpecialismDTO
+from models.auth import User
+from models.client import Person
+from models.consultation import Specialist, SpecialistSpecialization, Specialism
+
+logger = logging.getLogger(__name__)
+
+# bumped on every consultant change so other workers drop their rosters
+ROSTER_VERSION_KEY = "consultation:roster:version"
+# how long a worker trusts its roster before checking the shared version again
+VERSION_CHECK_SECONDS = 5
+# names live on people, whose edits do not invalidate the roster, so it is reloaded now and then
+ROSTER_MAX_AGE = 600
+
+# specialist id -> consultant, user id -> specialist id, specialism id -> specialist ids, of this worker
+_roster = {'consultants': {}, 'by_user': {}, 'by_specialism': {}}
+# version is False until the shared version has been read once
+_state = {'loaded': False, 'loaded_at': 0.0, 'version': False, 'checked_at': 0.0}
+
+
+def invalidate_roster(redis=None):
+    """Drop this worker's roster and tell the other workers to drop theirs."""
+    _state['loaded'] = False
+    try:
+        _state['version'] = (redis or get_redis_client()).incr(ROSTER_VERSION_KEY)
+    except RedisError:
+        logger.warning("Could not publish consultant roster invalidation")
+
+
+class RosterRepository:
+    """
+    The consultant roster: every specialist with their user's name, title and specializations.
+
+    Every worker keeps the whole roster in memory, loaded with one query on first use and dropped
+    whenever a consultant is added or updated, so resolving consultants on a board, a list of
+    prescriptions or a queue entry does not touch the database.
+    """
+
+    def __init__(self, db_session: Session, redis=None):
+        self.db_session = db_session
+        self.redis = redis
+
+    def warm(self) -> int:
+        rs = self.db_session.query(
+            Specialist.id,
+            Specialist.title,
+            User.id.label('user_id'),
+            User.username,
+            User.status,
+            User.created_at,
+            Person.id.label('person_id'),
+            Person.title.label('person_title'),
+            Person.first_name,
+            Person.last_name,
+            Specialism.id.label('specialism_id'),
+            Specialism.department,
+            Specialism.specialist_title
+        ).select_from(Specialist) \
+            .outerjoin(User, User.id == Specialist.user_id) \
+            .outerjoin(Person, Person.id == User.person_id) \
+            .outerjoin(SpecialistSpecialization, (SpecialistSpecialization.specialist_id == Specialist.id) &
+                       SpecialistSpecialization.deleted_at.is_(None)) \
+            .outerjoin(Specialism, Specialism.id == SpecialistSpecialization.specialism_id) \
+            .order_by(Specialist.id, Specialism.id).all()
+
+        consultants, by_user, by_specialism = {}, {}, {}
+        for row in rs:
+            consultant = consultants.get(row.id)
+            if consultant is None:
+                consultant = consultants[row.id] = {
+                    'id': row.id,
+                    'title': row.title,
+                    'user': {
+                        'id': row.user_id,
+                        'username': row.username,
+                        'title': row.person_title,
+                        'first_name': row.first_name,
+                        'last_name': row.last_name,
+                        'person_id': row.person_id,
+                        'status': row.status,
+                        'created_at': row.created_at.strftime("%Y-%m-%d %H:%M:%S") if row.created_at else None
+                    } if row.user_id else None,
+                    'specializations': []
+                }
+                if row.user_id:
+                    by_user[row.user_id] = row.id
+            if row.specialism_id is not None:
+                consultant['specializations'].append(
+                    SpecialismDTO(id=row.specialism_id, department=row.department,
+                                  specialist_title=row.specialist_title)
+                )
+                by_specialism.setdefault(row.specialism_id, []).append(row.id)
+
+        _roster.update(consultants=consultants, by_user=by_user, by_specialism=by_specialism)
+        _state['loaded'] = True
+        _state['loaded_at'] = time.monotonic()
+        return len(consultants)
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - _state['loaded_at'] > ROSTER_MAX_AGE:
+            _state['loaded'] = False
+        if now - _state['checked_at'] < VERSION_CHECK_SECONDS:
+            return
+        _state['checked_at'] = now
+        try:
+            version = (self.redis or get_redis_client()).get(ROSTER_VERSION_KEY)
+        except RedisError:
+            return
+        version = int(version) if version is not None else None
+        if version != _state['version'] and _state['version'] is not False:
+            _state['loaded'] = False
+        _state['version'] = version
+
+    def roster(self) -> dict:
+        self._check_version()
+        if not _state['loaded']:
+            self.warm()
+        return _roster
+
+    def get(self, consultant_id: int) -> Optional[dict]:
+        return self.roster()['consultants'].get(consultant_id)
+
+    def get_many(self, consultant_ids) -> Dict[int, dict]:
+        consultants = self.roster()['consultants']
+        return {consultant_id: consultants[consultant_id]
+                for consultant_id in consultant_ids if consultant_id in consultants}
+
+    def consultant_of_user(self, user_id: int) -> Optional[int]:
+        return self.roster()['by_user'].get(user_id)
+
+    def consultants_of_specialism(self, specialism_id: int) -> List[int]:
+        return self.roster()['by_specialism'].get(specialism_id, [])
+
+    def list(self, skip: int = 0, limit: int = 100, specialism_id: Optional[int] = None) -> List[dict]:
+        roster = self.roster()
+        consultant_ids = roster['by_specialism'].get(specialism_id, []) if specialism_id \
+            else sorted(roster['consultants'])
+        return [roster['consultants'][consultant_id] for consultant_id in consultant_ids[skip:skip + limit]]
+
+    @staticmethod
+    def consultant_dto(consultant: dict) -> ConsultantDTO:
+        user = consultant['user'] or {}
+        return ConsultantDTO(
+            id=consultant['id'],
+            user=UserDTO(
+                id=user.get('id'),
+                username=user.get('username') or '',
+                title=user.get('title'),
+                first_name=user.get('first_name') or '',
+                last_name=user.get('last_name') or '',
+                person_id=user.get('person_id'),
+                status=user.get('status'),
+                created_at=user.get('created_at')
+            ),
+            title=consultant['title'] or '',
+            specializations=list(consultant['specializations'])
+        )
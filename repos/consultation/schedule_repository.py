@@ -0,0 +1,237 @@
+import json
+import logging
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Iterable
+
+from fastapi.encoders import jsonable_encoder
+from redis import RedisError
+from sqlalchemy.orm import Session
+
+from cache.redis import get_redis_client
+from dtos.consultation import InHoursDTO
+from dtos.services import BusinessServiceDTO, PriceCodeDTO
+from models.consultation import InHours, InHourFrequency, ConsultationQueue
+from models.lab.lab import QueueStatus
+from models.services.services import BusinessServices, PriceCode
+
+logger = logging.getLogger(__name__)
+
+# bumped whenever a consultant's in-hours change, so every cached week of theirs is dropped at once
+SCHEDULE_VERSION_KEY = "consultation:schedule:{consultant_id}:version"
+SCHEDULE_WEEK_KEY = "consultation:schedule:{consultant_id}:{version}:{week}"
+SCHEDULE_TTL = 7 * 24 * 3600
+MAX_RANGE_DAYS = 92
+
+
+def parse_day(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(value.strip()).date()
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid date format: {value}")
+
+
+def week_of(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def occurs_on(frequency: InHourFrequency, first_day: date, day: date) -> bool:
+    if day < first_day:
+        return False
+    if frequency in (InHourFrequency.Daily, InHourFrequency.EveryDayOfTheWeek):
+        return True
+    if frequency == InHourFrequency.Weekly:
+        return day.weekday() == first_day.weekday()
+    if frequency == InHourFrequency.EveryWeekDay:
+        return day.weekday() < 5
+    if frequency == InHourFrequency.WeekendsOnly:
+        return day.weekday() >= 5
+    return day == first_day
+
+
+def slot_times(start: datetime, end: datetime, minutes: Optional[float]) -> List[datetime]:
+    """Start times of the appointments of a session; the whole session is one slot without a length."""
+    if not minutes or minutes <= 0 or end <= start:
+        return [start]
+    length = timedelta(minutes=minutes)
+    slots, slot = [], start
+    while slot + length <= end:
+        slots.append(slot)
+        slot += length
+    return slots or [start]
+
+
+def invalidate_schedule(consultant_id: int, redis=None):
+    """Drop every cached week of a consultant."""
+    try:
+        (redis or get_redis_client()).incr(SCHEDULE_VERSION_KEY.format(consultant_id=consultant_id))
+    except RedisError:
+        logger.warning(f"Could not invalidate cached schedule of consultant {consultant_id}")
+
+
+def invalidate_schedule_week(consultant_id: int, day, redis=None):
+    """Drop the cached week of a consultant that contains day."""
+    redis = redis or get_redis_client()
+    try:
+        version = redis.get(SCHEDULE_VERSION_KEY.format(consultant_id=consultant_id))
+        redis.delete(SCHEDULE_WEEK_KEY.format(consultant_id=consultant_id, version=int(version or 0),
+                                              week=week_of(parse_day(day)).isoformat()))
+    except RedisError:
+        logger.warning(f"Could not invalidate cached schedule week of consultant {consultant_id}")
+
+
+class ScheduleRepository:
+    """
+    Expansion of a consultant's recurring in-hours into dated sessions with their free appointment slots.
+
+    The in-hours of a consultant, with their services and prices, are loaded in one query and the
+    bookings of the range in another; recurrences are expanded and booked slots removed in memory.
+    A session is split into appointments as long as its service's turnaround time in minutes.
+    Expanded weeks are cached in Redis per consultant.
+    """
+
+    def __init__(self, db_session: Session, redis=None):
+        self.db_session = db_session
+        self.redis = redis
+
+    def _redis(self):
+        return self.redis or get_redis_client()
+
+    def load_in_hours(self, consultant_id: int, last_day: date):
+        return self.db_session.query(
+            InHours.id,
+            InHours.start_time,
+            InHours.end_time,
+            InHours.specialist_id,
+            InHours.frequency,
+            InHours.service_id,
+            BusinessServices.ext_turn_around_time,
+            BusinessServices.visibility,
+            BusinessServices.serviceType,
+            PriceCode.id.label('price_code_id'),
+            PriceCode.service_price,
+            PriceCode.discount
+        ).select_from(InHours) \
+            .outerjoin(BusinessServices, BusinessServices.service_id == InHours.service_id) \
+            .outerjoin(PriceCode, PriceCode.id == BusinessServices.price_code) \
+            .filter(InHours.specialist_id == consultant_id,
+                    InHours.deleted_at.is_(None),
+                    InHours.start_time < last_day + timedelta(days=1)) \
+            .order_by(InHours.start_time, InHours.id).all()
+
+    def load_bookings(self, schedule_ids: Iterable[int], first_day: date, last_day: date) -> Dict[int, List[datetime]]:
+        schedule_ids = list(schedule_ids)
+        if not schedule_ids:
+            return {}
+        rs = self.db_session.query(ConsultationQueue.schedule_id, ConsultationQueue.consultation_time) \
+            .filter(ConsultationQueue.schedule_id.in_(schedule_ids),
+                    ConsultationQueue.deleted_at.is_(None),
+                    ConsultationQueue.status != QueueStatus.Cancelled,
+                    ConsultationQueue.consultation_time >= first_day,
+                    ConsultationQueue.consultation_time < last_day + timedelta(days=1)).all()
+        bookings = {}
+        for row in rs:
+            bookings.setdefault(row.schedule_id, []).append(row.consultation_time)
+        return bookings
+
+    @staticmethod
+    def business_service(row) -> Optional[BusinessServiceDTO]:
+        if row.service_id is None:
+            return None
+        return BusinessServiceDTO(
+            service_id=row.service_id,
+            price_code=PriceCodeDTO(id=row.price_code_id, service_price=row.service_price or 0,
+                                    discount=row.discount or 0) if row.price_code_id else None,
+            ext_turn_around_time=row.ext_turn_around_time or 0,
+            visibility=row.visibility,
+            serviceType=row.serviceType
+        )
+
+    def expand(self, consultant_id: int, first_day: date, last_day: date) -> List[dict]:
+        """Sessions between first_day and last_day (inclusive) that still have a free slot."""
+        in_hours = self.load_in_hours(consultant_id, last_day)
+        bookings = self.load_bookings([ih.id for ih in in_hours], first_day, last_day)
+        services = {ih.id: self.business_service(ih) for ih in in_hours}
+
+        sessions = []
+        day = first_day
+        while day <= last_day:
+            for ih in in_hours:
+                if not occurs_on(ih.frequency, ih.start_time.date(), day):
+                    continue
+                start = datetime.combine(day, ih.start_time.time())
+                end = datetime.combine(day, ih.end_time.time()) if ih.end_time else start
+                slots = slot_times(start, end, ih.ext_turn_around_time)
+
+                length = slots[1] - slots[0] if len(slots) > 1 else (end - start) or timedelta(seconds=1)
+                booked = {(booking - start) // length for booking in bookings.get(ih.id, ())
+                          if start <= booking < start + length * len(slots)}
+                free = [slot for index, slot in enumerate(slots) if index not in booked]
+                if not free:
+                    continue
+
+                sessions.append(jsonable_encoder(InHoursDTO(
+                    id=ih.id,
+                    specialist_id=ih.specialist_id,
+                    business_service=services[ih.id],
+                    frequency=ih.frequency,
+                    start_time=start.strftime("%Y-%m-%d %H:%M:%S"),
+                    end_time=end.strftime("%Y-%m-%d %H:%M:%S"),
+                    available_slots=[slot.strftime("%Y-%m-%d %H:%M:%S") for slot in free]
+                )))
+            day += timedelta(days=1)
+        return sessions
+
+    def get_weeks(self, consultant_id: int, weeks: List[date]) -> Dict[date, List[dict]]:
+        redis = self._redis()
+        try:
+            version = int(redis.get(SCHEDULE_VERSION_KEY.format(consultant_id=consultant_id)) or 0)
+            keys = [SCHEDULE_WEEK_KEY.format(consultant_id=consultant_id, version=version, week=week.isoformat())
+                    for week in weeks]
+            cached = redis.mget(keys)
+        except RedisError:
+            keys, cached = None, [None] * len(weeks)
+
+        expanded = {week: json.loads(value) for week, value in zip(weeks, cached) if value is not None}
+        missing = [week for week in weeks if week not in expanded]
+        if not missing:
+            return expanded
+
+        sessions = self.expand(consultant_id, missing[0], missing[-1] + timedelta(days=6))
+        for week in missing:
+            expanded[week] = [session for session in sessions
+                              if week_of(parse_day(session['start_time'])) == week]
+
+        if keys is not None:
+            try:
+                pipeline = redis.pipeline()
+                for week, key in zip(weeks, keys):
+                    if week in missing:
+                        pipeline.set(key, json.dumps(expanded[week]), ex=SCHEDULE_TTL)
+                pipeline.execute()
+            except RedisError:
+                logger.warning(f"Could not cache schedule of consultant {consultant_id}")
+        return expanded
+
+    def get_expanded_in_hours(self, consultant_id: int, start_date, end_date) -> List[InHoursDTO]:
+        first_day, last_day = parse_day(start_date), parse_day(end_date)
+        if first_day > last_day:
+            raise ValueError("start date is after end date")
+        if (last_day - first_day).days >= MAX_RANGE_DAYS:
+            raise ValueError(f"A schedule can cover at most {MAX_RANGE_DAYS} days")
+
+        weeks = []
+        week = week_of(first_day)
+        while week <= last_day:
+            weeks.append(week)
+            week += timedelta(days=7)
+
+        expanded = self.get_weeks(consultant_id, weeks)
+        return [
+            InHoursDTO(**session)
+            for week in weeks for session in expanded[week]
+            if first_day <= parse_day(session['start_time']) <= last_day
+        ]
@@ -0,0 +1,170 @@
+import logging
+import uuid
+from datetime import datetime
+from typing import Optional, Set
+
+from redis import RedisError
+from sqlalchemy.orm import Session
+
+from cache.redis import get_redis_client
+from dtos.consultation import SlotReservationDTO
+from models.consultation import InHours
+from repos.consultation.schedule_repository import ScheduleRepository, invalidate_schedule_week
+
+logger = logging.getLogger(__name__)
+
+FREE_SLOTS_KEY = "consultation:slots:{consultant_id}:{day}"
+# the days of a consultant that have a free slot set, so the sets can be dropped when in-hours change
+FREE_SLOTS_DAYS_KEY = "consultation:slots:{consultant_id}:days"
+SLOT_HOLD_KEY = "consultation:hold:{schedule_id}:{slot}"
+FREE_SLOTS_TTL = 24 * 3600
+HOLD_SECONDS = 300
+# kept in every free slot set so that a fully booked day is still known to be built
+BUILT = "-"
+
+# delete a hold only if it still belongs to the caller
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def parse_slot(value) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(microsecond=0)
+    try:
+        return datetime.fromisoformat(value.strip()).replace(microsecond=0)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid consultation time: {value}")
+
+
+def slot_member(schedule_id: int, slot: datetime) -> str:
+    return f"{schedule_id}|{slot.strftime('%Y-%m-%d %H:%M:%S')}"
+
+
+def invalidate_free_slots(consultant_id: int, redis=None):
+    """Drop every free slot set of a consultant; they are rebuilt from the schedule on the next check."""
+    redis = redis or get_redis_client()
+    days_key = FREE_SLOTS_DAYS_KEY.format(consultant_id=consultant_id)
+    try:
+        days = redis.smembers(days_key)
+        keys = [
+            FREE_SLOTS_KEY.format(consultant_id=consultant_id,
+                                  day=day.decode('utf-8') if isinstance(day, bytes) else day)
+            for day in days
+        ]
+        redis.delete(days_key, *keys)
+    except RedisError:
+        logger.warning(f"Could not invalidate free slots of consultant {consultant_id}")
+
+
+class SlotRepository:
+    """
+    Appointment slot availability and reservations.
+
+    The free slots of a consultant's day are kept as a Redis set built from the expanded schedule,
+    so checking a slot is one SISMEMBER. Booking is reserve then confirm: a reservation is a
+    short lived SET NX hold on the slot, and confirming inserts the queue entry, where the unique
+    index on (schedule_id, consultation_time) is the final guard against double booking.
+    """
+
+    def __init__(self, db_session: Session, redis=None):
+        self.db_session = db_session
+        self.redis = redis
+        self.schedule_repository = ScheduleRepository(db_session, redis)
+
+    def _redis(self):
+        return self.redis or get_redis_client()
+
+    def consultant_of(self, schedule_id: int) -> Optional[int]:
+        return self.db_session.query(InHours.specialist_id) \
+            .filter(InHours.id == schedule_id, InHours.deleted_at.is_(None)).scalar()
+
+    def load_free_slots(self, consultant_id: int, day) -> Set[str]:
+        return {
+            f"{session['id']}|{slot}"
+            for session in self.schedule_repository.expand(consultant_id, day, day)
+            for slot in session['available_slots']
+        }
+
+    def build_free_slots(self, consultant_id: int, day) -> Set[str]:
+        free = self.load_free_slots(consultant_id, day)
+        key = FREE_SLOTS_KEY.format(consultant_id=consultant_id, day=day.isoformat())
+        days_key = FREE_SLOTS_DAYS_KEY.format(consultant_id=consultant_id)
+        pipeline = self._redis().pipeline()
+        pipeline.delete(key)
+        pipeline.sadd(key, BUILT, *free)
+        pipeline.expire(key, FREE_SLOTS_TTL)
+        pipeline.sadd(days_key, day.isoformat())
+        pipeline.expire(days_key, FREE_SLOTS_TTL)
+        pipeline.execute()
+        return free
+
+    def is_free(self, consultant_id: int, schedule_id: int, slot: datetime) -> bool:
+        member = slot_member(schedule_id, slot)
+        key = FREE_SLOTS_KEY.format(consultant_id=consultant_id, day=slot.date().isoformat())
+        try:
+            pipeline = self._redis().pipeline()
+            pipeline.exists(key)
+            pipeline.sismember(key, member)
+            built, free = pipeline.execute()
+            if built:
+                return bool(free)
+            return member in self.build_free_slots(consultant_id, slot.date())
+        except RedisError:
+            return member in self.load_free_slots(consultant_id, slot.date())
+
+    def reserve(self, schedule_id: int, consultation_time) -> SlotReservationDTO:
+        """Hold a free slot for HOLD_SECONDS; pass the returned token when booking it."""
+        slot = parse_slot(consultation_time)
+        consultant_id = self.consultant_of(schedule_id)
+        if consultant_id is None:
+            raise ValueError(f"Consultant schedule {schedule_id} not found")
+        if not self.is_free(consultant_id, schedule_id, slot):
+            raise ValueError("This appointment slot is not available")
+
+        token = uuid.uuid4().hex
+        try:
+            held = self._redis().set(SLOT_HOLD_KEY.format(schedule_id=schedule_id, slot=slot.isoformat()), token,
+                                     nx=True, ex=HOLD_SECONDS)
+        except RedisError:
+            # without holds the unique index still rejects the second booking
+            held = True
+        if not held:
+            raise ValueError("This appointment slot is being booked by someone else")
+        return SlotReservationDTO(schedule_id=schedule_id, consultation_time=slot.strftime("%Y-%m-%d %H:%M:%S"),
+                                  token=token, expires_in=HOLD_SECONDS)
+
+    def confirm(self, schedule_id: int, consultation_time, token: str):
+        """Check that the caller still holds the slot before it is booked."""
+        slot = parse_slot(consultation_time)
+        try:
+            holder = self._redis().get(SLOT_HOLD_KEY.format(schedule_id=schedule_id, slot=slot.isoformat()))
+        except RedisError:
+            return
+        if holder is None:
+            raise ValueError("The reservation of this appointment slot has expired")
+        if (holder.decode('utf-8') if isinstance(holder, bytes) else holder) != token:
+            raise ValueError("This appointment slot is reserved by someone else")
+
+    def release(self, schedule_id: int, consultation_time, token: str) -> bool:
+        slot = parse_slot(consultation_time)
+        try:
+            return bool(self._redis().eval(RELEASE_SCRIPT, 1,
+                                           SLOT_HOLD_KEY.format(schedule_id=schedule_id, slot=slot.isoformat()), token))
+        except RedisError:
+            return False
+
+    def booked(self, schedule_id: int, consultation_time, token: str):
+        """Take a booked slot out of the free set and drop its hold. Call after commit."""
+        slot = parse_slot(consultation_time)
+        consultant_id = self.consultant_of(schedule_id)
+        try:
+            self._redis().srem(FREE_SLOTS_KEY.format(consultant_id=consultant_id, day=slot.date().isoformat()),
+                               slot_member(schedule_id, slot))
+        except RedisError:
+            logger.warning(f"Could not remove booked slot {slot} of schedule {schedule_id}")
+        self.release(schedule_id, slot, token)
+        invalidate_schedule_week(consultant_id, slot, redis=self.redis)
@@ -386,14 +386,16 @@ class LabRepository:
 
         return None
 
-    def get_result_summary_text(self, lab_service_id: int):
-
+    def get_result_summary_text(self, lab_service_id: int, limit: int = 100):
+        """The latest result comments of a service; the lab service detail embeds them, so they are bounded."""
         cols = [SampleResult.id, SampleResult.comment]
         rs = self.session.query(*cols) \
             .select_from(LabServicesQueue) \
             .join(CollectedSamples, CollectedSamples.queue_id == LabServicesQueue.id) \
             .join(SampleResult, CollectedSamples.id == SampleResult.sample_id) \
             .filter(LabServicesQueue.lab_service_id == lab_service_id) \
+            .order_by(SampleResult.id.desc()) \
+            .limit(limit) \
             .all()
         results = [row._asdict() for row in rs]
         return results
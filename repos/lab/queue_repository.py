@@ -10,6 +10,7 @@ from models.lab.lab import LabServicesQueue, Laboratory, QueueStatus, LabService
 from models.services.services import ServiceBooking, BusinessServices, ServiceBookingDetail
 from repos.auth_repository import UserRepository
 from repos.lab.experiment_repository import ExperimentRepository
+from repos.ledger_repository import LedgerRepository
 from repos.transaction_repository import TransactionRepository
 
 
@@ -344,9 +345,13 @@ class QueueRepository:
             # Delete booking information
 
             booking_id = lab_service_queue.booking_id
+            transaction_id = self.db_session.query(ServiceBooking.transaction_id) \
+                .join(ServiceBookingDetail, ServiceBookingDetail.booking_id == ServiceBooking.id) \
+                .filter(ServiceBookingDetail.id == booking_id).scalar()
             self.db_session.query(ServiceBookingDetail).filter(ServiceBookingDetail.id == booking_id).delete()
 
             self.db_session.delete(lab_service_queue)
+            LedgerRepository(self.db_session).refresh_balance(transaction_id)
             self.db_session.commit()
 
             return {
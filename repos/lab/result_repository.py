@@ -6,12 +6,14 @@ from sqlalchemy.orm import Session
 
 from dtos.auth import UserDTO
 from dtos.lab import SampleResultDTO, VerifiedResultEntryDTO, DateFilterDTO, LabResultLogCreate
+from models.auth import User
 from models.client import Person, Client
 from models.lab.lab import SampleResult, LabVerifiedResult, QueueStatus, ResultStatus, LabResultLog, CollectedSamples, \
     LabServicesQueue, LabService
 from models.services.services import ServiceBooking, BookingStatus, ServiceBookingDetail, BusinessServices
 from models.transaction import Transaction, TransactionType
 from repos.auth_repository import UserRepository
+from repos.base_repository import stream
 from repos.client.client_repository import ClientRepository
 from repos.client.referral_repository import ReferralRepository
 from repos.lab.experiment_repository import ExperimentRepository
@@ -130,6 +132,61 @@ class ResultRepository:
             ServiceBooking.id.label("booking_id"),
         ]
 
+        res = self.filter_sample_results(cols, lab_id, search_keyword, dateFilter)
+
+        total = res.count()
+        res = res.limit(limit).offset(skip).all()
+
+        response = []
+
+        for r in res:
+            sample_info = self.queue_repository.get_collected_sample_by_queue_id(r.queue_id)
+            user = self.user_repository.get_user_by_id(r.created_by)
+            response.append(
+                {
+                    'id': r.id,
+                    'booking_id': r.booking_id,
+                    'sample': sample_info,  # has results
+                    'investigation': r.lab_service_name,
+                    'sample_id': r.sample_id,
+                    'comment': r.comment,
+                    'client_first_name': r.client_first_name,
+                    'client_last_name': r.client_last_name,
+                    'created_at': r.created_at,
+                    'created_by': self.user_repository.get_user(user.username),
+                }
+            )
+        return {
+            'data': response,
+            'total': total
+        }
+
+    def export_sample_results(self, lab_id=0, search_keyword: str = '', dateFilter: DateFilterDTO = None,
+                              batch_size: int = 1000):
+        """Yields sample result rows for export, read through a server-side cursor."""
+        cols = [
+            SampleResult.id,
+            ServiceBooking.id.label("booking_id"),
+            LabService.lab_service_name,
+            Person.first_name.label('client_first_name'),
+            Person.last_name.label('client_last_name'),
+            CollectedSamples.id.label("sample_id"),
+            CollectedSamples.sample_type,
+            CollectedSamples.container_label,
+            CollectedSamples.collected_at,
+            LabServicesQueue.status,
+            SampleResult.comment,
+            SampleResult.created_at,
+            User.username.label('created_by')
+        ]
+        res = self.filter_sample_results(cols, lab_id, search_keyword, dateFilter) \
+            .outerjoin(User, User.id == SampleResult.created_by) \
+            .order_by(SampleResult.created_at.desc())
+
+        for row in stream(res, batch_size):
+            yield tuple(row)
+
+    def filter_sample_results(self, cols, lab_id=0, search_keyword: str = '', dateFilter: DateFilterDTO = None):
         # initialize base query
         base_query = None
 
@@ -168,34 +225,14 @@ class ResultRepository:
             if dateFilter['last_date']:
                 res = res.filter(SampleResult.created_at <= dateFilter['last_date'])
 
-        total = res.count()
-        res = res.limit(limit).offset(skip).all()
+        return res
 
-        response = []
-
-        for r in res:
-            sample_info = self.queue_repository.get_collected_sample_by_queue_id(r.queue_id)
-            user = self.user_repository.get_user_by_id(r.created_by)
-            response.append(
-                {
-                    'id': r.id,
-                    'booking_id': r.booking_id,
-                    'sample': sample_info,  # has results
-                    'investigation': r.lab_service_name,
-                    'sample_id': r.sample_id,
-                    'comment': r.comment,
-                    'client_first_name': r.client_first_name,
-                    'client_last_name': r.client_last_name,
-                    'created_at': r.created_at,
-                    'created_by': self.user_repository.get_user(user.username),
-                }
-            )
-        return {
-            'data': response,
-            'total': total
-        }
-
-    def compute_avg_processing_time(self, lab_service_id: int = 0, lab_id: int = 0, date_filter: DateFilterDTO = None):
+    def compute_avg_processing_time(self, lab_service_id: int = 0, lab_id: int = 0, date_filter: DateFilterDTO = None,
+                                    include_data: bool = False, skip: int = 0, limit: int = 100):
+        """
+        Turn around statistics for verified results. The rows are read through a server-side cursor and
+        folded into running totals; with include_data one page of the per booking rows is kept as well.
+        """
         cols = [
             ServiceBookingDetail.booking_id,
             LabServicesQueue.scheduled_at.label("booking_time"),
@@ -234,34 +271,36 @@ class ResultRepository:
                 rs = rs.filter(LabServicesQueue.scheduled_at <= last_date)
 
         # ddd approval time
-        rs = rs.all()
-
         total_booking_to_verification = 0
         total_booking_to_collection = 0
         total_booking_to_processing = 0
-        count = len(rs)
-
-        if count == 0:
-            est_turn_around_time = 0
-        else:
-            est_turn_around_time = rs[0].ext_turn_around_time
+        count = 0
+        est_turn_around_time = 0
 
         bookings_completed_before_est_delivery = 0
         bookings_completed_after_est_delivery = 0
 
+        if include_data:
+            # a stable order for the page of rows
+            rs = rs.order_by(LabServicesQueue.scheduled_at, ServiceBookingDetail.booking_id)
+
         data = []
-        for record in rs:
-            data.append(
-                {
-                    'transaction_id': record.transaction_id,
-                    'booking_id': record.booking_id,
-                    'booking_time': record.booking_time,
-                    'collected_at': record.collected_at,
-                    'result_processed_at': record.result_processed_at,
-                    'verified_at': record.verified_at,
-                    'lab_service_name': record.lab_service_name
-                }
-            )
+        for record in stream(rs):
+            if count == 0:
+                est_turn_around_time = record.ext_turn_around_time
+            count += 1
+            if include_data and skip < count <= skip + limit:
+                data.append(
+                    {
+                        'transaction_id': record.transaction_id,
+                        'booking_id': record.booking_id,
+                        'booking_time': record.booking_time,
+                        'collected_at': record.collected_at,
+                        'result_processed_at': record.result_processed_at,
+                        'verified_at': record.verified_at,
+                        'lab_service_name': record.lab_service_name
+                    }
+                )
             booking_time = record.booking_time
             collected_at = record.collected_at
             result_processed_at = record.result_processed_at
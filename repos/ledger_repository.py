@@ -0,0 +1,231 @@
+from typing import List, Optional
+
+from sqlalchemy import func, and_
+from sqlalchemy.orm import Session
+
+from dtos.transaction import TransactionBalanceDTO, PaymentJournalDTO
+from models.client import Client, Person
+from models.lab.lab import LabBundleCollection
+from models.services.services import ServiceBooking, ServiceBookingDetail, PriceCode, Bundles
+from models.transaction import Transaction, Payments, PackageTransaction, PaymentJournal, TransactionBalance, \
+    JournalEntryType
+
+
+class LedgerRepository:
+    """
+    Keeps the payment journal and the per transaction balance snapshot in step.
+
+    None of the write methods commit; they are called from inside the payment repository
+    so that the payment row, its journal entry and the balance land in the same transaction.
+    Discounts on price codes, bundles and transactions are stored as percentages.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def record_payment(self, payment: Payments) -> PaymentJournal:
+        return self._append(payment, payment.amount, JournalEntryType.Payment)
+
+    def record_reversal(self, payment: Payments, amount: float, payment_method=None) -> PaymentJournal:
+        return self._append(payment, -amount, JournalEntryType.Reversal, payment_method)
+
+    def _append(self, payment: Payments, amount: float, entry_type: JournalEntryType,
+                payment_method=None) -> PaymentJournal:
+        entry = PaymentJournal(
+            payment_id=payment.id,
+            transaction_id=payment.transaction_id,
+            user_id=payment.user_id,
+            entry_type=entry_type,
+            amount=amount or 0,
+            payment_method=payment_method or payment.payment_method
+        )
+        self.db_session.add(entry)
+        self.apply_to_balance(payment.transaction_id, amount or 0)
+        return entry
+
+    def open_balance(self, transaction_id: int) -> TransactionBalance:
+        """
+        Lock the snapshot row for the transaction, creating it from existing payments if needed.
+
+        Must be called before a payment row is added or changed so the first snapshot reflects
+        the state the following journal entries are applied to.
+        """
+        balance = self.db_session.query(TransactionBalance) \
+            .filter(TransactionBalance.transaction_id == transaction_id) \
+            .with_for_update().one_or_none()
+
+        if balance is None:
+            balance = TransactionBalance(transaction_id=transaction_id, total_paid=self.get_total_paid(transaction_id))
+            self.db_session.add(balance)
+            self.db_session.flush()
+        return balance
+
+    def apply_to_balance(self, transaction_id: int, paid_delta: float) -> Optional[TransactionBalance]:
+        if transaction_id is None:
+            return None
+
+        balance = self.open_balance(transaction_id)
+        balance.total_paid = (balance.total_paid or 0) + paid_delta
+
+        # Bookings can be added to a transaction after the first payment, so the bill is re-read on every write
+        billing = self.compute_billing(transaction_id)
+        balance.client_id = billing['client_id']
+        balance.total_billed = billing['total_billed']
+        balance.discount = billing['discount']
+        balance.bundle_discount = billing['bundle_discount']
+        balance.outstanding = billing['total_billed'] - billing['discount'] - billing['bundle_discount'] \
+            - balance.total_paid
+        self.db_session.flush()
+        return balance
+
+    def refresh_balance(self, transaction_id: Optional[int]) -> Optional[TransactionBalance]:
+        """
+        Re-price the snapshot after the bill changed: a booking added or removed, a bundle bought or
+        the transaction discount edited. Creates the snapshot, with nothing paid, on the first booking.
+        """
+        self.db_session.flush()
+        return self.apply_to_balance(transaction_id, 0)
+
+    def get_total_paid(self, transaction_id: int) -> float:
+        return self.db_session.query(func.coalesce(func.sum(Payments.amount), 0)) \
+            .filter(Payments.transaction_id == transaction_id).scalar()
+
+    def compute_billing(self, transaction_id: int) -> dict:
+        lines = self.db_session.query(
+            func.min(ServiceBooking.client_id).label('client_id'),
+            func.coalesce(func.sum(PriceCode.service_price), 0).label('total_billed'),
+            func.coalesce(func.sum(PriceCode.service_price * func.coalesce(PriceCode.discount, 0) / 100), 0)
+            .label('line_discount')
+        ).select_from(ServiceBookingDetail) \
+            .join(ServiceBooking, ServiceBooking.id == ServiceBookingDetail.booking_id) \
+            .join(PriceCode, PriceCode.id == ServiceBookingDetail.price_code) \
+            .filter(ServiceBooking.transaction_id == transaction_id).one()
+
+        bundle_discount = self.db_session.query(
+            func.coalesce(func.sum(PriceCode.service_price * func.coalesce(Bundles.discount, 0) / 100), 0)
+        ).select_from(PackageTransaction) \
+            .join(Bundles, Bundles.id == PackageTransaction.package_id) \
+            .join(LabBundleCollection, LabBundleCollection.bundles_id == Bundles.id) \
+            .join(ServiceBookingDetail, ServiceBookingDetail.service_id == LabBundleCollection.lab_service_id) \
+            .join(ServiceBooking, and_(ServiceBooking.id == ServiceBookingDetail.booking_id,
+                                       ServiceBooking.transaction_id == PackageTransaction.transaction_id)) \
+            .join(PriceCode, PriceCode.id == ServiceBookingDetail.price_code) \
+            .filter(PackageTransaction.transaction_id == transaction_id).scalar()
+
+        transaction_discount = self.db_session.query(func.coalesce(Transaction.discount, 0)) \
+            .filter(Transaction.id == transaction_id).scalar() or 0
+
+        client_id = lines.client_id or self.db_session.query(func.min(ServiceBooking.client_id)) \
+            .filter(ServiceBooking.transaction_id == transaction_id).scalar()
+
+        total_billed = float(lines.total_billed)
+        return {
+            'client_id': client_id,
+            'total_billed': total_billed,
+            'discount': float(lines.line_discount) + total_billed * transaction_discount / 100,
+            'bundle_discount': float(bundle_discount)
+        }
+
+    def rebuild_balance(self, transaction_id: int) -> TransactionBalance:
+        """Recompute a snapshot from the payments table, e.g. after a price code was edited."""
+        balance = self.open_balance(transaction_id)
+        balance.total_paid = self.get_total_paid(transaction_id)
+        return self.apply_to_balance(transaction_id, 0)
+
+    def rebuild_all_balances(self, batch_size: int = 500) -> int:
+        """Backfill snapshots for every transaction, committing once per batch."""
+        count = 0
+        last_id = 0
+        while True:
+            ids = self.db_session.query(Transaction.id).filter(Transaction.id > last_id) \
+                .order_by(Transaction.id).limit(batch_size).all()
+            if not ids:
+                break
+            for row in ids:
+                self.rebuild_balance(row.id)
+            self.db_session.commit()
+            count += len(ids)
+            last_id = ids[-1].id
+        return count
+
+    def get_balance(self, transaction_id: int) -> Optional[TransactionBalanceDTO]:
+        balance = self.db_session.query(TransactionBalance) \
+            .filter(TransactionBalance.transaction_id == transaction_id).one_or_none()
+        return TransactionBalanceDTO.from_orm(balance) if balance else None
+
+    def get_journal(self, transaction_id: int) -> List[PaymentJournalDTO]:
+        entries = self.db_session.query(PaymentJournal) \
+            .filter(PaymentJournal.transaction_id == transaction_id) \
+            .order_by(PaymentJournal.entry_time).all()
+        return [PaymentJournalDTO.from_orm(entry) for entry in entries]
+
+    def billed_query(self, transaction_ids=None):
+        """Bill of each transaction priced from its bookings, one row per transaction."""
+        rs = self.db_session.query(
+            ServiceBooking.transaction_id,
+            func.min(ServiceBooking.client_id).label('client_id'),
+            func.coalesce(func.sum(PriceCode.service_price), 0).label('total_billed'),
+            func.coalesce(func.sum(PriceCode.service_price * func.coalesce(PriceCode.discount, 0) / 100), 0)
+            .label('line_discount')
+        ).select_from(ServiceBookingDetail) \
+            .join(ServiceBooking, ServiceBooking.id == ServiceBookingDetail.booking_id) \
+            .join(PriceCode, PriceCode.id == ServiceBookingDetail.price_code)
+        if transaction_ids is not None:
+            rs = rs.filter(ServiceBooking.transaction_id.in_(transaction_ids))
+        return rs.group_by(ServiceBooking.transaction_id)
+
+    def bundle_discount_query(self, transaction_ids=None):
+        """Bundle discount of each transaction that bought a bundle."""
+        rs = self.db_session.query(
+            PackageTransaction.transaction_id,
+            func.sum(PriceCode.service_price * func.coalesce(Bundles.discount, 0) / 100).label('bundle_discount')
+        ).select_from(PackageTransaction) \
+            .join(Bundles, Bundles.id == PackageTransaction.package_id) \
+            .join(LabBundleCollection, LabBundleCollection.bundles_id == Bundles.id) \
+            .join(ServiceBookingDetail, ServiceBookingDetail.service_id == LabBundleCollection.lab_service_id) \
+            .join(ServiceBooking, and_(ServiceBooking.id == ServiceBookingDetail.booking_id,
+                                       ServiceBooking.transaction_id == PackageTransaction.transaction_id)) \
+            .join(PriceCode, PriceCode.id == ServiceBookingDetail.price_code)
+        if transaction_ids is not None:
+            rs = rs.filter(PackageTransaction.transaction_id.in_(transaction_ids))
+        return rs.group_by(PackageTransaction.transaction_id)
+
+    def get_outstanding_balances(self, skip: int = 0, limit: int = 20, client_id: int = 0):
+        """Billed transactions that are not fully paid, one row per transaction, read from the snapshots."""
+        rs = self.db_session.query(
+            TransactionBalance,
+            Person.first_name,
+            Person.last_name
+        ).select_from(TransactionBalance) \
+            .join(Client, Client.id == TransactionBalance.client_id) \
+            .join(Person, Person.id == Client.person_id) \
+            .filter(TransactionBalance.outstanding > 0)
+
+        if client_id != 0:
+            rs = rs.filter(TransactionBalance.client_id == client_id)
+
+        total, volume = rs.with_entities(
+            func.count(TransactionBalance.transaction_id),
+            func.coalesce(func.sum(TransactionBalance.outstanding), 0)
+        ).one()
+
+        balances = rs.order_by(TransactionBalance.outstanding.desc(), TransactionBalance.transaction_id) \
+            .offset(skip).limit(limit).all()
+        return {
+            'data': [
+                {
+                    'transaction_id': balance.transaction_id,
+                    'client_id': balance.client_id,
+                    'client_first_name': first_name,
+                    'client_last_name': last_name,
+                    'total_billed': balance.total_billed,
+                    'discount': balance.discount,
+                    'bundle_discount': balance.bundle_discount,
+                    'total_paid': balance.total_paid,
+                    'outstanding': balance.outstanding
+                }
+                for balance, first_name, last_name in balances
+            ],
+            'total': total,
+            'volume': volume
+        }
@@ -11,6 +11,7 @@ from models.services.services import ServiceBooking
 from models.transaction import Payments, ServiceType
 from repos.auth_repository import UserRepository
 from repos.client.client_repository import ClientRepository
+from repos.ledger_repository import LedgerRepository
 
 
 class PaymentRepository:
@@ -20,12 +21,21 @@ class PaymentRepository:
         # usr = get_current_user()
 
         self.user_id = 1  # usr.id
+        self.ledger_repository = LedgerRepository(db_session)
 
     def create_payment(self, payment: PaymentDTO) -> PaymentDTO:
         payment.user_id = self.user_id
         db_payment = Payments(**payment.dict())
-        self.db_session.add(db_payment)
-        self.db_session.commit()
+        try:
+            if db_payment.transaction_id is not None:
+                self.ledger_repository.open_balance(db_payment.transaction_id)
+            self.db_session.add(db_payment)
+            self.db_session.flush()
+            self.ledger_repository.record_payment(db_payment)
+            self.db_session.commit()
+        except Exception as e:
+            self.db_session.rollback()
+            raise e
         self.db_session.refresh(db_payment)
 
         return PaymentDTO(
@@ -46,17 +56,40 @@ class PaymentRepository:
     def update_payment(self, payment_id: int, payment: PaymentDTO):
         db_payment = self.db_session.query(Payments).filter(Payments.id == payment_id).first()
         if db_payment:
-            for key, value in payment.dict().items():
-                setattr(db_payment, key, value)
-            self.db_session.commit()
+            try:
+                # journal is append-only: reverse the old entry, then record the edited payment
+                if db_payment.transaction_id is not None:
+                    self.ledger_repository.open_balance(db_payment.transaction_id)
+                self.ledger_repository.record_reversal(db_payment, db_payment.amount)
+                # user_id and payment_time are set at backend only; payment_date only moves when sent
+                for key, value in payment.dict(exclude_unset=True, exclude={'user_id', 'payment_time'}).items():
+                    if key == 'payment_date' and value is None:
+                        continue
+                    setattr(db_payment, key, value)
+                if db_payment.transaction_id is not None:
+                    # the payment may have been moved to another transaction
+                    self.ledger_repository.open_balance(db_payment.transaction_id)
+                self.db_session.flush()
+                self.ledger_repository.record_payment(db_payment)
+                self.db_session.commit()
+            except Exception as e:
+                self.db_session.rollback()
+                raise e
             self.db_session.refresh(db_payment)
         return db_payment
 
     def delete_payment(self, payment_id: int):
         db_payment = self.db_session.query(Payments).filter(Payments.id == payment_id).first()
         if db_payment:
-            self.db_session.delete(db_payment)
-            self.db_session.commit()
+            try:
+                if db_payment.transaction_id is not None:
+                    self.ledger_repository.open_balance(db_payment.transaction_id)
+                self.ledger_repository.record_reversal(db_payment, db_payment.amount)
+                self.db_session.delete(db_payment)
+                self.db_session.commit()
+            except Exception as e:
+                self.db_session.rollback()
+                raise e
         return db_payment
 
     def get_payments_by_transaction_id(db: Session, transaction_id: int) -> List[Payments]:
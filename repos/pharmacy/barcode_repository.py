@@ -0,0 +1,117 @@
+import logging
+import time
+from typing import Optional
+
+from redis import RedisError
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from cache.redis import get_redis_client
+from models.pharmacy import Drug, DrugForm, PharmDrugFormPackage
+from models.product import Barcode, Product
+from models.sales import SalesPriceCode
+from repos.pharmacy.stock_repository import StockRepository
+
+logger = logging.getLogger(__name__)
+
+# bumped on every drug change so other workers drop their barcode maps
+BARCODE_VERSION_KEY = "pharmacy:barcodes:version"
+# how long a worker trusts its map before checking the shared version again
+VERSION_CHECK_SECONDS = 5
+
+# barcode -> package, drug and price of this worker
+_barcodes = {}
+# version is False until the shared version has been read once
+_state = {'loaded': False, 'version': False, 'checked_at': 0.0}
+
+
+def invalidate_barcodes(redis=None):
+    """Drop this worker's barcode map and tell the other workers to drop theirs."""
+    _barcodes.clear()
+    _state['loaded'] = False
+    try:
+        _state['version'] = (redis or get_redis_client()).incr(BARCODE_VERSION_KEY)
+    except RedisError:
+        logger.warning("Could not publish barcode map invalidation")
+
+
+class BarcodeRepository:
+    """
+    Barcode to drug package resolution for the dispensing counter.
+
+    Every worker keeps the whole barcode map in memory: it is loaded with one query on startup
+    (or on first use) and dropped whenever a drug is written. A scan that hits the map does not
+    touch the database; a barcode not in the map is looked up and added.
+    """
+
+    def __init__(self, db_session: Session, redis=None):
+        self.db_session = db_session
+        self.redis = redis
+        self.stock_repository = StockRepository(db_session)
+
+    def _query(self):
+        return self.db_session.query(
+            Barcode.barcode,
+            PharmDrugFormPackage.id.label('package_id'),
+            PharmDrugFormPackage.package_container,
+            DrugForm.id.label('form_id'),
+            DrugForm.drug_form,
+            Drug.id.label('drug_id'),
+            Product.id.label('product_id'),
+            Product.brand_name,
+            Product.product_name,
+            SalesPriceCode.id.label('sales_price_code_id'),
+            SalesPriceCode.selling_price
+        ).select_from(Barcode) \
+            .join(PharmDrugFormPackage, PharmDrugFormPackage.id == Barcode.product_packaging_id) \
+            .join(DrugForm, DrugForm.id == PharmDrugFormPackage.form_id) \
+            .join(Drug, Drug.id == DrugForm.drug_id) \
+            .join(Product, Product.id == Drug.product_id) \
+            .outerjoin(SalesPriceCode, SalesPriceCode.id == PharmDrugFormPackage.sales_price_code_id) \
+            .filter(or_(Barcode.is_deleted.is_(None), Barcode.is_deleted == False),
+                    or_(PharmDrugFormPackage.is_deleted.is_(None), PharmDrugFormPackage.is_deleted == False),
+                    or_(Drug.is_deleted.is_(None), Drug.is_deleted == False))
+
+    def warm(self) -> int:
+        _barcodes.clear()
+        _barcodes.update({row.barcode: row._asdict() for row in self._query().all()})
+        _state['loaded'] = True
+        return len(_barcodes)
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - _state['checked_at'] < VERSION_CHECK_SECONDS:
+            return
+        _state['checked_at'] = now
+        try:
+            version = (self.redis or get_redis_client()).get(BARCODE_VERSION_KEY)
+        except RedisError:
+            return
+        version = int(version) if version is not None else None
+        if version != _state['version'] and _state['version'] is not False:
+            _barcodes.clear()
+            _state['loaded'] = False
+        _state['version'] = version
+
+    def lookup(self, barcode: str) -> Optional[dict]:
+        self._check_version()
+        if not _state['loaded']:
+            self.warm()
+
+        package = _barcodes.get(barcode)
+        if package is None:
+            row = self._query().filter(Barcode.barcode == barcode).first()
+            if row is not None:
+                package = _barcodes[barcode] = row._asdict()
+        return package
+
+    def scan(self, barcode: str, pharm_id: int = 0) -> Optional[dict]:
+        """Package, drug and price of a barcode, with the stock on hand when a pharmacy is given."""
+        package = self.lookup(barcode)
+        if package is None:
+            return None
+        if pharm_id == 0:
+            return package
+
+        stock = self.stock_repository.get_stock([package['drug_id']], pharm_id)
+        return package | {'stock': stock.get((package['drug_id'], package['package_id']), 0)}
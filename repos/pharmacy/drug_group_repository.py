@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 
 from dtos.pharmacy.drug import DrugGroupDTO
 from models.pharmacy import DrugGroup
+from repos.pharmacy.safety_repository import invalidate_drug_groups
 
 
 class DrugGroupRepository:
@@ -26,12 +27,14 @@ class DrugGroupRepository:
             setattr(db_group, key, value)
         self.db.commit()
         self.db.refresh(db_group)
+        invalidate_drug_groups()
         return db_group
 
     def delete(self, db_group: DrugGroup):
         # Soft delete assumed
         db_group.deleted = True
         self.db.commit()
+        invalidate_drug_groups()
 
     def get_by_parent_id(self, parent_id: int):
         return self.db.query(DrugGroup).filter(DrugGroup.parent_id == parent_id).all()
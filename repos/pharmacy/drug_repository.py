@@ -1,13 +1,18 @@
+from collections import defaultdict
 from typing import List, Optional
 
 from sqlalchemy.orm import Session
 
 from dtos.pharmacy.drug import DrugDTO, DrugInfoDTO, DrugGroupDTO, DrugFormDTO, PharmDrugPackageDTO
-from dtos.product import ProductDTO
+from dtos.product import ProductDTO, ProductPackageDTO
+from dtos.sales import SalesPriceCodeDTO
 from models.pharmacy import Drug, DrugGroupTag, DrugGroup, DrugForm, PharmDrugFormPackage
 from models.product import Product, ProductPackage, Barcode, PackageHierarchy
 from models.sales import SalesPriceCode
-from repos.base_repository import BaseRepository
+from repos.base_repository import BaseRepository, UnitOfWork
+from repos.pharmacy.barcode_repository import invalidate_barcodes
+from repos.pharmacy.drug_search_repository import DrugSearchRepository, invalidate_search_index
+from repos.pharmacy.safety_repository import invalidate_drug_profiles
 from repos.product_repository import ProductRepository
 from repos.sale_repository import SaleRepository
 
@@ -19,155 +24,196 @@ class DrugRepository:
         self.product_repository = ProductRepository(session)
         self.base_repository = BaseRepository(session)
         self.sales_repository = SaleRepository(session)
+        self.search_repository = DrugSearchRepository(session)
 
     def get(self, drug_id: int, include_deleted: bool = False) -> Optional[Drug]:
         query = self.session.query(Drug).filter(Drug.id == drug_id)
         if not include_deleted:
             query = query.filter(Drug.is_deleted == False)
-        return self.get_complete_drug_dto(
-            query.first())
+        drug = query.first()
+        return self.get_complete_drug_dto(drug) if drug else None
 
-    def get_drug_forms(self, drug_id: int):
-        forms = self.session.query(DrugForm).filter(DrugForm.drug_id == drug_id).all()
-        response = []
-        for form in forms:
-            # get packages associated to this form
-            form_packages = self.session.query(PharmDrugFormPackage).filter(
-                PharmDrugFormPackage.form_id == form.id).all()
-            packs = []
-            for pack in form_packages:
-                spc = self.sales_repository.get_sales_code(pack.sales_price_code_id)
-
-                packs.append(
-                    PharmDrugPackageDTO(
-                        id=pack.id,
-                        form_id=pack.form_id,
-                        sales_price_code=spc,
-                        # parent_package_id=pack.parent_id,
-                        package_container=pack.package_container,
-                        product_barcode=self.product_repository.get_product_barcode_by_package_id(pack.id),
-                    )
-                )
-
-            response.append(
-                DrugFormDTO(
-                    id=form.id,
-                    drug_id=form.drug_id,
-                    drug_form=form.drug_form,
-                    form_packages=packs
-                )
-            )
-        return response
+    def get_all(self, skip: int = 0, limit: int = 100, include_deleted: bool = False) -> List[DrugDTO]:
+        return self.get_page(skip, limit, include_deleted)['data']
 
-    def get_all(self, skip: int = 0, limit: int = 100, include_deleted: bool = False) -> List[Drug]:
+    def get_page(self, skip: int = 0, limit: int = 100, include_deleted: bool = False) -> dict:
         query = self.session.query(Drug)
         if not include_deleted:
             query = query.filter(Drug.is_deleted == False)
         count = query.count()
-        drugs = query.offset(skip).limit(limit).all()
-
-        res = []
-        for drug in drugs:
-            dg = self.get_complete_drug_dto(drug)
+        drugs = query.order_by(Drug.id).offset(skip).limit(limit).all()
+        return {'data': self.build_drug_dtos(drugs), 'total': count}
 
-            res.append(
-                dg
-            )
+    def get_complete_drug_dto(self, drug: Drug) -> DrugDTO:
+        return self.build_drug_dtos([drug])[0]
+
+    def build_drug_dtos(self, drugs: List[Drug]) -> List[DrugDTO]:
+        """
+        Assemble the drug -> forms -> packages -> price codes -> barcodes -> groups tree for a list of drugs
+        with one query per level, however many drugs, forms or packages there are.
+        """
+        if not drugs:
+            return []
+
+        drug_ids = [drug.id for drug in drugs]
+        product_ids = {drug.product_id for drug in drugs}
+
+        products = {
+            product.id: product
+            for product in self.session.query(Product).filter(Product.id.in_(product_ids)).all()
+        }
+        product_packages = self.session.query(ProductPackage) \
+            .filter(ProductPackage.product_id.in_(product_ids)).order_by(ProductPackage.id).all()
+        forms = self.session.query(DrugForm).filter(DrugForm.drug_id.in_(drug_ids)).order_by(DrugForm.id).all()
+        form_packages = self.session.query(PharmDrugFormPackage) \
+            .filter(PharmDrugFormPackage.form_id.in_([form.id for form in forms])) \
+            .order_by(PharmDrugFormPackage.id).all() if forms else []
+
+        price_code_ids = {pack.sales_price_code_id for pack in product_packages + form_packages}
+        price_codes = {
+            spc.id: SalesPriceCodeDTO(id=spc.id, selling_price=spc.selling_price, buying_price=spc.buying_price)
+            for spc in self.session.query(SalesPriceCode).filter(SalesPriceCode.id.in_(price_code_ids)).all()
+        } if price_code_ids else {}
+
+        # barcodes are keyed by package id for both product packages and drug form packages
+        barcodes = defaultdict(list)
+        package_ids = {pack.id for pack in product_packages + form_packages}
+        if package_ids:
+            for barcode in self.session.query(Barcode).filter(Barcode.product_packaging_id.in_(package_ids)) \
+                    .order_by(Barcode.id).all():
+                barcodes[barcode.product_packaging_id].append(barcode.barcode)
+
+        groups = defaultdict(list)
+        tagged = self.session.query(DrugGroupTag.drug_id, DrugGroup) \
+            .join(DrugGroup, DrugGroup.id == DrugGroupTag.group_id) \
+            .filter(DrugGroupTag.drug_id.in_(drug_ids)).order_by(DrugGroupTag.id).all()
+        for drug_id, group in tagged:
+            groups[drug_id].append(DrugGroupDTO.from_orm(group))
+
+        packages_by_product = defaultdict(list)
+        for pack in product_packages:
+            packages_by_product[pack.product_id].append(ProductPackageDTO(
+                id=pack.id,
+                product_id=pack.product_id,
+                package_container=pack.package_container,
+                sales_price_code_id=pack.sales_price_code_id,
+                sales_price_code=price_codes.get(pack.sales_price_code_id),
+                product_barcode=barcodes[pack.id]
+            ))
+
+        packages_by_form = defaultdict(list)
+        for pack in form_packages:
+            packages_by_form[pack.form_id].append(PharmDrugPackageDTO(
+                id=pack.id,
+                form_id=pack.form_id,
+                sales_price_code=price_codes.get(pack.sales_price_code_id),
+                package_container=pack.package_container,
+                product_barcode=barcodes[pack.id]
+            ))
+
+        forms_by_drug = defaultdict(list)
+        for form in forms:
+            forms_by_drug[form.drug_id].append(DrugFormDTO(
+                id=form.id,
+                drug_id=form.drug_id,
+                drug_form=form.drug_form,
+                form_packages=packages_by_form[form.id]
+            ))
 
-        return res
+        response = []
+        for drug in drugs:
+            dg = DrugInfoDTO(**drug.__dict__)
+            dg.drug_form = forms_by_drug[drug.id]
+            dg.drug_group = groups[drug.id]
 
-    def get_complete_drug_dto(self, drug: Drug) -> DrugDTO:
-        dg = DrugInfoDTO(**drug.__dict__)
-        dg.drug_form = self.get_drug_forms(drug.id)
-        product = ProductDTO.from_orm(self.product_repository.get(Product, drug.product_id))
-        product.product_package = self.product_repository.get_product_package(drug.product_id)
-        dg.drug_group = self.get_drug_groups(drug.id)
+            product = products.get(drug.product_id)
+            product = ProductDTO.from_orm(product) if product else None
+            if product:
+                product.product_package = packages_by_product[drug.product_id]
 
-        return DrugDTO(
+            response.append(
+                DrugDTO(
                     drug_info=dg,
                     product=product
                 )
+            )
+        return response
 
     def create(self, drug_data: DrugDTO) -> Drug:
-        product = drug_data.product.__dict__
+        """Create the product, drug, forms, packages, barcodes, hierarchy and group tags with one commit."""
+        with UnitOfWork(self.session):
+            product = drug_data.product.__dict__
 
-        product.pop('product_package')
-        product.pop('id')
-        product = self.product_repository.add(Product(**product))
+            product.pop('product_package')
+            product.pop('id')
+            product = self.product_repository.add(Product(**product))
 
-        drug = drug_data.drug_info.__dict__
-        drug['product_id'] = product.id
+            drug = drug_data.drug_info.__dict__
+            drug['product_id'] = product.id
 
-        groups = drug.pop('drug_group')
-        drug_form = drug.pop('drug_form')
-        drug = self.base_repository.add(Drug(**drug))
+            groups = drug.pop('drug_group')
+            drug_form = drug.pop('drug_form')
+            drug = self.base_repository.add(Drug(**drug))
 
-        for dg_form in drug_form:
             child = []
             parent = []
-
-            form = self.base_repository.add(
-                DrugForm(
-                    drug_form=dg_form.drug_form,
-                    drug_id=drug.id
+            barcodes = []
+            for dg_form in drug_form:
+                form = self.base_repository.add(
+                    DrugForm(
+                        drug_form=dg_form.drug_form,
+                        drug_id=drug.id
+                    )
                 )
-            )
 
-            for pack in dg_form.form_packages:
-                pc = pack.sales_price_code
-                pc = pc.__dict__
-                sales_price_code = self.base_repository.add(SalesPriceCode(**pc))
-
-                drug_package = self.base_repository.add(
+                sales_price_codes = self.base_repository.add_all(
+                    [SalesPriceCode(**pack.sales_price_code.__dict__) for pack in dg_form.form_packages]
+                )
+                drug_packages = self.base_repository.add_all([
                     PharmDrugFormPackage(
                         form_id=form.id,
                         package_container=pack.package_container,
                         sales_price_code_id=sales_price_code.id,
-                        # parent_package_id=form_package.parent_package_id
                     )
-                )
-
-                barcodes = pack.product_barcode
-
-                # # if pack is child
-                if pack.parent_package_id:
-                    child.append({
-                        'parent_package_id': pack.parent_package_id,  # temp parent_package_id
-                        'package_id': drug_package.id,
-                        'child_quantity_per_parent': pack.quantity_per_parent
-                    })
-                else:
-                    # pack is likely a parent
-                    parent.append({
-                        'tmp_parent_package_id': pack.id,
-                        'package_id': drug_package.id,
-                    })
-                #
-                # insert barcodes
-                for barcode in barcodes:
-                    product_barcode = {
-                        'barcode': barcode,
-                        'product_packaging_id': drug_package.id
-                    }
-                    self.base_repository.add(Barcode(**product_barcode))
-
-        # create package hierarchy
-        for child_pack in child:
-            # find the parent package id
-            parent_pack = next((p for p in parent if p['tmp_parent_package_id'] == child_pack['parent_package_id']),
-                               None)
-            if parent_pack:
-                child_pack['parent_package_id'] = parent_pack['package_id']
-                # del child_pack['tmp_parent_package_id']
-                self.base_repository.add(PackageHierarchy(**child_pack))
-
-        for group in groups:
-            group_tag = {
-                'group_id': group.id,
-                'drug_id': drug.id
-            }
-            self.base_repository.add(DrugGroupTag(**group_tag))
-        return self.base_repository.get(Drug, drug.id)
+                    for pack, sales_price_code in zip(dg_form.form_packages, sales_price_codes)
+                ])
+
+                for pack, drug_package in zip(dg_form.form_packages, drug_packages):
+                    # # if pack is child
+                    if pack.parent_package_id:
+                        child.append({
+                            'parent_package_id': pack.parent_package_id,  # temp parent_package_id
+                            'package_id': drug_package.id,
+                            'child_quantity_per_parent': pack.quantity_per_parent
+                        })
+                    else:
+                        # pack is likely a parent
+                        parent.append({
+                            'tmp_parent_package_id': pack.id,
+                            'package_id': drug_package.id,
+                        })
+
+                    barcodes += [
+                        Barcode(barcode=barcode, product_packaging_id=drug_package.id)
+                        for barcode in pack.product_barcode
+                    ]
+
+            # create package hierarchy
+            hierarchy = []
+            for child_pack in child:
+                # find the parent package id
+                parent_pack = next(
+                    (p for p in parent if p['tmp_parent_package_id'] == child_pack['parent_package_id']), None)
+                if parent_pack:
+                    child_pack['parent_package_id'] = parent_pack['package_id']
+                    hierarchy.append(PackageHierarchy(**child_pack))
+
+            self.base_repository.add_all(
+                barcodes + hierarchy + [DrugGroupTag(group_id=group.id, drug_id=drug.id) for group in groups]
+            )
+        invalidate_search_index(self.session)
+        invalidate_barcodes()
+        return drug
 
     def update(self, drug_id: int, drug_data: DrugDTO) -> Optional[Drug]:
         db_drug = self.get(drug_id)
@@ -176,6 +222,9 @@ class DrugRepository:
                 setattr(db_drug, key, value)
             self.session.commit()
             self.session.refresh(db_drug)
+            invalidate_search_index(self.session)
+            invalidate_barcodes()
+            invalidate_drug_profiles([drug_id])
         return db_drug
 
     # Soft delete specific operations
@@ -187,6 +236,9 @@ class DrugRepository:
             db_drug.delete()  # Using the mixin's delete method
             self.session.commit()
             self.session.refresh(db_drug)
+            invalidate_search_index(self.session)
+            invalidate_barcodes()
+            invalidate_drug_profiles([drug_id])
         return db_drug
 
     def restore(self, drug_id: int) -> Optional[Drug]:
@@ -195,38 +247,33 @@ class DrugRepository:
             db_drug.restore()  # Using the mixin's restore method
             self.session.commit()
             self.session.refresh(db_drug)
+            invalidate_search_index(self.session)
+            invalidate_barcodes()
+            invalidate_drug_profiles([drug_id])
         return db_drug
 
     # Additional useful queries
 
-    def get_by_name(self, name: str, include_deleted: bool = False):
-        products = self.product_repository.search_by_name(name)
-        dg = []
-        for product in products:
-            query = self.session.query(Drug).filter(Drug.product_id == product.id)
-            if not include_deleted:
-                query = query.filter(Drug.is_deleted == False)
-            drug = query.first()
-            if drug:
-                dg.append(
-                    self.get_complete_drug_dto(drug)
-                )
-        return {'data': dg, 'count': len(products)}
-
-    def get_by_manufacturer(self, manufacturer: str, include_deleted: bool = False) -> List[Drug]:
-        query = self.session.query(Drug).filter(Drug.manufacturer.ilike(f"%{manufacturer}%"))
+    def search(self, text: str, skip: int = 0, limit: int = 20, include_deleted: bool = False) -> dict:
+        """Ranked page of drugs matching text, see DrugSearchRepository."""
+        hits, total = self.search_repository.search(text, skip, limit, include_deleted)
+        drugs = {drug.id: drug for drug in
+                 self.session.query(Drug).filter(Drug.id.in_([drug_id for drug_id, _ in hits])).all()}
+        return {
+            'data': self.build_drug_dtos([drugs[drug_id] for drug_id, _ in hits if drug_id in drugs]),
+            'total': total
+        }
+
+    def get_by_name(self, name: str, include_deleted: bool = False, skip: int = 0, limit: int = 100):
+        rs = self.search(name, skip, limit, include_deleted)
+        return {'data': rs['data'], 'count': rs['total']}
+
+    def get_by_manufacturer(self, manufacturer: str, include_deleted: bool = False) -> List[DrugDTO]:
+        query = self.session.query(Drug).join(Product, Product.id == Drug.product_id) \
+            .filter(Product.manufacturer.ilike(f"%{manufacturer}%"))
         if not include_deleted:
             query = query.filter(Drug.is_deleted == False)
-        return query.all()
-
-    def get_drug_groups(self, drug_id: int) -> List[DrugGroupDTO]:
-        tags = self.session.query(DrugGroupTag).filter(DrugGroupTag.drug_id == drug_id).all()
-        groups = []
-        for tag in tags:
-            group = self.session.query(DrugGroup).filter(DrugGroup.id == tag.group_id).first()
-            if group:
-                groups.append(DrugGroupDTO(**group.__dict__))
-        return groups
+        return self.build_drug_dtos(query.order_by(Drug.id).all())
 
     def get_deleted(self) -> List[Drug]:
         return self.session.query(Drug).filter(Drug.is_deleted == True).all()
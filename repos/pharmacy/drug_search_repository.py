@@ -0,0 +1,137 @@
+import re
+import weakref
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, or_, literal, select, union
+from sqlalchemy.orm import Session
+
+from models.pharmacy import Drug
+from models.product import Product
+
+# columns a drug is searched on per table, each with its own pg_trgm GIN index
+PRODUCT_SEARCH_COLUMNS = [
+    Product.brand_name,
+    Product.product_name,
+    Product.product_desc,
+    Product.manufacturer,
+]
+DRUG_SEARCH_COLUMNS = [
+    Drug.active_ingredients,
+]
+# in the order they are read into the in-memory index
+SEARCH_COLUMNS = PRODUCT_SEARCH_COLUMNS + DRUG_SEARCH_COLUMNS
+
+# pg_trgm's default word_similarity_threshold, used by the in-memory index as well
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+_WORD = re.compile(r'[^\W_]+')
+
+# in-memory indexes by engine, only used on databases without pg_trgm
+_memory_indexes = weakref.WeakKeyDictionary()
+
+
+def trigrams(text: Optional[str]) -> set:
+    """Trigrams the way pg_trgm extracts them: lower-cased words padded with two blanks before, one after."""
+    grams = set()
+    for word in _WORD.findall((text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class DrugSearchIndex:
+    """
+    Trigram index held in memory, for SQLite where pg_trgm is not available.
+
+    Ranks like word_similarity: the share of the search term's trigrams found in a column,
+    so a term matches a word inside a longer text. Substring matches always qualify.
+    """
+
+    def __init__(self, rows):
+        self.entries = [
+            (row[0], row[1], [((value or '').lower(), trigrams(value)) for value in row[2:]])
+            for row in rows
+        ]
+
+    def search(self, text: str, include_deleted: bool = False) -> List[Tuple[int, float]]:
+        term = text.lower()
+        term_grams = trigrams(text)
+        hits = []
+        for drug_id, is_deleted, columns in self.entries:
+            if is_deleted and not include_deleted:
+                continue
+            rank = 0.0
+            matched = False
+            for value, grams in columns:
+                similarity = len(term_grams & grams) / len(term_grams) if term_grams else 0.0
+                rank = max(rank, similarity)
+                matched = matched or term in value or similarity >= WORD_SIMILARITY_THRESHOLD
+            if matched:
+                hits.append((drug_id, rank))
+        hits.sort(key=lambda hit: (-hit[1], hit[0]))
+        return hits
+
+
+def invalidate_search_index(db_session: Session):
+    """Drop the in-memory index of the session's engine; it is rebuilt on the next search."""
+    _memory_indexes.pop(db_session.get_bind(), None)
+
+
+class DrugSearchRepository:
+    """
+    Ranked drug search over brand name, product name, description, manufacturer and active ingredients.
+
+    On PostgreSQL the matches are found per table, so each OR of ILIKE and <% predicates stays on one
+    table and is served by a BitmapOr over that table's pg_trgm GIN indexes. The union of the matching
+    drug ids is then ranked, returning the page and the total hit count together. Other databases
+    fall back to DrugSearchIndex.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def search(self, text: str, skip: int = 0, limit: int = 20,
+               include_deleted: bool = False) -> Tuple[List[Tuple[int, float]], int]:
+        """Page of (drug_id, rank) best first, and the total number of hits."""
+        text = text.strip()
+        if not text:
+            return [], 0
+        if self.db_session.get_bind().dialect.name == 'postgresql':
+            return self._search_trigram(text, skip, limit, include_deleted)
+
+        hits = self._memory_index().search(text, include_deleted)
+        return hits[skip:skip + limit], len(hits)
+
+    def _search_trigram(self, text: str, skip: int, limit: int, include_deleted: bool):
+        term = literal(text)
+        rank = func.greatest(*[func.coalesce(func.word_similarity(term, column), 0) for column in SEARCH_COLUMNS])
+        pattern = f'%{text}%'
+
+        def matches(columns):
+            return or_(*[column.ilike(pattern) for column in columns],
+                       *[term.op('<%')(column) for column in columns])
+
+        hits = union(
+            select(Drug.id).join(Product, Product.id == Drug.product_id).where(matches(PRODUCT_SEARCH_COLUMNS)),
+            select(Drug.id).where(matches(DRUG_SEARCH_COLUMNS))
+        ).subquery()
+        query = self.db_session.query(Drug.id, rank.label('rank'), func.count().over().label('total')) \
+            .join(hits, hits.c.id == Drug.id) \
+            .join(Product, Product.id == Drug.product_id)
+        if not include_deleted:
+            query = query.filter(Drug.is_deleted == False)
+
+        rows = query.order_by(rank.desc(), Drug.id).offset(skip).limit(limit).all()
+        if rows:
+            return [(row.id, float(row.rank)) for row in rows], rows[0].total
+        # past the last page the window count is not available
+        return [], query.order_by(None).count() if skip else 0
+
+    def _memory_index(self) -> DrugSearchIndex:
+        bind = self.db_session.get_bind()
+        index = _memory_indexes.get(bind)
+        if index is None:
+            rows = self.db_session.query(Drug.id, Drug.is_deleted, *SEARCH_COLUMNS) \
+                .join(Product, Product.id == Drug.product_id).all()
+            index = _memory_indexes[bind] = DrugSearchIndex(rows)
+        return index
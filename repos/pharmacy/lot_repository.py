@@ -0,0 +1,248 @@
+from datetime import date, timedelta
+from typing import List, Optional
+
+from sqlalchemy import func, or_, and_, exists, insert
+from sqlalchemy.orm import Session, aliased
+
+from dtos.pharmacy.stock import StockLotDTO, StockAllocationDTO, DispenseItemDTO
+from models.pharmacy import PharmacyStockLot, PharmacyStockAllocation, Prescription, PrescriptionDetail, \
+    PrescriptionStatus, Form
+from repos.pharmacy.prescription_repository import PrescriptionRepository
+from repos.pharmacy.stock_repository import StockRepository
+from repos.pharmacy.worklist_repository import WorklistRepository
+from repos.transaction_repository import TransactionRepository
+
+
+class LotRepository:
+    """
+    Lot (batch) level inventory with first-expiry-first-out allocation.
+
+    Lots are created when a supply is received and drawn down when prescriptions are dispensed.
+    Allocation locks the candidate lots, so two dispensations cannot draw the same units.
+    Expired lots are never allocated.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+        self.stock_repository = StockRepository(db_session)
+        self.worklist_repository = WorklistRepository(db_session)
+        self.prescription_repository = PrescriptionRepository(db_session)
+        self.transaction_repository = TransactionRepository(db_session)
+
+    def receive_lot(self, drug_id: int, quantity: int, pharmacy_id: Optional[int] = None,
+                    drug_form: Optional[Form] = None, package_id: Optional[int] = None,
+                    expiry_date: Optional[date] = None, manufacture_date: Optional[date] = None,
+                    supply_detail_id: Optional[int] = None) -> PharmacyStockLot:
+        lot = PharmacyStockLot(
+            pharmacy_key=pharmacy_id or 0,
+            package_key=package_id or 0,
+            pharmacy_id=pharmacy_id,
+            drug_id=drug_id,
+            drug_form=drug_form,
+            package_id=package_id,
+            supply_detail_id=supply_detail_id,
+            expiry_date=expiry_date,
+            manufacture_date=manufacture_date,
+            quantity_received=quantity,
+            quantity_remaining=quantity
+        )
+        self.db_session.add(lot)
+        self.db_session.flush()
+        return lot
+
+    def receive_lots(self, lots: List[dict]) -> int:
+        """Insert many lots with one executemany; each dict carries receive_lot's keyword arguments."""
+        if not lots:
+            return 0
+        self.db_session.execute(insert(PharmacyStockLot), [
+            {
+                'pharmacy_key': lot.get('pharmacy_id') or 0,
+                'package_key': lot.get('package_id') or 0,
+                'pharmacy_id': lot.get('pharmacy_id'),
+                'drug_id': lot['drug_id'],
+                'drug_form': lot.get('drug_form'),
+                'package_id': lot.get('package_id'),
+                'supply_detail_id': lot.get('supply_detail_id'),
+                'expiry_date': lot.get('expiry_date'),
+                'manufacture_date': lot.get('manufacture_date'),
+                'quantity_received': lot['quantity'],
+                'quantity_remaining': lot['quantity']
+            }
+            for lot in lots
+        ])
+        return len(lots)
+
+    def available_lots(self, pharmacy_id: Optional[int], drug_id: int, package_id: Optional[int] = None,
+                       drug_form: Optional[Form] = None):
+        # plain equality on the non-null keys, so the lookup is a scan of ix_pharmacy_stock_lot_fefo
+        query = self.db_session.query(PharmacyStockLot).filter(
+            PharmacyStockLot.pharmacy_key == (pharmacy_id or 0),
+            PharmacyStockLot.drug_id == drug_id,
+            PharmacyStockLot.quantity_remaining > 0,
+            or_(PharmacyStockLot.expiry_date.is_(None), PharmacyStockLot.expiry_date >= date.today())
+        )
+        if package_id is not None:
+            query = query.filter(PharmacyStockLot.package_key == package_id)
+        if drug_form is not None:
+            query = query.filter(PharmacyStockLot.drug_form == drug_form)
+
+        # lots without an expiry date go last
+        return query.order_by(PharmacyStockLot.expiry_date.is_(None), PharmacyStockLot.expiry_date,
+                              PharmacyStockLot.id)
+
+    def allocate(self, pharmacy_id: Optional[int], drug_id: int, quantity: int, package_id: Optional[int] = None,
+                 drug_form: Optional[Form] = None, prescription_detail_id: Optional[int] = None,
+                 user_id: Optional[int] = None, transaction_id: Optional[int] = None) -> List[StockAllocationDTO]:
+        """Draw quantity from the earliest expiring lots. Does not commit."""
+        if quantity <= 0:
+            raise ValueError("Quantity to allocate must be positive")
+
+        lots = self.available_lots(pharmacy_id, drug_id, package_id, drug_form).with_for_update().all()
+        available = sum(lot.quantity_remaining for lot in lots)
+        if available < quantity:
+            raise ValueError(f"Insufficient stock for drug {drug_id}: requested {quantity}, available {available}")
+
+        allocations = []
+        outstanding = quantity
+        for lot in lots:
+            if outstanding == 0:
+                break
+            taken = min(lot.quantity_remaining, outstanding)
+            lot.quantity_remaining -= taken
+            outstanding -= taken
+
+            allocation = PharmacyStockAllocation(
+                lot_id=lot.id,
+                prescription_detail_id=prescription_detail_id,
+                quantity=taken,
+                allocated_by=user_id
+            )
+            self.db_session.add(allocation)
+            # supplies are recorded as negative movements, so stock leaving the pharmacy is positive
+            self.stock_repository.record_movement(
+                drug_id=lot.drug_id,
+                package_id=lot.package_id,
+                quantity=taken,
+                drug_form=lot.drug_form,
+                pharmacy_id=lot.pharmacy_id,
+                transaction_id=transaction_id
+            )
+            allocations.append((allocation, lot))
+
+        self.db_session.flush()
+        return [
+            StockAllocationDTO(
+                id=allocation.id,
+                lot_id=lot.id,
+                prescription_detail_id=allocation.prescription_detail_id,
+                quantity=allocation.quantity,
+                expiry_date=lot.expiry_date
+            )
+            for allocation, lot in allocations
+        ]
+
+    def dispense(self, prescription_id: int, items: List[DispenseItemDTO], user_id: Optional[int] = None,
+                 transaction_id: Optional[int] = None) -> Optional[List[StockAllocationDTO]]:
+        """
+        Allocate stock for prescription items from the prescription's pharmacy and update the item and
+        prescription statuses, all in one transaction.
+
+        An item is dispensed once its prescribed quantity has been given out, which may take several
+        dispensations; an item without a prescribed quantity is dispensed by its first one. The stock
+        movements are linked to transaction_id, or to a new transaction when none is given.
+        """
+        prescription = self.db_session.query(Prescription).filter(Prescription.id == prescription_id) \
+            .with_for_update().first()
+        if prescription is None:
+            return None
+
+        details = {
+            detail.id: detail
+            for detail in self.db_session.query(PrescriptionDetail)
+            .filter(PrescriptionDetail.prescription_id == prescription_id).all()
+        }
+
+        try:
+            if transaction_id is None:
+                transaction_id = self.transaction_repository.create_transaction(0, commit=False)["id"]
+
+            allocations = []
+            for item in items:
+                detail = details.get(item.prescription_detail_id)
+                if detail is None:
+                    raise ValueError(f"Prescription item {item.prescription_detail_id} not found")
+                if detail.status == PrescriptionStatus.Dispensed:
+                    raise ValueError(f"Prescription item {detail.id} has already been dispensed")
+
+                dispensed = (detail.quantity_dispensed or 0) + item.quantity
+                if detail.quantity is not None and dispensed > detail.quantity:
+                    raise ValueError(f"Prescription item {detail.id}: {item.quantity} more would exceed the "
+                                     f"{detail.quantity} prescribed, {detail.quantity_dispensed or 0} already dispensed")
+
+                allocations += self.allocate(prescription.pharmacy_id, detail.drug_id, item.quantity,
+                                             item.package_id, detail.form, detail.id, user_id, transaction_id)
+                detail.quantity_dispensed = dispensed
+                detail.status = PrescriptionStatus.Dispensed \
+                    if detail.quantity is None or dispensed >= detail.quantity \
+                    else PrescriptionStatus.PatiallyDispensed
+
+            old_status = prescription.status
+            prescription.status = PrescriptionStatus.Dispensed \
+                if all(detail.status == PrescriptionStatus.Dispensed for detail in details.values()) \
+                else PrescriptionStatus.PatiallyDispensed
+            self.worklist_repository.status_changed(prescription.pharmacy_id, old_status, prescription.status)
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+        self.prescription_repository.publish(prescription_id, 'updated')
+        return allocations
+
+    def get_lots(self, drug_id: int, pharmacy_id: int = 0, available_only: bool = True) -> List[StockLotDTO]:
+        query = self.db_session.query(PharmacyStockLot).filter(PharmacyStockLot.drug_id == drug_id)
+        if pharmacy_id != 0:
+            query = query.filter(PharmacyStockLot.pharmacy_id == pharmacy_id)
+        if available_only:
+            query = query.filter(PharmacyStockLot.quantity_remaining > 0)
+        lots = query.order_by(PharmacyStockLot.expiry_date.is_(None), PharmacyStockLot.expiry_date,
+                              PharmacyStockLot.id).all()
+        return [StockLotDTO.from_orm(lot) for lot in lots]
+
+    def near_expiry(self, days: int = 90, pharmacy_id: int = 0, skip: int = 0, limit: int = 100) -> dict:
+        """Available lots expiring within the given number of days, soonest first, including expired ones."""
+        query = self.db_session.query(PharmacyStockLot).filter(
+            PharmacyStockLot.quantity_remaining > 0,
+            PharmacyStockLot.expiry_date <= date.today() + timedelta(days=days)
+        )
+        if pharmacy_id != 0:
+            query = query.filter(PharmacyStockLot.pharmacy_id == pharmacy_id)
+
+        total = query.count()
+        lots = query.order_by(PharmacyStockLot.expiry_date, PharmacyStockLot.id).offset(skip).limit(limit).all()
+        return {'data': [StockLotDTO.from_orm(lot) for lot in lots], 'total': total}
+
+    def stock_outs(self, pharmacy_id: int = 0, skip: int = 0, limit: int = 100) -> dict:
+        """Drug packages that were stocked in a pharmacy but have no unexpired units left."""
+        available = aliased(PharmacyStockLot)
+        query = self.db_session.query(
+            PharmacyStockLot.pharmacy_id,
+            PharmacyStockLot.drug_id,
+            PharmacyStockLot.drug_form,
+            PharmacyStockLot.package_id,
+            func.max(PharmacyStockLot.received_at).label('last_received_at')
+        ).filter(~exists().where(and_(
+            available.pharmacy_key == PharmacyStockLot.pharmacy_key,
+            available.drug_id == PharmacyStockLot.drug_id,
+            available.package_key == PharmacyStockLot.package_key,
+            available.quantity_remaining > 0,
+            or_(available.expiry_date.is_(None), available.expiry_date >= date.today())
+        )))
+        if pharmacy_id != 0:
+            query = query.filter(PharmacyStockLot.pharmacy_id == pharmacy_id)
+
+        query = query.group_by(PharmacyStockLot.pharmacy_id, PharmacyStockLot.drug_id,
+                               PharmacyStockLot.drug_form, PharmacyStockLot.package_id)
+        total = query.count()
+        rows = query.order_by(PharmacyStockLot.pharmacy_id, PharmacyStockLot.drug_id) \
+            .offset(skip).limit(limit).all()
+        return {'data': [row._asdict() for row in rows], 'total': total}
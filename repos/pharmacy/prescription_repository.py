@@ -1,26 +1,37 @@
+from typing import Optional
+
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import selectinload
+
 from dtos.auth import UserDTO
 from dtos.pharmacy.prescription import PrescriptionDTO, PrescriptionDetailDTO
-from models.pharmacy import Prescription, PrescriptionStatus, PrescriptionDetail, Form
-from repos.auth_repository import UserRepository
-from repos.base_repository import BaseRepository
+from models.client import Organization
+from models.pharmacy import Prescription, PrescriptionStatus, PrescriptionDetail, Form, Drug, Pharmacy
+from models.product import Product
+from repos.base_repository import BaseRepository, UnitOfWork, in_unit_of_work
 from repos.client.client_repository import ClientRepository
 from repos.consultation.consultant_repository import ConsultantRepository
-from repos.pharmacy.drug_repository import DrugRepository
-from repos.pharmacy.pharmacy_repository import PharmacyRepository
+from repos.consultation.roster_repository import RosterRepository
+from repos.pharmacy.safety_repository import SafetyRepository
+from repos.pharmacy.worklist_repository import WorklistRepository, encode_cursor, decode_cursor
 
 
 class PrescriptionRepository(BaseRepository):
     def __init__(self, db):
         super().__init__(db)
         self.consultation_repository = ConsultantRepository(db)
-        self.client_repository = ClientRepository(db)
-        self.auth_repository = UserRepository(db)
-        self.pharmacy_repository = PharmacyRepository(db)
-        self.drug_repository = DrugRepository(db)
+        self.worklist_repository = WorklistRepository(db)
+        self.safety_repository = SafetyRepository(db)
 
     def get_all(self, skip: int = 0, limit: int = 0, status: PrescriptionStatus = PrescriptionStatus.All,
                 start_date: str = None, end_date: str = None):
-        query = self.db.query(Prescription)
+        """
+        A page of prescriptions with their items, drugs, clients, consultants and pharmacies.
+
+        Related rows are loaded with one query per kind for the whole page, using slim projections
+        rather than the full client and drug profiles.
+        """
+        query = self.db.query(Prescription).options(selectinload(Prescription.details))
 
         if status != PrescriptionStatus.All:
             query = query.filter(Prescription.status == status)
@@ -28,13 +39,18 @@ class PrescriptionRepository(BaseRepository):
         if start_date and end_date:
             query = query.filter(Prescription.created_at.between(start_date, end_date))
 
-        query = query.offset(skip).limit(limit).all()
-        prescriptions = []
-        for prescription in query:
-            self.consultation_repository.get_consultant_by_id(
-                prescription.consultant_id) if prescription.consultant_id else None
+        rs = query.order_by(Prescription.created_at.desc(), Prescription.id.desc()).offset(skip).limit(limit).all()
+        return self.summarise(rs)
+
+    def summarise(self, rs) -> list:
+        """List entries for prescriptions loaded with their details, with one query per related kind."""
+        drugs = self.get_drug_summaries({detail.drug_id for prescription in rs for detail in prescription.details})
+        clients = ClientRepository(self.db).get_client_summaries({prescription.client_id for prescription in rs})
+        consultants = RosterRepository(self.db).get_many({prescription.consultant_id for prescription in rs})
+        pharmacies = self.get_pharmacy_summaries({prescription.pharmacy_id for prescription in rs})
 
-            consultant_specialist = self.consultation_repository.get_consultant_by_id(prescription.consultant_id)
+        prescriptions = []
+        for prescription in rs:
             prescriptions.append(
                 {
                     'id': prescription.id,
@@ -42,74 +58,118 @@ class PrescriptionRepository(BaseRepository):
                     'note': prescription.note,
                     'instruction': prescription.instruction,
                     'created_at': (prescription.created_at).strftime("%Y-%m-%d %H:%M:%S"),
-                    'client': self.client_repository.get_client(
-                        prescription.client_id) if prescription.client_id else None,
-                    'consultant': {
-                        'title': "Professor",  # consultant_specialist.title,
-                        'id': prescription.consultant_id,
-                        'user': self.auth_repository.get_usr_by_id(1)
-                    },
-                    'pharmacy': self.pharmacy_repository.get_pharmacy_by_id(prescription.pharmacy_id),
-                    'prescriptions': self.get_prescription_details(prescription.id)
+                    'client': clients.get(prescription.client_id),
+                    'consultant': consultants.get(prescription.consultant_id, {'id': prescription.consultant_id}),
+                    'pharmacy': pharmacies.get(prescription.pharmacy_id),
+                    'prescriptions': [self.detail_summary(detail, drugs) for detail in prescription.details]
                 })
         return prescriptions
 
+    def get_worklist(self, pharmacy_id: int, status: PrescriptionStatus = PrescriptionStatus.Pending,
+                     cursor: Optional[str] = None, limit: int = 50) -> dict:
+        """
+        Oldest first page of a pharmacy's prescriptions after the cursor, served by the
+        (pharmacy_id, status, created_at, id) index, with the per-status counters.
+        """
+        query = self.db.query(Prescription).options(selectinload(Prescription.details)) \
+            .filter(Prescription.pharmacy_id == pharmacy_id)
+        if status != PrescriptionStatus.All:
+            query = query.filter(Prescription.status == status)
+        if cursor:
+            created_at, prescription_id = decode_cursor(cursor)
+            query = query.filter(or_(Prescription.created_at > created_at,
+                                     and_(Prescription.created_at == created_at, Prescription.id > prescription_id)))
+
+        rs = query.order_by(Prescription.created_at, Prescription.id).limit(limit + 1).all()
+        page = rs[:limit]
+        return {
+            'data': self.summarise(page),
+            'next_cursor': encode_cursor(page[-1]) if len(rs) > limit else None,
+            'counts': self.worklist_repository.get_counts(pharmacy_id)
+        }
+
+    def publish(self, prescription_id: int, event: str):
+        prescription = self.db.query(Prescription).options(selectinload(Prescription.details)) \
+            .filter(Prescription.id == prescription_id).first()
+        if prescription:
+            self.worklist_repository.publish(prescription.pharmacy_id, event, self.summarise([prescription])[0])
+
     def get_prescription_details(self, prescription_id: int):
         dts = self.db.query(PrescriptionDetail).filter(PrescriptionDetail.prescription_id == prescription_id).all()
-        details = []
-        for prescription in dts:
-            details.append(
-                {
-                    'id': prescription.id,
-                    'drug': self.drug_repository.get(prescription.drug_id),
-                    'form': Form(prescription.form).name,
-                    'frequency': prescription.frequency,
-                    'weight_volume': prescription.weight_volume,
-                    'dosage': prescription.dosage,
-                    'interval': prescription.interval,
-                    'duration': prescription.duration,
-                    'is_prn': prescription.is_prn,
-                    'status': prescription.status.name
-                }
-            )
-        return details
+        drugs = self.get_drug_summaries({detail.drug_id for detail in dts})
+        return [self.detail_summary(detail, drugs) for detail in dts]
+
+    @staticmethod
+    def detail_summary(prescription: PrescriptionDetail, drugs: dict) -> dict:
+        return {
+            'id': prescription.id,
+            'drug': drugs.get(prescription.drug_id),
+            'form': Form(prescription.form).name,
+            'frequency': prescription.frequency,
+            'weight_volume': prescription.weight_volume,
+            'dosage': prescription.dosage,
+            'interval': prescription.interval,
+            'duration': prescription.duration,
+            'is_prn': prescription.is_prn,
+            'status': prescription.status.name
+        }
+
+    def get_drug_summaries(self, drug_ids) -> dict:
+        """Drug and product names keyed by drug id, shaped like DrugDTO's drug_info and product."""
+        drug_ids = [drug_id for drug_id in drug_ids if drug_id]
+        if not drug_ids:
+            return {}
+        rs = self.db.query(Drug.id, Drug.product_id, Drug.active_ingredients, Product.brand_name,
+                           Product.product_name, Product.manufacturer) \
+            .join(Product, Product.id == Drug.product_id) \
+            .filter(Drug.id.in_(drug_ids)).all()
+        return {
+            row.id: {
+                'drug_info': {'id': row.id, 'product_id': row.product_id,
+                              'active_ingredients': row.active_ingredients},
+                'product': {'id': row.product_id, 'brand_name': row.brand_name,
+                            'product_name': row.product_name, 'manufacturer': row.manufacturer}
+            }
+            for row in rs
+        }
+
+    def get_pharmacy_summaries(self, pharmacy_ids) -> dict:
+        pharmacy_ids = [pharmacy_id for pharmacy_id in pharmacy_ids if pharmacy_id]
+        if not pharmacy_ids:
+            return {}
+        rs = self.db.query(Pharmacy.id.label('pharmacy_id'), Organization.id, Organization.name, Organization.email,
+                           Organization.phone, Organization.address) \
+            .join(Organization, Organization.id == Pharmacy.org_id) \
+            .filter(Pharmacy.id.in_(pharmacy_ids), Organization.deleted_at.is_(None)).all()
+        return {
+            row.pharmacy_id: {'id': row.id, 'name': row.name, 'email': row.email, 'phone': row.phone,
+                              'address': row.address}
+            for row in rs
+        }
 
     def create(self, prescription_dto: PrescriptionDTO, user: UserDTO) -> PrescriptionDTO:
-
-        prescription = prescription_dto.dict()
-        consultant = self.consultation_repository.get_consultant_by_user_id(user.id)
-
-        psd = prescription.pop("prescriptions")
-
-        prescription = self.add(
-            Prescription(
-                consultant_id=consultant.id if consultant else 1,
-                pharmacy_id=prescription_dto.pharmacy_id,
-                client_id=prescription_dto.client.id if prescription_dto.client else None,
-                status=PrescriptionStatus.Pending,
-                instruction=prescription_dto.instruction,
-                note=prescription_dto.note,
-            ))
-
-        self.db.flush(prescription)
-        ps = PrescriptionDTO(
-            id=prescription.id,
-            status=prescription.status,
-            note=prescription.note,
-            instruction=prescription.instruction,
-            pharmacy_id=prescription.pharmacy_id,
-            created_at=(prescription.created_at).strftime("%Y-%m-%d %H:%M:%S"),
-            client=prescription_dto.client,
-            consultant=prescription_dto.consultant if prescription_dto.consultant else None,
-        )
-
-        pres = []
-        for item in psd:
-            dg = item["drug"]
-            dg = dg["drug_info"]
-            prescription_item = self.add(
+        """
+        The prescription, its items and the worklist counter are committed together. Inside a caller's
+        UnitOfWork nothing is committed and the caller publishes the new prescription after its commit.
+        """
+        psd = prescription_dto.dict()["prescriptions"] or []
+        consultant_id = RosterRepository(self.db).consultant_of_user(user.id)
+        commits = not in_unit_of_work(self.db)
+
+        with UnitOfWork(self.db):
+            prescription = self.add(
+                Prescription(
+                    consultant_id=consultant_id or 1,
+                    pharmacy_id=prescription_dto.pharmacy_id,
+                    client_id=prescription_dto.client.id if prescription_dto.client else None,
+                    status=PrescriptionStatus.Pending,
+                    instruction=prescription_dto.instruction,
+                    note=prescription_dto.note,
+                ))
+
+            prescription_items = self.add_all([
                 PrescriptionDetail(
-                    drug_id=dg["id"],
+                    drug_id=item["drug"]["drug_info"]["id"],
                     prescription_id=prescription.id,
                     form=item["form"],
                     frequency=item["frequency"],
@@ -118,14 +178,28 @@ class PrescriptionRepository(BaseRepository):
                     interval=item["interval"],
                     duration=item["duration"],
                     is_prn=item.get("is_prn"),
+                    quantity=item.get("quantity"),
                     status=PrescriptionStatus.Pending
                 )
-            )
+                for item in psd
+            ])
 
-            pres.append(
-                PrescriptionDetailDTO.from_orm(prescription_item)
-            )
+            self.worklist_repository.status_changed(prescription.pharmacy_id, None, PrescriptionStatus.Pending)
+        if commits:
+            self.publish(prescription.id, 'created')
 
-        ps.prescriptions = pres
-
-        return ps
+        return PrescriptionDTO(
+            id=prescription.id,
+            status=prescription.status,
+            note=prescription.note,
+            instruction=prescription.instruction,
+            pharmacy_id=prescription.pharmacy_id,
+            created_at=(prescription.created_at).strftime("%Y-%m-%d %H:%M:%S"),
+            client=prescription_dto.client,
+            consultant=prescription_dto.consultant if prescription_dto.consultant else None,
+            prescriptions=[PrescriptionDetailDTO.from_orm(item) for item in prescription_items],
+            warnings=self.safety_repository.check(
+                [item["drug"]["drug_info"]["id"] for item in psd],
+                prescription_dto.client.id if prescription_dto.client else None
+            )
+        )
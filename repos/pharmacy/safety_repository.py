@@ -0,0 +1,232 @@
+import json
+import logging
+import re
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional
+
+from redis import RedisError
+from sqlalchemy.orm import Session
+
+from cache.redis import get_redis_client
+from dtos.pharmacy.prescription import PrescriptionWarningDTO
+from models.client import DrugAllergy, Severity
+from models.pharmacy import Drug, DrugGroupTag, DrugGroup
+from models.product import Product
+
+logger = logging.getLogger(__name__)
+
+DRUG_PROFILE_KEY = "pharmacy:safety:drug:{drug_id}"
+# bumped on every drug group edit; profiles cached under another version are reloaded
+GROUPS_VERSION_KEY = "pharmacy:safety:groups:version"
+CLIENT_ALLERGY_KEY = "pharmacy:safety:client:{client_id}"
+DRUG_PROFILE_TTL = 24 * 3600
+CLIENT_ALLERGY_TTL = 3600
+
+# active ingredients are free text such as "Paracetamol 500mg + Caffeine 65mg"
+_INGREDIENT_SEPARATORS = re.compile(r'[,;+/&]|\band\b|\bwith\b')
+_STRENGTH = re.compile(r'\b\d+(\.\d+)?\s*(mg|mcg|µg|g|ml|iu|%)\b|\(.*?\)')
+
+
+def ingredient_tokens(text: Optional[str]) -> List[str]:
+    tokens = []
+    for part in _INGREDIENT_SEPARATORS.split((text or '').lower()):
+        token = ' '.join(_STRENGTH.sub(' ', part).split())
+        if len(token) > 2 and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def mentions(text: str, term: str) -> bool:
+    return bool(term) and re.search(rf'\b{re.escape(term)}\b', text) is not None
+
+
+def invalidate_drug_profiles(drug_ids: Iterable[int], redis=None):
+    try:
+        keys = [DRUG_PROFILE_KEY.format(drug_id=drug_id) for drug_id in drug_ids]
+        if keys:
+            (redis or get_redis_client()).delete(*keys)
+    except RedisError:
+        logger.warning("Could not invalidate cached drug safety profiles")
+
+
+def invalidate_drug_groups(redis=None):
+    """Drop every cached drug profile, as group names and ancestors are part of them."""
+    try:
+        (redis or get_redis_client()).incr(GROUPS_VERSION_KEY)
+    except RedisError:
+        logger.warning("Could not invalidate cached drug groups")
+
+
+def invalidate_client_allergies(client_id: int, redis=None):
+    try:
+        (redis or get_redis_client()).delete(CLIENT_ALLERGY_KEY.format(client_id=client_id))
+    except RedisError:
+        logger.warning(f"Could not invalidate cached allergies of client {client_id}")
+
+
+class SafetyRepository:
+    """
+    Prescribing safety checks against client drug allergies and the other drugs prescribed with it.
+
+    Each drug is reduced to a profile of ingredient tokens, group ids (with their ancestors),
+    names and its interaction and contraindication text. Each client is reduced to the profiles
+    of the drugs they are allergic to. Both are cached in Redis and loaded for a whole
+    prescription at once, so a check costs at most one query per kind on a cache miss and the
+    comparison itself runs in memory.
+    """
+
+    def __init__(self, db_session: Session, redis=None):
+        self.db_session = db_session
+        self.redis = redis
+
+    def _redis(self):
+        return self.redis or get_redis_client()
+
+    def _cached(self, keys: List[str]) -> List[Optional[dict]]:
+        try:
+            return [json.loads(value) if value else None for value in self._redis().mget(keys)]
+        except RedisError:
+            return [None] * len(keys)
+
+    def _cache(self, values: Dict[str, dict], ttl: int):
+        try:
+            pipeline = self._redis().pipeline()
+            for key, value in values.items():
+                pipeline.set(key, json.dumps(value), ex=ttl)
+            pipeline.execute()
+        except RedisError:
+            logger.warning("Could not cache prescribing safety profiles")
+
+    def get_drug_profiles(self, drug_ids: Iterable[int]) -> Dict[int, dict]:
+        drug_ids = sorted({drug_id for drug_id in drug_ids if drug_id})
+        if not drug_ids:
+            return {}
+        # the groups version comes back with the profiles, in the same round trip
+        *cached, groups_version = self._cached(
+            [DRUG_PROFILE_KEY.format(drug_id=drug_id) for drug_id in drug_ids] + [GROUPS_VERSION_KEY]
+        )
+        profiles = {drug_id: profile for drug_id, profile in zip(drug_ids, cached)
+                    if profile and profile.get('groups_version') == groups_version}
+
+        missing = [drug_id for drug_id in drug_ids if drug_id not in profiles]
+        if missing:
+            loaded = self.load_drug_profiles(missing)
+            for profile in loaded.values():
+                profile['groups_version'] = groups_version
+            self._cache({DRUG_PROFILE_KEY.format(drug_id=drug_id): profile for drug_id, profile in loaded.items()},
+                        DRUG_PROFILE_TTL)
+            profiles.update(loaded)
+        return profiles
+
+    def load_drug_profiles(self, drug_ids: List[int]) -> Dict[int, dict]:
+        rs = self.db_session.query(Drug.id, Drug.active_ingredients, Drug.interactions, Drug.contraindications,
+                                   Product.brand_name, Product.product_name) \
+            .join(Product, Product.id == Drug.product_id) \
+            .filter(Drug.id.in_(drug_ids)).all()
+
+        groups = {group.id: group for group in self.db_session.query(DrugGroup.id, DrugGroup.group,
+                                                                      DrugGroup.parent_id).all()}
+        tags = {}
+        for tag in self.db_session.query(DrugGroupTag.drug_id, DrugGroupTag.group_id) \
+                .filter(DrugGroupTag.drug_id.in_(drug_ids)).all():
+            # a drug belongs to its groups' ancestors too
+            group_id, seen = tag.group_id, set()
+            while group_id in groups and group_id not in seen:
+                seen.add(group_id)
+                tags.setdefault(tag.drug_id, {})[group_id] = groups[group_id].group
+                group_id = groups[group_id].parent_id
+
+        return {
+            row.id: {
+                'id': row.id,
+                'name': row.brand_name or row.product_name,
+                'names': [name.lower() for name in (row.brand_name, row.product_name) if name],
+                'ingredients': ingredient_tokens(row.active_ingredients),
+                'groups': {str(group_id): name for group_id, name in tags.get(row.id, {}).items()},
+                'interactions': (row.interactions or '').lower(),
+                'contraindications': (row.contraindications or '').lower()
+            }
+            for row in rs
+        }
+
+    def get_client_allergies(self, client_id: int) -> List[dict]:
+        key = CLIENT_ALLERGY_KEY.format(client_id=client_id)
+        cached = self._cached([key])[0]
+        if cached is not None:
+            return cached['allergies']
+
+        rs = self.db_session.query(DrugAllergy.drug_id, DrugAllergy.detail, DrugAllergy.risk_severity) \
+            .filter(DrugAllergy.client_id == client_id).all()
+        allergies = [
+            {'drug_id': row.drug_id, 'detail': row.detail,
+             'severity': row.risk_severity.value if row.risk_severity else None}
+            for row in rs
+        ]
+        self._cache({key: {'allergies': allergies}}, CLIENT_ALLERGY_TTL)
+        return allergies
+
+    def check(self, drug_ids: List[int], client_id: Optional[int] = None) -> List[PrescriptionWarningDTO]:
+        """Warnings for a whole prescription: allergies of the client and conflicts between its drugs."""
+        allergies = self.get_client_allergies(client_id) if client_id else []
+        profiles = self.get_drug_profiles(list(drug_ids) + [allergy['drug_id'] for allergy in allergies])
+        prescribed = [profiles[drug_id] for drug_id in dict.fromkeys(drug_ids) if drug_id in profiles]
+
+        warnings = []
+        for drug in prescribed:
+            for allergy in allergies:
+                warnings += self._allergy_warnings(drug, allergy, profiles.get(allergy['drug_id']))
+        for drug, other in combinations(prescribed, 2):
+            warnings += self._pair_warnings(drug, other)
+        return warnings
+
+    @staticmethod
+    def _allergy_warnings(drug: dict, allergy: dict, allergen: Optional[dict]) -> List[PrescriptionWarningDTO]:
+        severity = allergy['severity']
+        if allergen is None:
+            return []
+        if allergen['id'] == drug['id']:
+            return [PrescriptionWarningDTO(
+                type='allergy', severity=severity or Severity.High.value, drug_id=drug['id'],
+                message=f"Client is allergic to {drug['name']}"
+            )]
+
+        shared = [ingredient for ingredient in drug['ingredients'] if ingredient in allergen['ingredients']]
+        if shared:
+            return [PrescriptionWarningDTO(
+                type='allergy', severity=severity or Severity.High.value, drug_id=drug['id'],
+                other_drug_id=allergen['id'],
+                message=f"{drug['name']} contains {', '.join(shared)}, client is allergic to {allergen['name']}"
+            )]
+
+        groups = [name for group_id, name in drug['groups'].items() if group_id in allergen['groups']]
+        if groups:
+            return [PrescriptionWarningDTO(
+                type='cross_sensitivity', severity=Severity.Medium.value, drug_id=drug['id'],
+                other_drug_id=allergen['id'],
+                message=f"{drug['name']} is in the same group ({', '.join(groups)}) as {allergen['name']}, "
+                        f"which the client is allergic to"
+            )]
+        return []
+
+    @staticmethod
+    def _pair_warnings(drug: dict, other: dict) -> List[PrescriptionWarningDTO]:
+        warnings = []
+        shared = [ingredient for ingredient in drug['ingredients'] if ingredient in other['ingredients']]
+        if shared:
+            warnings.append(PrescriptionWarningDTO(
+                type='duplicate_ingredient', severity=Severity.Medium.value, drug_id=drug['id'],
+                other_drug_id=other['id'],
+                message=f"{drug['name']} and {other['name']} both contain {', '.join(shared)}"
+            ))
+
+        for first, second in ((drug, other), (other, drug)):
+            terms = second['ingredients'] + second['names'] + [name.lower() for name in second['groups'].values()]
+            hits = [term for term in terms
+                    if mentions(first['interactions'], term) or mentions(first['contraindications'], term)]
+            if hits:
+                warnings.append(PrescriptionWarningDTO(
+                    type='interaction', severity=Severity.High.value, drug_id=first['id'],
+                    other_drug_id=second['id'],
+                    message=f"{first['name']} lists an interaction with {', '.join(hits)} ({second['name']})"
+                ))
+        return warnings
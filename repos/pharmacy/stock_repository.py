@@ -0,0 +1,193 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, insert, select, delete, cast, String
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from dtos.pharmacy.drug import DrugDTO
+from models.pharmacy import PharmacyDrugMovement, PharmacyStock, Form
+
+
+def stock_key(pharmacy_id: Optional[int], drug_id: int, drug_form: Optional[Form],
+              package_id: Optional[int]) -> str:
+    """The pharmacy_stock.stock_key of a key, with '' standing in for NULL parts."""
+    form = Form(drug_form).value if drug_form else ''
+    return f"{pharmacy_id or ''}:{drug_id}:{form}:{package_id or ''}"
+
+
+def stock_key_sql(pharmacy_id, drug_id, drug_form, package_id):
+    """stock_key computed in SQL from the key columns, for INSERT ... SELECT."""
+    def part(column):
+        return func.coalesce(cast(column, String), '')
+
+    return part(pharmacy_id) + ':' + cast(drug_id, String) + ':' + part(drug_form) + ':' + part(package_id)
+
+
+class StockRepository:
+    """
+    Stock on hand projection of the pharmacy drug movements.
+
+    record_movement is the only place movements should be written from: it adds the movement and
+    applies its quantity to the matching pharmacy_stock row in the same transaction. Nothing here
+    commits except rebuild, the caller owns the transaction.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def record_movement(self, drug_id: int, package_id: Optional[int], quantity: int,
+                        drug_form: Optional[Form] = None, pharmacy_id: Optional[int] = None,
+                        transaction_id: Optional[int] = None) -> PharmacyDrugMovement:
+        movement = PharmacyDrugMovement(
+            transaction_id=transaction_id,
+            drug_form=drug_form,
+            drug_id=drug_id,
+            package_type=package_id,
+            quantity=quantity,
+            pharmacy_id=pharmacy_id
+        )
+        self.db_session.add(movement)
+        self.apply_movement(pharmacy_id, drug_id, drug_form, package_id, quantity)
+        return movement
+
+    def record_movements(self, movements: List[dict]) -> int:
+        """
+        Bulk variant of record_movement: one executemany INSERT for the movements and one projection
+        update per distinct stock key. Each dict carries record_movement's keyword arguments.
+        """
+        if not movements:
+            return 0
+        self.db_session.execute(insert(PharmacyDrugMovement), [
+            {
+                'transaction_id': movement.get('transaction_id'),
+                'drug_form': movement.get('drug_form'),
+                'drug_id': movement['drug_id'],
+                'package_type': movement.get('package_id'),
+                'quantity': movement['quantity'],
+                'pharmacy_id': movement.get('pharmacy_id')
+            }
+            for movement in movements
+        ])
+
+        totals = defaultdict(int)
+        for movement in movements:
+            totals[(movement.get('pharmacy_id'), movement['drug_id'], movement.get('drug_form'),
+                    movement.get('package_id'))] += movement['quantity']
+        for (pharmacy_id, drug_id, drug_form, package_id), quantity in totals.items():
+            self.apply_movement(pharmacy_id, drug_id, drug_form, package_id, quantity)
+        return len(movements)
+
+    def apply_movement(self, pharmacy_id: Optional[int], drug_id: int, drug_form: Optional[Form],
+                       package_id: Optional[int], quantity: int):
+        # one upsert on the non-null stock_key: concurrent first movements of a key cannot both insert,
+        # and later ones serialise on the row lock of the increment
+        dialect = postgresql if self.db_session.get_bind().dialect.name == 'postgresql' else sqlite
+        upsert = dialect.insert(PharmacyStock).values(
+            stock_key=stock_key(pharmacy_id, drug_id, drug_form, package_id),
+            pharmacy_id=pharmacy_id,
+            drug_id=drug_id,
+            drug_form=drug_form,
+            package_id=package_id,
+            quantity=quantity
+        )
+        self.db_session.execute(upsert.on_conflict_do_update(
+            index_elements=[PharmacyStock.stock_key],
+            set_={'quantity': PharmacyStock.quantity + upsert.excluded.quantity, 'updated_at': datetime.utcnow()}
+        ))
+
+    def get_stock(self, drug_ids: List[int], pharmacy_id: int = 0) -> dict:
+        """Quantities keyed by (drug_id, package_id), summed over pharmacies unless one is given."""
+        if not drug_ids:
+            return {}
+        rs = self.db_session.query(
+            PharmacyStock.drug_id,
+            PharmacyStock.package_id,
+            func.sum(PharmacyStock.quantity).label('quantity')
+        ).filter(PharmacyStock.drug_id.in_(drug_ids))
+
+        if pharmacy_id != 0:
+            rs = rs.filter(PharmacyStock.pharmacy_id == pharmacy_id)
+
+        rs = rs.group_by(PharmacyStock.drug_id, PharmacyStock.package_id).all()
+        return {(row.drug_id, row.package_id): int(row.quantity or 0) for row in rs}
+
+    def stock_by_package(self, drugs: List[DrugDTO], pharmacy_id: int = 0) -> dict:
+        """Stock of every form package of the given drugs, keyed by drug id, from one query."""
+        stock = self.get_stock([drug.drug_info.id for drug in drugs], pharmacy_id)
+        response = defaultdict(list)
+        for drug in drugs:
+            for drug_form in drug.drug_info.drug_form or []:
+                for package in drug_form.form_packages or []:
+                    response[drug.drug_info.id].append({
+                        'form': drug_form.drug_form,
+                        'quantity': stock.get((drug.drug_info.id, package.id), 0),
+                        'package': package,
+                    })
+        return response
+
+    def movement_totals(self):
+        return select(
+            PharmacyDrugMovement.pharmacy_id,
+            PharmacyDrugMovement.drug_id,
+            PharmacyDrugMovement.drug_form,
+            PharmacyDrugMovement.package_type,
+            func.coalesce(func.sum(PharmacyDrugMovement.quantity), 0).label('quantity')
+        ).where(PharmacyDrugMovement.drug_id.is_not(None)) \
+            .group_by(PharmacyDrugMovement.pharmacy_id, PharmacyDrugMovement.drug_id,
+                      PharmacyDrugMovement.drug_form, PharmacyDrugMovement.package_type)
+
+    def rebuild(self) -> int:
+        """Recompute the whole projection from the movement history with one INSERT ... SELECT."""
+        try:
+            self.db_session.execute(delete(PharmacyStock))
+            totals = self.movement_totals().subquery()
+            result = self.db_session.execute(
+                insert(PharmacyStock).from_select(
+                    ['stock_key', 'pharmacy_id', 'drug_id', 'drug_form', 'package_id', 'quantity'],
+                    select(stock_key_sql(totals.c.pharmacy_id, totals.c.drug_id, totals.c.drug_form,
+                                         totals.c.package_type),
+                           totals.c.pharmacy_id, totals.c.drug_id, totals.c.drug_form,
+                           totals.c.package_type, totals.c.quantity)
+                )
+            )
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+        return result.rowcount
+
+    def reconcile(self) -> List[dict]:
+        """Keys where the projection and the movement history disagree."""
+        totals = self.movement_totals().subquery()
+        stock = select(
+            PharmacyStock.pharmacy_id,
+            PharmacyStock.drug_id,
+            PharmacyStock.drug_form,
+            PharmacyStock.package_id,
+            func.sum(PharmacyStock.quantity).label('quantity')
+        ).group_by(PharmacyStock.pharmacy_id, PharmacyStock.drug_id,
+                   PharmacyStock.drug_form, PharmacyStock.package_id)
+
+        expected = {
+            (row.pharmacy_id, row.drug_id, row.drug_form, row.package_type): int(row.quantity)
+            for row in self.db_session.execute(select(totals))
+        }
+        actual = {
+            (row.pharmacy_id, row.drug_id, row.drug_form, row.package_id): int(row.quantity)
+            for row in self.db_session.execute(stock)
+        }
+
+        return [
+            {
+                'pharmacy_id': key[0],
+                'drug_id': key[1],
+                'drug_form': key[2],
+                'package_id': key[3],
+                'movements': expected.get(key, 0),
+                'stock': actual.get(key, 0)
+            }
+            for key in expected.keys() | actual.keys()
+            if expected.get(key, 0) != actual.get(key, 0)
+        ]
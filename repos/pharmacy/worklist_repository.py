@@ -0,0 +1,105 @@
+import json
+import logging
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from redis import RedisError
+from sqlalchemy import insert, delete, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from cache.redis import get_redis_client
+from models.pharmacy import Prescription, PrescriptionStatus, PrescriptionStatusCount
+
+logger = logging.getLogger(__name__)
+
+
+def worklist_channel(pharmacy_id: int) -> str:
+    return f"pharmacy:{pharmacy_id}:worklist"
+
+
+def encode_cursor(prescription: Prescription) -> str:
+    return f"{prescription.created_at.isoformat()}|{prescription.id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, prescription_id = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(prescription_id)
+    except ValueError:
+        raise ValueError(f"Invalid worklist cursor '{cursor}'")
+
+
+class WorklistRepository:
+    """
+    Per pharmacy status counters and change notifications for the prescription worklist.
+
+    Counters live in pharmacy_prescription_status_count and are adjusted in the transaction that
+    changes a status; nothing here commits except rebuild_counts. Changes are published on a Redis
+    channel per pharmacy after the caller commits.
+    """
+
+    def __init__(self, db_session: Session, redis=None):
+        self.db_session = db_session
+        self.redis = redis
+
+    def adjust_count(self, pharmacy_id: Optional[int], status: PrescriptionStatus, delta: int):
+        # one upsert on the non-null pharmacy_key: concurrent first prescriptions of a pharmacy and status
+        # cannot both insert, and later ones serialise on the row lock of the increment
+        dialect = postgresql if self.db_session.get_bind().dialect.name == 'postgresql' else sqlite
+        upsert = dialect.insert(PrescriptionStatusCount).values(
+            pharmacy_key=pharmacy_id or 0,
+            pharmacy_id=pharmacy_id,
+            status=status,
+            count=delta
+        )
+        self.db_session.execute(upsert.on_conflict_do_update(
+            index_elements=[PrescriptionStatusCount.pharmacy_key, PrescriptionStatusCount.status],
+            set_={'count': PrescriptionStatusCount.count + upsert.excluded.count, 'updated_at': datetime.utcnow()}
+        ))
+
+    def status_changed(self, pharmacy_id: Optional[int], old_status: Optional[PrescriptionStatus],
+                       new_status: PrescriptionStatus):
+        if old_status == new_status:
+            return
+        if old_status is not None:
+            self.adjust_count(pharmacy_id, old_status, -1)
+        self.adjust_count(pharmacy_id, new_status, 1)
+
+    def get_counts(self, pharmacy_id: int) -> dict:
+        counts = {status.value: 0 for status in PrescriptionStatus if status != PrescriptionStatus.All}
+        for row in self.db_session.query(PrescriptionStatusCount.status, PrescriptionStatusCount.count) \
+                .filter(PrescriptionStatusCount.pharmacy_id == pharmacy_id).all():
+            counts[row.status.value] = row.count
+        counts[PrescriptionStatus.All.value] = sum(counts.values())
+        return counts
+
+    def rebuild_counts(self) -> int:
+        """Recount every pharmacy and status from the prescriptions."""
+        try:
+            self.db_session.execute(delete(PrescriptionStatusCount))
+            result = self.db_session.execute(
+                insert(PrescriptionStatusCount).from_select(
+                    ['pharmacy_key', 'pharmacy_id', 'status', 'count'],
+                    select(func.coalesce(Prescription.pharmacy_id, 0), Prescription.pharmacy_id, Prescription.status,
+                           func.count(Prescription.id))
+                    .where(Prescription.status.is_not(None))
+                    .group_by(Prescription.pharmacy_id, Prescription.status)
+                )
+            )
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+        return result.rowcount
+
+    def publish(self, pharmacy_id: Optional[int], event: str, prescription: dict):
+        """Push a created or updated prescription to the pharmacy's subscribers. Call after commit."""
+        if pharmacy_id is None:
+            return
+        message = json.dumps(jsonable_encoder({'event': event, 'prescription': prescription}))
+        try:
+            (self.redis or get_redis_client()).publish(worklist_channel(pharmacy_id), message)
+        except RedisError:
+            logger.warning(f"Could not publish worklist {event} for pharmacy {pharmacy_id}")
@@ -0,0 +1,221 @@
+import json
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from cache.redis import get_redis_client
+from models.auth import User
+from models.client import Person
+from models.transaction import Payments, Transaction, ReferredTransactionSettlement, \
+    ReferredTransactionSettlementDetail, ReferredTransaction
+from repos.ledger_repository import LedgerRepository
+
+
+class ReconciliationRepository:
+    """
+    End of day cashier reconciliation.
+
+    Each day is aggregated in SQL per teller and payment method. Closed days (before today) only
+    change when a payment is back-dated, edited or removed, which invalidates the days involved, so
+    their aggregates are cached in redis without expiry and only open or uncached days hit the
+    database. Discounts and settled values are priced from the bookings, not the running balances,
+    so later payments on an older transaction leave its day untouched.
+    """
+
+    cache_prefix = "reconciliation"
+
+    def __init__(self, db_session: Session, redis=None):
+        self.db_session = db_session
+        self.redis = redis if redis is not None else get_redis_client()
+
+    def get_reconciliation(self, start_date: str, last_date: str, user_id: int = 0,
+                           payment_method: str = '', refresh: bool = False) -> dict:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        last = datetime.strptime(last_date, "%Y-%m-%d").date() if last_date else start
+        if last < start:
+            start, last = last, start
+
+        days = [start + timedelta(days=i) for i in range((last - start).days + 1)]
+        report_days = {} if refresh else self.get_cached_days(days)
+
+        missing = [day for day in days if day not in report_days]
+        if missing:
+            computed = self.compute_days(missing)
+            self.cache_closed_days(computed)
+            report_days.update(computed)
+
+        return self.summarise(days, report_days, user_id, payment_method)
+
+    def cache_key(self, day: date) -> str:
+        return f"{self.cache_prefix}:{day.isoformat()}"
+
+    def get_cached_days(self, days: List[date]) -> dict:
+        closed = [day for day in days if day < date.today()]
+        if not closed:
+            return {}
+        cached = self.redis.mget([self.cache_key(day) for day in closed])
+        return {
+            day: json.loads(value.decode("utf-8"))
+            for day, value in zip(closed, cached) if value
+        }
+
+    def cache_closed_days(self, report_days: dict):
+        closed = {
+            self.cache_key(day): json.dumps(jsonable_encoder(report))
+            for day, report in report_days.items() if day < date.today()
+        }
+        if closed:
+            self.redis.mset(closed)
+
+    def invalidate_day(self, day: date):
+        """Drop a cached day, e.g. after a back-dated payment correction."""
+        if day is not None:
+            self.redis.delete(self.cache_key(day))
+
+    def compute_days(self, days: List[date]) -> dict:
+        report_days = {day: {'payments': [], 'discounts': [], 'settlements': []} for day in days}
+
+        payments = self.db_session.query(
+            Payments.payment_date,
+            Payments.user_id,
+            Payments.payment_method,
+            Person.first_name,
+            Person.last_name,
+            func.count(Payments.id).label('payment_count'),
+            func.coalesce(func.sum(Payments.amount), 0).label('amount')
+        ).select_from(Payments) \
+            .join(User, User.id == Payments.user_id) \
+            .join(Person, Person.id == User.person_id) \
+            .filter(Payments.payment_date.in_(days),
+                    or_(Payments.is_deleted.is_(None), Payments.is_deleted == False)) \
+            .group_by(Payments.payment_date, Payments.user_id, Payments.payment_method,
+                      Person.first_name, Person.last_name).all()
+
+        for row in payments:
+            report_days[row.payment_date]['payments'].append({
+                'user_id': row.user_id,
+                'teller': f"{row.first_name} {row.last_name}",
+                'payment_method': row.payment_method.value,
+                'payment_count': row.payment_count,
+                'amount': float(row.amount)
+            })
+
+        # discounts and settled values are priced from bookings, so later payments never change a closed day
+        ledger = LedgerRepository(self.db_session)
+        day_transactions = select(Transaction.id).where(Transaction.transaction_date.in_(days))
+        billed = ledger.billed_query(day_transactions).subquery()
+        bundles = ledger.bundle_discount_query(day_transactions).subquery()
+        discount = billed.c.line_discount + billed.c.total_billed * func.coalesce(Transaction.discount, 0) / 100
+
+        discounts = self.db_session.query(
+            Transaction.transaction_date,
+            Transaction.user_id,
+            func.count(Transaction.id).label('transaction_count'),
+            func.coalesce(func.sum(discount), 0).label('discount'),
+            func.coalesce(func.sum(bundles.c.bundle_discount), 0).label('bundle_discount')
+        ).select_from(Transaction) \
+            .join(billed, billed.c.transaction_id == Transaction.id) \
+            .outerjoin(bundles, bundles.c.transaction_id == Transaction.id) \
+            .filter(Transaction.transaction_date.in_(days)) \
+            .group_by(Transaction.transaction_date, Transaction.user_id).all()
+
+        for row in discounts:
+            report_days[row.transaction_date]['discounts'].append({
+                'user_id': row.user_id,
+                'transaction_count': row.transaction_count,
+                'discount': float(row.discount),
+                'bundle_discount': float(row.bundle_discount)
+            })
+
+        day_settlements = select(ReferredTransaction.transaction_id) \
+            .join(ReferredTransactionSettlementDetail,
+                  ReferredTransactionSettlementDetail.ref_transaction_id == ReferredTransaction.id) \
+            .join(ReferredTransactionSettlement,
+                  ReferredTransactionSettlement.id == ReferredTransactionSettlementDetail.settlement_id) \
+            .where(ReferredTransactionSettlement.created_at.in_(days))
+        settled = ledger.billed_query(day_settlements).subquery()
+
+        settlements = self.db_session.query(
+            ReferredTransactionSettlement.created_at,
+            ReferredTransactionSettlement.created_by,
+            func.count(func.distinct(ReferredTransactionSettlement.id)).label('settlement_count'),
+            func.count(ReferredTransactionSettlementDetail.id).label('transaction_count'),
+            func.coalesce(func.sum(settled.c.total_billed), 0).label('settled_value')
+        ).select_from(ReferredTransactionSettlement) \
+            .join(ReferredTransactionSettlementDetail,
+                  ReferredTransactionSettlementDetail.settlement_id == ReferredTransactionSettlement.id) \
+            .join(ReferredTransaction, ReferredTransaction.id == ReferredTransactionSettlementDetail.ref_transaction_id) \
+            .outerjoin(settled, settled.c.transaction_id == ReferredTransaction.transaction_id) \
+            .filter(ReferredTransactionSettlement.created_at.in_(days)) \
+            .group_by(ReferredTransactionSettlement.created_at, ReferredTransactionSettlement.created_by).all()
+
+        for row in settlements:
+            report_days[row.created_at]['settlements'].append({
+                'user_id': row.created_by,
+                'settlement_count': row.settlement_count,
+                'transaction_count': row.transaction_count,
+                'settled_value': float(row.settled_value)
+            })
+
+        return report_days
+
+    def summarise(self, days: List[date], report_days: dict, user_id: int = 0, payment_method: str = '') -> dict:
+        def keep(row):
+            return user_id in (0, row['user_id'])
+
+        by_method = defaultdict(float)
+        by_teller = {}
+        daily = []
+        total_collected = total_discount = total_bundle_discount = total_settled = 0
+
+        for day in days:
+            report = report_days.get(day, {'payments': [], 'discounts': [], 'settlements': []})
+            payments = [row for row in report['payments']
+                        if keep(row) and (not payment_method or row['payment_method'] == payment_method)]
+            discounts = [row for row in report['discounts'] if keep(row)]
+            settlements = [row for row in report['settlements'] if keep(row)]
+
+            collected = sum(row['amount'] for row in payments)
+            for row in payments:
+                by_method[row['payment_method']] += row['amount']
+                teller = by_teller.setdefault(row['user_id'], {
+                    'user_id': row['user_id'], 'teller': row['teller'], 'payment_count': 0, 'amount': 0
+                })
+                teller['payment_count'] += row['payment_count']
+                teller['amount'] += row['amount']
+
+            discount = sum(row['discount'] for row in discounts)
+            bundle_discount = sum(row['bundle_discount'] for row in discounts)
+            settled = sum(row['settled_value'] for row in settlements)
+
+            total_collected += collected
+            total_discount += discount
+            total_bundle_discount += bundle_discount
+            total_settled += settled
+
+            daily.append({
+                'date': day,
+                'closed': day < date.today(),
+                'collected': collected,
+                'discount': discount,
+                'bundle_discount': bundle_discount,
+                'settled_referrals': settled,
+                'payments': payments,
+                'settlements': settlements
+            })
+
+        return {
+            'start_date': days[0],
+            'last_date': days[-1],
+            'total_collected': total_collected,
+            'total_discount': total_discount,
+            'total_bundle_discount': total_bundle_discount,
+            'total_settled_referrals': total_settled,
+            'by_method': dict(by_method),
+            'by_teller': list(by_teller.values()),
+            'days': daily
+        }
@@ -7,6 +7,7 @@ from sqlmodel import Session
 from dtos.service_dtos.client_cart_service import ClientServiceCartDTO, ClientServiceCartPackageDTO, \
     ClientServiceCartDetailDTO
 from models.services.service_cart import ClientServiceCart, ClientServiceCartPackage, ClientServiceCartDetail
+from repos.base_repository import in_unit_of_work
 
 
 class ServiceCartRepository:
@@ -53,11 +54,13 @@ class ServiceCartRepository:
             print(f"Unexpected error while fetching client service cart DTO: {e}")
             raise e
 
-    def create_client_service_cart(self, cart_dto: ClientServiceCartDTO) -> ClientServiceCart:
+    def create_client_service_cart(self, cart_dto: ClientServiceCartDTO, commit: bool = True) -> ClientServiceCart:
         """
         Accepts a ClientServiceCartDTO, saves it (and its nested packages/details) into the DB.
         Returns the persisted ClientServiceCart object.
+        With commit=False (or inside a UnitOfWork) the rows are only written and the caller commits.
         """
+        commit = commit and not in_unit_of_work(self.db)
         try:
             # Create main cart
             cart = ClientServiceCart(
@@ -96,18 +99,23 @@ class ServiceCartRepository:
                     appointment.cart_detail_id = detail_obj.id
                     self.db.add(appointment)
 
-            self.db.commit()
-            self.db.refresh(cart)
+            if commit:
+                self.db.commit()
+                self.db.refresh(cart)
+            else:
+                self.db.flush()
             return cart
 
         except SQLAlchemyError as e:
-            self.db.rollback()
+            if commit:
+                self.db.rollback()
             # optional: log error here
             print(f"Database error while creating client service cart: {e}")
             raise e
 
         except Exception as e:
-            self.db.rollback()
+            if commit:
+                self.db.rollback()
             # optional: log error here
             print(f"Unexpected error while creating client service cart: {e}")
             raise e
\ No newline at end of file
@@ -9,6 +9,7 @@ from models.lab.lab import CollectedSamples, LabBundleCollection, LabServicesQue
 from models.services.services import Bundles, ServiceBooking, ServiceBookingDetail, BookingStatus, \
     ServiceClinicalExamination, BusinessServices
 from models.transaction import Transaction
+from repos.ledger_repository import LedgerRepository
 from repos.services.price_repository import PriceRepository
 
 
@@ -16,6 +17,7 @@ class ServiceRepository:
     def __init__(self, session: Session):
         self.session = session
         self.price_repository = PriceRepository(session)
+        self.ledger_repository = LedgerRepository(session)
 
 
     def get_discounted_packages(self, service_id):
@@ -51,6 +53,7 @@ class ServiceRepository:
             transaction_id=service_booking.transaction_id
         )
         self.session.add(db_service_booking)
+        self.ledger_repository.refresh_balance(service_booking.transaction_id)
         self.session.commit()
         self.session.refresh(db_service_booking)
 
@@ -59,11 +62,15 @@ class ServiceRepository:
     def create_service_booking_detail(self, service_booking: ServiceBookingDetailDTO) -> ServiceBookingDetailDTO:
         db_service_booking_details = ServiceBookingDetail(**service_booking.dict())
         self.session.add(db_service_booking_details)
+        self.ledger_repository.refresh_balance(self.transaction_of_booking(service_booking.booking_id))
         self.session.commit()
         self.session.refresh(db_service_booking_details)
 
         return self.service_booking_detail_to_DTO(db_service_booking_details)
 
+    def transaction_of_booking(self, booking_id: int) -> Optional[int]:
+        return self.session.query(ServiceBooking.transaction_id).filter(ServiceBooking.id == booking_id).scalar()
+
     def service_booking_to_DTO(self, sb: ServiceBooking) -> ServiceBookingDTO:
         return {
             'id': sb.id,
@@ -141,14 +148,19 @@ class ServiceRepository:
 
     def update_service_booking(self, service_booking: ServiceBookingDTO,
                                new_service_booking: ServiceBooking) -> ServiceBookingDTO:
+        transaction_id = service_booking.transaction_id
         for var, value in vars(new_service_booking).items():
             setattr(service_booking, var, value) if value else None
+        # a booking moved to another transaction changes both bills
+        for changed in {transaction_id, service_booking.transaction_id}:
+            self.ledger_repository.refresh_balance(changed)
         self.session.commit()
         self.session.refresh(service_booking)
         return service_booking
 
     def delete_service_booking(self, service_booking: ServiceBookingDTO) -> None:
         self.session.delete(service_booking)
+        self.ledger_repository.refresh_balance(service_booking.transaction_id)
         self.session.commit()
 
     def delete_service_booking_by_id(self, service_booking: ServiceBooking) -> dict:
@@ -170,6 +182,7 @@ class ServiceRepository:
                 print('service booking deleted', service_booking.id, service_booking)
                 # Delete transaction if it has no service booking
                 self.session.query(ServiceClinicalExamination).filter(ServiceClinicalExamination.booking_id == service_booking.id).delete()
+                self.ledger_repository.refresh_balance(service_booking.transaction_id)
                 self.session.commit()
 
             return delete_booking
@@ -213,6 +226,7 @@ class ServiceRepository:
                 if bk_queue:
                     self.session.delete(bk_queue)
                 self.session.delete(bk_details)
+            self.ledger_repository.refresh_balance(service_booking.transaction_id)
             self.session.commit()
             return {
                 'msg': 'Booking deleted successfully',
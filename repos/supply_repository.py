@@ -1,15 +1,22 @@
-from typing import List
+import csv
+import io
+import json
+from typing import List, Optional
 
-from sqlalchemy import func
+from pydantic import ValidationError
+from sqlalchemy import insert
 
 from dtos.pharmacy.drug import DrugDTO
-from dtos.supply import SupplyDTO
-from models.pharmacy import Drug, DrugForm, PharmacyDrugMovement, PharmDrugFormPackage
-from models.product import ProductPackage
+from dtos.supply import SupplyDTO, SupplyLineDTO, SupplyIntakeDTO
+from dtos.transaction import PaymentDTO
+from models.pharmacy import Drug
 from models.supply import Supply, SupplyDetail, SupplyPharmDetail
 from models.transaction import Payments
 from repos.base_repository import BaseRepository
+from repos.ledger_repository import LedgerRepository
 from repos.pharmacy.drug_repository import DrugRepository
+from repos.pharmacy.lot_repository import LotRepository
+from repos.pharmacy.stock_repository import StockRepository
 from repos.transaction_repository import TransactionRepository
 
 
@@ -18,71 +25,147 @@ class SupplyRepository(BaseRepository):
         super().__init__(db)
         self.transaction_repository = TransactionRepository(db)
         self.drug_repository = DrugRepository(db)
+        self.stock_repository = StockRepository(db)
+        self.lot_repository = LotRepository(db)
+        self.ledger_repository = LedgerRepository(db)
 
     def process_supply(self, supply: SupplyDTO):
-        try:
-            transaction = self.transaction_repository.create_transaction(supply.discount)
-
-            supply_data = self.add(
-                Supply(
-                    transaction_id=transaction["id"],
-                    supplier_id=supply.supplier.supplier_id,
-                    pharmacy_id=supply.pharmacy.id
-                )
+        lines = [
+            SupplyLineDTO(
+                drug_id=product.drug.drug_info.id,
+                package_id=product.package_container,
+                quantity=product.supply_quantity,
+                drug_form=product.drug_form,
+                buying_price=product.buying_price,
+                manufacture_date=product.manufacture_date or None,
+                expiry_date=product.expiry_date or None
             )
+            for product in supply.cart or []
+        ]
+        self.intake(supply.supplier.supplier_id, supply.pharmacy.id, lines, supply.discount, supply.payment)
+        return supply
+
+    def intake(self, supplier_id: int, pharmacy_id: int, lines: List[SupplyLineDTO], discount: float = 0.0,
+               payments: Optional[List[PaymentDTO]] = None) -> SupplyIntakeDTO:
+        """
+        Record a delivery in one transaction: every table is written with a single multi-row INSERT
+        and the session is committed once, however many lines the delivery has. Payments go through
+        the ledger so they get their journal entries and the transaction balance.
+        """
+        if not lines:
+            raise ValueError("A supply must have at least one line")
 
-            for product in supply.cart:
-                self.add(
-                    SupplyDetail(
-                        product_id=product.drug.product.id,
-                        manufacture_date=product.manufacture_date,
-                        expiry_date=product.expiry_date,
-                        # drug_form=product.drug_form,
-                        quantity=product.supply_quantity,
-                        product_packaging_id=product.package_container,
-                        supply_id=supply_data.id,
-                    )
-                )
-
-                # record drug movement
-                self.add(
-                    PharmacyDrugMovement(
-                        transaction_id=transaction["id"],
-                        drug_form=product.drug_form,
-                        drug_id=product.drug.drug_info.id,
-                        package_type=product.package_container,
-                        quantity=-product.supply_quantity,
-                    )
-                )
-
-                self.add(
-                    SupplyPharmDetail(
-                        supply_id=supply_data.id,
-                        drug_form=product.drug_form
-                    )
-                )
-
-            # process payment
-            for pay in supply.payment:
-                self.add(
+        try:
+            products = dict(
+                self.db.query(Drug.id, Drug.product_id)
+                .filter(Drug.id.in_({line.drug_id for line in lines})).all()
+            )
+            unknown = sorted({line.drug_id for line in lines} - products.keys())
+            if unknown:
+                raise ValueError(f"Unknown drugs in supply: {', '.join(map(str, unknown))}")
+
+            transaction = self.transaction_repository.create_transaction(discount, commit=False)
+            supply_id = self.db.execute(
+                insert(Supply).returning(Supply.id),
+                [{'transaction_id': transaction["id"], 'supplier_id': supplier_id, 'pharmacy_id': pharmacy_id}]
+            ).scalar_one()
+
+            detail_ids = self.db.execute(
+                insert(SupplyDetail).returning(SupplyDetail.id, sort_by_parameter_order=True),
+                [
+                    {
+                        'product_id': products[line.drug_id],
+                        'manufacture_date': line.manufacture_date,
+                        'expiry_date': line.expiry_date,
+                        'quantity': line.quantity,
+                        'buying_price': line.buying_price,
+                        'product_packaging_id': line.package_id,
+                        'supply_id': supply_id
+                    }
+                    for line in lines
+                ]
+            ).scalars().all()
+
+            # supplies are recorded as negative movements, stock on hand is updated with them
+            self.stock_repository.record_movements([
+                {
+                    'transaction_id': transaction["id"],
+                    'drug_form': line.drug_form,
+                    'drug_id': line.drug_id,
+                    'package_id': line.package_id,
+                    'quantity': -line.quantity,
+                    'pharmacy_id': pharmacy_id
+                }
+                for line in lines
+            ])
+
+            # each supplied line is a lot that dispensing draws from by expiry date
+            self.lot_repository.receive_lots([
+                {
+                    'drug_id': line.drug_id,
+                    'quantity': line.quantity,
+                    'pharmacy_id': pharmacy_id,
+                    'drug_form': line.drug_form,
+                    'package_id': line.package_id,
+                    'expiry_date': line.expiry_date,
+                    'manufacture_date': line.manufacture_date,
+                    'supply_detail_id': detail_id
+                }
+                for line, detail_id in zip(lines, detail_ids)
+            ])
+
+            self.db.execute(insert(SupplyPharmDetail), [
+                {'supply_id': supply_id, 'drug_form': line.drug_form} for line in lines
+            ])
+
+            if payments:
+                self.ledger_repository.open_balance(transaction["id"])
+                paid = [
                     Payments(
                         amount=pay.amount,
                         transaction_id=transaction["id"],
                         user_id=transaction["user_id"],
                         payment_method=pay.payment_method
                     )
-                )
-
-            # If you have a commit method, call it here:
-            self.commit_transaction()  # <-- commit all changes here
-
-            return supply
-
-        except Exception as e:
-            # If you have a rollback method, call it here:
-            self.rollback_transaction()  # <-- rollback changes on failure
-            # log or re-raise the exception for the caller
-            raise e
+                    for pay in payments
+                ]
+                self.db.add_all(paid)
+                self.db.flush()
+                for payment in paid:
+                    self.ledger_repository.record_payment(payment)
+
+            self.commit_transaction()
+        except Exception:
+            self.rollback_transaction()
+            raise
+
+        return SupplyIntakeDTO(supply_id=supply_id, transaction_id=transaction["id"], lines=len(lines))
+
+    def parse_delivery_note(self, content: bytes, file_format: str) -> List[SupplyLineDTO]:
+        """
+        Read delivery note lines from csv (with a header row) or a json array. Columns are the
+        SupplyLineDTO fields; empty cells are treated as missing.
+        """
+        text = content.decode('utf-8-sig')
+        if file_format == 'csv':
+            rows = list(csv.DictReader(io.StringIO(text)))
+        elif file_format == 'json':
+            rows = json.loads(text)
+            if not isinstance(rows, list):
+                raise ValueError("Delivery note must be a json array of lines")
+        else:
+            raise ValueError(f"Unsupported delivery note format '{file_format}'")
+
+        lines = []
+        for number, row in enumerate(rows, 1):
+            try:
+                lines.append(SupplyLineDTO(**{
+                    key.strip(): value for key, value in row.items()
+                    if key and value not in ('', None)
+                }))
+            except (ValidationError, AttributeError) as e:
+                raise ValueError(f"Invalid delivery note line {number}: {e}")
+        return lines
 
     def commit_transaction(self):
         self.db.commit()
@@ -92,36 +175,16 @@ class SupplyRepository(BaseRepository):
 
     def pharmacy_inventory(self, skip: int = 0, limit: int = 100, include_deleted: bool = False,
                            pharm_id: int = 0) -> List:
-        drugs = self.drug_repository.get_all(skip, limit)
+        drugs = self.drug_repository.get_all(skip, limit, include_deleted)
+        stock_by_drug = self.stock_repository.stock_by_package(drugs, pharm_id)
 
         stock = []
         for drug in drugs:
             count = {
-                "stock": self.stock_in_pharmacy(drug)
+                "stock": stock_by_drug.get(drug.drug_info.id, [])
             }
             stock.append(drug.__dict__ | count)
         return stock
 
-    def stock_in_pharmacy(self, drug: DrugDTO) -> int:
-
-        drug_forms = self.db.query(DrugForm).filter(DrugForm.drug_id == drug.drug_info.id).all()
-
-        stock = []
-        for drug_form in drug_forms:
-            # get all packages of this form
-            drug_form_packages = self.db.query(PharmDrugFormPackage).filter(PharmDrugFormPackage.form_id == drug_form.id).all()
-
-            for drug_form_package in drug_form_packages:
-                quantity = self.db.query(func.sum(PharmacyDrugMovement.quantity)) \
-                               .filter(
-                    PharmacyDrugMovement.drug_id == drug.drug_info.id,
-                    PharmacyDrugMovement.package_type == drug_form_package.id
-                ).scalar() or 0
-
-                stock.append({
-                    'form': drug_form.drug_form,
-                    'quantity': quantity,
-                    'package': drug_form_package.__dict__,
-                })
-
-        return stock
+    def stock_in_pharmacy(self, drug: DrugDTO, pharm_id: int = 0) -> List[dict]:
+        return self.stock_repository.stock_by_package([drug], pharm_id).get(drug.drug_info.id, [])
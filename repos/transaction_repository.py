@@ -5,12 +5,15 @@ from dtos.transaction import TransactionDTO, TransactionPackageDTO
 from models.auth import User
 from models.client import Person, Client
 from models.services.services import ServiceBooking, BookingStatus, Bundles
-from models.transaction import Transaction, TransactionType, ReferredTransaction, PackageTransaction
+from models.transaction import Transaction, TransactionType, ReferredTransaction, PackageTransaction, \
+    TransactionBalance
 from repos.auth_repository import UserRepository
+from repos.base_repository import stream
 from repos.client.client_repository import ClientRepository
 from repos.client.referral_repository import ReferralRepository
 from repos.consultation.consultant_repository import ConsultantRepository
 from repos.lab.lab_repository import LabRepository
+from repos.ledger_repository import LedgerRepository
 from repos.payment_repository import PaymentRepository
 from repos.services.service_bundle_repository import ServiceBundleRepository
 from repos.services.service_repository import ServiceRepository
@@ -43,7 +46,51 @@ class TransactionRepository:
                          client_id: int, date_filter: DateFilterDTO, booking_id: int = 0,
                          only_referred_transaction: bool = False):
 
-        rs = self.db_session.query(*self.result_cols).select_from(ServiceBooking) \
+        rs = self.filter_transactions(self.result_cols, booking_status, search_text, transaction_type, client_id,
+                                      date_filter, booking_id, only_referred_transaction)
+
+        total = rs.count()
+        transactions = rs.order_by(Transaction.transaction_time.desc()).offset(skip).limit(limit).all()
+        return {
+            'transactions': transactions,
+            'total': total
+        }
+
+    def export_transactions(self, booking_status: BookingStatus, search_text: str,
+                            transaction_type: TransactionType, client_id: int, date_filter: DateFilterDTO,
+                            only_referred_transaction: bool = False, batch_size: int = 1000):
+        """
+        Yields the get_transactions rows with their balances, read through a server-side cursor.
+
+        The balances are the transaction_balance snapshots, which are re-priced whenever a bill changes
+        (see LedgerRepository.refresh_balance), so unpaid transactions export what they owe.
+        """
+        cols = [
+            Transaction.id,
+            Transaction.transaction_time,
+            ServiceBooking.id.label("booking_id"),
+            ServiceBooking.booking_status,
+            Transaction.transaction_status,
+            ServiceBooking.client_id,
+            Person.first_name,
+            Person.last_name,
+            Transaction.discount,
+            TransactionBalance.total_billed,
+            TransactionBalance.total_paid,
+            TransactionBalance.outstanding
+        ]
+        rs = self.filter_transactions(cols, booking_status, search_text, transaction_type, client_id,
+                                      date_filter, 0, only_referred_transaction) \
+            .outerjoin(TransactionBalance, TransactionBalance.transaction_id == Transaction.id) \
+            .order_by(Transaction.transaction_time.desc())
+
+        for row in stream(rs, batch_size):
+            yield tuple(row)
+
+    def filter_transactions(self, cols, booking_status: BookingStatus, search_text: str,
+                            transaction_type: TransactionType, client_id: int, date_filter: DateFilterDTO,
+                            booking_id: int = 0, only_referred_transaction: bool = False):
+        rs = self.db_session.query(*cols).select_from(ServiceBooking) \
             .join(Transaction, Transaction.id == ServiceBooking.transaction_id) \
             .join(Client, Client.id == ServiceBooking.client_id) \
             .join(Person, Person.id == Client.person_id)
@@ -62,7 +109,7 @@ class TransactionRepository:
 
         if date_filter.get("start_date") or date_filter.get("last_date"):
             start_date = date_filter.get("start_date")
-            last_date = date_filter.get("last_date") + ' 23:59:59.999999'
+            last_date = date_filter.get("last_date") + ' 23:59:59.999999' if date_filter.get("last_date") else None
             rs = rs.filter(
                 Transaction.transaction_time.between(start_date, last_date)
                 if start_date and last_date else
@@ -78,13 +125,7 @@ class TransactionRepository:
                           (Person.last_name.ilike(f"%{search_text}%")) |
                           (Person.phone.ilike(f"%{search_text}%"))
                           )
-
-        total = rs.count()
-        transactions = rs.order_by(Transaction.transaction_time.desc()).offset(skip).limit(limit).all()
-        return {
-            'transactions': transactions,
-            'total': total
-        }
+        return rs
 
     def get_lab_transaction_packages(self, transaction_id):
         cols = [Bundles.bundles_name,
@@ -162,6 +203,9 @@ class TransactionRepository:
         urp = UserRepository(self.db_session)
         lrp = LabRepository(self.db_session)
 
+        referrals = self.referral_repository.get_referred_transactions_referral(
+            [lab_booking.id for lab_booking in rs['transactions']])
+
         response = []
         for lab_booking in rs['transactions']:
             payments = prp.get_transaction_payments(lab_booking.id)
@@ -181,7 +225,7 @@ class TransactionRepository:
                         lab_booking.booking_id),
                     'payment': payments,
                     'services': lab_services,
-                    'referral': self.referral_repository.get_referred_transaction_referral(lab_booking.id)
+                    'referral': referrals.get(lab_booking.id)
                 }
             )
         return {
@@ -195,7 +239,7 @@ class TransactionRepository:
             return True
         return False
 
-    def create_transaction(self, discount: float):
+    def create_transaction(self, discount: float, commit: bool = True):
         tid = generate_transaction_id()
 
         continue_tid_generation = True
@@ -204,7 +248,10 @@ class TransactionRepository:
 
         new_transaction = Transaction(id=tid, user_id=self.user_id, discount=discount)
         self.db_session.add(new_transaction)
-        self.db_session.commit()
+        if commit:
+            self.db_session.commit()
+        else:
+            self.db_session.flush()
 
         # Serialize Transaction object into dictionary
         transaction_dict = {
@@ -221,6 +268,7 @@ class TransactionRepository:
         pt = PackageTransaction(transaction_id=transaction_package.transaction_id,
                                 package_id=transaction_package.package_id)
         self.db_session.add(pt)
+        LedgerRepository(self.db_session).refresh_balance(transaction_package.transaction_id)
         self.db_session.commit()
         self.db_session.refresh(pt)
         return TransactionPackageDTO.from_orm(pt)
@@ -232,6 +280,7 @@ class TransactionRepository:
         transaction = self.get_transaction_by_id(transaction_id)
         if transaction:
             transaction.discount = new_discount
+            LedgerRepository(self.db_session).refresh_balance(transaction_id)
             self.db_session.commit()
             return transaction
         return None
@@ -9,6 +9,7 @@ from db import get_db
 from starlette.responses import JSONResponse
 
 from repos.client.client_repository import ClientRepository
+from utils.export import export_response
 
 client_router = APIRouter()
 
@@ -56,6 +57,13 @@ async def get_all_clients(skip: int = 0,
     return data
 
 
+@client_router.get('/api/clients/export', tags=['Clients'])
+def export_clients(file_format: str = 'csv', keyword: str = ''):
+    headers = ['Client ID', 'First Name', 'Middle Name', 'Last Name', 'Sex', 'Date of Birth', 'Marital Status',
+               'Blood Group', 'Phone', 'Email', 'Address', 'Occupation', 'Enrollment Date']
+    return export_response(lambda db: ClientRepository(db).export_clients(keyword), headers, file_format, 'clients')
+
+
 @client_router.get('/api/clients/client', response_model=None, tags=['Clients'])
 def get_client(id: int, repo: ClientRepository = Depends(get_client_repository)):
     # return JSONResponse(status_code=status.HTTP_200_OK, content=repos.client_repository.get_client(db, id))
@@ -1,14 +1,19 @@
 from http.client import HTTPException
+from typing import Annotated
 
 from fastapi import APIRouter, Depends, Query
 
+from dtos.auth import UserDTO
 from dtos.people import ReferralDTO, PersonDTO, OrganisationDTO
+from dtos.transaction import ReferralSettlementRunDTO
 from db import get_db
 from sqlalchemy.orm import Session
 
 from repos.client.organization_repository import OrganizationRepository, OrganizationPeopleRepository
 from repos.client.person_repository import PersonRepository
 from repos.client.referral_repository import ReferralRepository
+from repos.client.referral_settlement_repository import ReferralSettlementRepository
+from security.dependencies import get_current_active_user
 
 referral_router = APIRouter(prefix='/api/clients/referral', tags=['Clients', 'Referral'])
 
@@ -29,6 +34,25 @@ def get_organization_repository(db: Session = Depends(get_db)) -> OrganizationRe
     return OrganizationRepository(db)
 
 
+def get_settlement_repository(db: Session = Depends(get_db)) -> ReferralSettlementRepository:
+    return ReferralSettlementRepository(db)
+
+
+@referral_router.get("/settlements/unsettled")
+def get_unsettled_transactions(start_date: str, last_date: str = '', referral_id: int = 0,
+                               repo: ReferralSettlementRepository = Depends(get_settlement_repository)):
+    """Unsettled referred transactions in the date range with their totals, grouped per referrer."""
+    return repo.get_unsettled(start_date, last_date, referral_id)
+
+
+@referral_router.post("/settlements/")
+def settle_referred_transactions(run: ReferralSettlementRunDTO,
+                                 current_user: Annotated[UserDTO, Depends(get_current_active_user)],
+                                 repo: ReferralSettlementRepository = Depends(get_settlement_repository)):
+    """Settles every unsettled referred transaction in the date range, one settlement per referrer."""
+    return repo.settle(run.start_date, run.last_date, current_user.id, run.referral_id)
+
+
 @referral_router.post("/")
 def create_referral(referral: ReferralDTO,
                     repo: ReferralRepository = Depends(get_referral_repository),
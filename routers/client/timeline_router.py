@@ -0,0 +1,30 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from starlette import status
+
+from db import get_db
+from dtos.client.timeline import TimelineDTO
+from repos.client.timeline_repository import TimelineRepository
+
+timeline_router = APIRouter(prefix='/api/clients/timeline', tags=['Clients'])
+
+
+def get_timeline_repository(db: Session = Depends(get_db)) -> TimelineRepository:
+    return TimelineRepository(db)
+
+
+@timeline_router.get("/{client_id}", response_model=TimelineDTO)
+def get_client_timeline(client_id: int,
+                        cursor: Optional[str] = Query(None),
+                        limit: int = Query(50),
+                        repo: TimelineRepository = Depends(get_timeline_repository)):
+    """
+    Consultations, lab results, vitals, prescriptions and referrals of a client, newest first.
+    Pass the returned next_cursor to get older events.
+    """
+    try:
+        return repo.get_timeline(client_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
@@ -0,0 +1,84 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from starlette import status
+
+from db import get_db
+from dtos.consultation_analytics import SymptomStatDTO, DiagnosisStatDTO, SystemReviewStatDTO, FollowUpReportDTO
+from repos.consultation.analytics_repository import ConsultationAnalyticsRepository
+
+consultation_analytics_router = APIRouter(prefix="/api/clinicals/analytics", tags=["Clinicals", "Analytics"])
+
+
+def get_analytics_repository(db: Session = Depends(get_db)) -> ConsultationAnalyticsRepository:
+    return ConsultationAnalyticsRepository(db)
+
+
+@consultation_analytics_router.get("/symptoms", response_model=List[SymptomStatDTO])
+def get_symptom_stats(start_date: Optional[str] = Query(None), end_date: Optional[str] = Query(None),
+                      limit: int = Query(20),
+                      repo: ConsultationAnalyticsRepository = Depends(get_analytics_repository)):
+    """
+    Most frequent presenting symptoms between two dates (the last 30 days by default), by severity.
+    """
+    try:
+        return repo.get_symptoms(start_date, end_date, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@consultation_analytics_router.get("/diagnoses", response_model=List[DiagnosisStatDTO])
+def get_diagnosis_stats(start_date: Optional[str] = Query(None), end_date: Optional[str] = Query(None),
+                        limit: int = Query(20),
+                        repo: ConsultationAnalyticsRepository = Depends(get_analytics_repository)):
+    """
+    Consultations per ICD-10 head code of their preliminary diagnosis between two dates.
+    """
+    try:
+        return repo.get_diagnoses(start_date, end_date, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@consultation_analytics_router.get("/systems", response_model=List[SystemReviewStatDTO])
+def get_system_review_stats(start_date: Optional[str] = Query(None), end_date: Optional[str] = Query(None),
+                            repo: ConsultationAnalyticsRepository = Depends(get_analytics_repository)):
+    """
+    Review of systems entries per system between two dates.
+    """
+    try:
+        return repo.get_systems(start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@consultation_analytics_router.get("/follow-ups", response_model=FollowUpReportDTO)
+def get_follow_up_stats(start_date: Optional[str] = Query(None), end_date: Optional[str] = Query(None),
+                        repo: ConsultationAnalyticsRepository = Depends(get_analytics_repository)):
+    """
+    Daily consultations, follow-ups and follow-up rates between two dates.
+    """
+    try:
+        return repo.get_follow_ups(start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@consultation_analytics_router.post("/refresh")
+def refresh_analytics(repo: ConsultationAnalyticsRepository = Depends(get_analytics_repository)):
+    """
+    Recompute the days changed since the last refresh; the periodic job does the same.
+    """
+    return {'refreshed': repo.refresh()}
+
+
+@consultation_analytics_router.post("/rebuild")
+def rebuild_analytics(repo: ConsultationAnalyticsRepository = Depends(get_analytics_repository)):
+    """
+    Recompute every day's aggregates from the consultation history.
+    """
+    try:
+        return {'rebuilt': repo.rebuild()}
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
@@ -1,21 +1,25 @@
 import json
-from typing import Annotated
+from typing import Annotated, List, Optional
 
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.encoders import jsonable_encoder
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from starlette import status
 from starlette.responses import JSONResponse
 
 from cache.redis import get_redis_client
 from dtos.auth import UserDTO
 from dtos.client.icd10 import Icd10Response
-from dtos.consultation import *
+from dtos.consultant import ConsultantDTO
+from dtos.consultation import ClinicalExaminationDTO, ConsultationAppointmentDTO, ConsultationDTO, \
+    ConsultationDetailDTO, ConsultationQueueDTO, ConsultationUpdate, InHoursDTO, SlotReservationDTO, SymptomDTO
 from sqlalchemy.orm import Session
-from db import get_db
+from db import get_db, SessionLocal
+from models.consultation import QueueStatus
 from repos.client.icd10_repository import Icd10Repository
 from repos.consultation.clinical_examination_repository import ClinicalExaminationRepository
 from repos.consultation.consultant_repository import ConsultantRepository
 from repos.consultation.consultation_repository import ConsultationsRepository
+from repos.consultation.queue_detail_cache import QUEUE_DETAIL_KEY, cache_queue_details
+from repos.consultation.slot_repository import SlotRepository
 from security.dependencies import require_access_privilege
 
 consultation_router = APIRouter(prefix="/api/clinicals", tags=["Clinicals"])
@@ -25,6 +29,19 @@ def get_consultation_repository(db: Session = Depends(get_db)) -> ConsultantRepo
     return ConsultantRepository(db)
 
 
+def prefetch_queue_details(consultant_id: int):
+    """Cache the details of a consultant's next patients, after the board has been sent."""
+    db = SessionLocal()
+    try:
+        ConsultantRepository(db).prefetch_queue_details(consultant_id)
+    finally:
+        db.close()
+
+
+def get_slot_repository(db: Session = Depends(get_db)) -> SlotRepository:
+    return SlotRepository(db)
+
+
 def get_icd10_repository(db: Session = Depends(get_db)) -> Icd10Repository:
     return Icd10Repository(db)
 
@@ -62,12 +79,12 @@ def update_consultant(consultant: ConsultantDTO, repo: ConsultantRepository = De
 
 
 @consultation_router.get("/consultation/consultants", response_model=List[ConsultantDTO], tags=["Consultants"])
-def get_consultants(skip: int = 0, limit: int = 100,
+def get_consultants(skip: int = 0, limit: int = 100, specialism_id: Optional[int] = None,
                     repo: ConsultantRepository = Depends(get_consultation_repository)):
     """
-    Get a list of consultants with optional pagination.
+    Get a list of consultants with optional pagination, optionally only those of a specialism.
     """
-    return repo.get_consultants(skip=skip, limit=limit)
+    return repo.get_consultants(skip=skip, limit=limit, specialism_id=specialism_id)
 
 
 @consultation_router.get("/consultation/consultant/", response_model=ConsultantDTO, tags=["Consultants"])
@@ -75,7 +92,10 @@ def get_consultant(id: int, repo: ConsultantRepository = Depends(get_consultatio
     """
     Get a consultant.
     """
-    return repo.get_consultant(id)
+    consultant = repo.get_consultant(id)
+    if consultant is None:
+        raise HTTPException(status_code=404, detail="Consultant not found")
+    return consultant
 
 
 @consultation_router.post("/consultation/consultants/inhours", response_model=InHoursDTO)
@@ -90,13 +110,40 @@ def add_consulting_hours(in_hours: InHoursDTO,
 @consultation_router.get("/consultation/consultants/inhours")
 def get_all_consulting_hours(start_time: str, end_time: str, consultant_id: int,
                              repo: ConsultantRepository = Depends(get_consultation_repository)):
-    return repo.get_expanded_in_hours(start_time, end_time, consultant_id)
+    try:
+        return repo.get_expanded_in_hours(start_time, end_time, consultant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@consultation_router.post("/consultation/consultant/queue/reserve", response_model=SlotReservationDTO)
+def reserve_consultation_slot(reservation: SlotReservationDTO,
+                              repo: SlotRepository = Depends(get_slot_repository)):
+    """
+    Hold a free appointment slot for a few minutes. Book it by passing the token as the queue reservation.
+    """
+    try:
+        return repo.reserve(reservation.schedule_id, reservation.consultation_time)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@consultation_router.post("/consultation/consultant/queue/release")
+def release_consultation_slot(reservation: SlotReservationDTO,
+                              repo: SlotRepository = Depends(get_slot_repository)):
+    try:
+        return {'released': repo.release(reservation.schedule_id, reservation.consultation_time, reservation.token)}
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
 
 
 @consultation_router.post("/consultation/consultant/queue/", response_model=ConsultationQueueDTO)
 def add_consultation_queue(consultant_queue: ConsultationQueueDTO,
                            repo: ConsultantRepository = Depends(get_consultation_repository)):
-    queue = repo.add_consultant_queue(consultant_queue)
+    try:
+        queue = repo.add_consultant_queue(consultant_queue)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     if queue is None:
         raise HTTPException(status_code=422, detail="Problem persisting consultation queue")
     return queue
@@ -124,7 +171,7 @@ def search_icd10(keyword: str, skip: int = 0, limit: int = 100,
 def get_consultation_booking(queue_id: int, refresh: int = 0,
                              repo: ConsultantRepository = Depends(get_consultation_repository)):
     redis = get_redis_client()
-    cache_key = f"consultation:{queue_id}"
+    cache_key = QUEUE_DETAIL_KEY.format(queue_id=queue_id)
     cached_consultation = redis.get(cache_key)
 
     if cached_consultation and refresh == 0:
@@ -135,16 +182,18 @@ def get_consultation_booking(queue_id: int, refresh: int = 0,
     queue = repo.get_consultation_queue_by_id(queue_id)
     if queue is None:
         raise HTTPException(status_code=404, detail="Consultation Booking not found")
-    safe_data = jsonable_encoder(queue)
-    redis.set(cache_key, json.dumps(safe_data), ex=300)
+    cache_queue_details({queue_id: queue}, redis)
 
     return queue
 
 
 @consultation_router.get("/consultation/consultant/queue/", response_model=List[ConsultationAppointmentDTO])
-def get_consultation_booking(consultant_id: int = 0, client_id=0, start_date='',
+def get_consultation_booking(background_tasks: BackgroundTasks, consultant_id: int = 0, client_id=0, start_date='',
                              last_date='', status: str = QueueStatus.Processed, in_hour_id: int = 0,
+                             skip: int = 0, limit: int = 100,
                              repo: ConsultantRepository = Depends(get_consultation_repository)):
+    if consultant_id:
+        background_tasks.add_task(prefetch_queue_details, consultant_id)
 
     return repo.get_consultant_queue(
         consultant_id,
@@ -152,7 +201,9 @@ def get_consultation_booking(consultant_id: int = 0, client_id=0, start_date='',
         start_date,
         last_date,
         in_hour_id,
-        status
+        status,
+        skip,
+        limit
     )
 
 
@@ -216,15 +267,32 @@ def get_consultations_repository(db: Session = Depends(get_db)) -> Consultations
                          response_model=List[ConsultationDetailDTO],
                          tags=["Service", "Consultation"],
                          summary="Get a list of consultations",
-                         description="Retrieve paginated service consultation with optional skip and limit"
+                         description="Retrieve paginated service consultation with optional skip and limit. "
+                                     "Set detail=1 to include examinations, prescriptions and reviews of systems"
                          )
 def list_consultations(
         repo: ConsultationsRepository = Depends(get_consultations_repository),
         skip: int = 0,
         limit: int = 100,
         client_id: int = 0,
+        detail: int = 0,
 ):
-    return repo.get_all(skip=skip, limit=limit, client_id=client_id)
+    return repo.get_all(skip=skip, limit=limit, client_id=client_id, detail=bool(detail))
+
+
+@consultation_router.get("/consultation/detail/",
+                         response_model=ConsultationDetailDTO,
+                         tags=["Service", "Consultation"],
+                         summary="Get a consultation with its examination, prescription and review of systems",
+                         )
+def get_consultation_detail(
+        consultation_id: int,
+        repo: ConsultationsRepository = Depends(get_consultations_repository)
+):
+    consultation = repo.get_detail(consultation_id)
+    if not consultation:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Consultation not found")
+    return consultation
 
 
 # GET a single consultation by ID
@@ -16,6 +16,7 @@ from repos.lab.result_repository import ResultRepository
 from repos.lab.sample_repository import CollectedSamplesRepository
 from repos.transaction_repository import TransactionRepository
 from security.dependencies import get_current_active_user
+from utils.export import export_response
 
 result_router = APIRouter(prefix="/api/lab-results", tags=["Lab Results"])
 
@@ -84,6 +85,23 @@ def read_sample_results(limit: int = 15, skip: int = 0,
     return sample_results
 
 
+@result_router.get("/sample-results/export")
+def export_sample_results(file_format: str = 'csv', lab_id: int = 0, search_text: Optional[str] = None,
+                          start_date: Optional[str] = None,
+                          last_date: Optional[datetime] = None,
+                          date_filter_status: Optional[str] = None):
+    date_filter: DateFilterDTO = {
+        "start_date": start_date,
+        "last_date": last_date,
+        "status": date_filter_status
+    }
+    headers = ['Result ID', 'Booking ID', 'Investigation', 'Client First Name', 'Client Last Name', 'Sample ID',
+               'Sample Type', 'Container Label', 'Collected At', 'Status', 'Comment', 'Created At', 'Created By']
+    return export_response(
+        lambda db: ResultRepository(db).export_sample_results(lab_id, search_text, date_filter),
+        headers, file_format, 'sample_results')
+
+
 @result_router.get("/sample-results/verified/")
 def read_verified_sample_results(limit: int = 15, skip: int = 0, lab_id: int = 0, search_text: str = '',
                                  start_date: datetime = None, last_date: datetime = None, date_filter_status: str = '',
@@ -207,15 +225,16 @@ def unarchive_completed_lab_booking(booking_id: int,
 
 @result_router.get("/analytics/compute-average-times")
 def compute_average_times(lab_service_id: int = 0, lab_id: int = 0, start_date: str = None,
-                          last_date: str = None, date_filter_status: str = None,
-                          repo: ResultRepository = Depends(sample_result_repo)):
+                          last_date: str = None, date_filter_status: str = None, include_data: int = 0,
+                          skip: int = 0, limit: int = 100, repo: ResultRepository = Depends(sample_result_repo)):
     # try:
     date_filter: DateFilterDTO = {
         "start_date": start_date,
         "last_date": last_date,
         "status": date_filter_status
     }
-    average_times = repo.compute_avg_processing_time(lab_service_id, lab_id, date_filter)
+    average_times = repo.compute_avg_processing_time(lab_service_id, lab_id, date_filter, include_data == 1,
+                                                     skip, limit)
     return average_times
 
 
@@ -1,9 +1,11 @@
 from routers.pharmacy.drug_router import drug_router
 from routers.pharmacy.pharmacy_router import pharmacy_router
 from routers.pharmacy.prescription_router import prescription_router
+from routers.pharmacy.worklist_router import worklist_router
 
 pharm_routers = [
     pharmacy_router,
     drug_router,
-    prescription_router
+    prescription_router,
+    worklist_router
 ]
\ No newline at end of file
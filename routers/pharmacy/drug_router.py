@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from db import get_db
 from dtos.pharmacy.drug import DrugDTO, DrugGroupDTO
 from repos.pharmacy.drug_group_repository import DrugGroupRepository
+from repos.pharmacy.barcode_repository import BarcodeRepository
 from repos.pharmacy.drug_repository import DrugRepository
 
 drug_router = APIRouter(
@@ -33,8 +34,7 @@ def read_drugs(
         include_deleted: bool = False,
         repo: DrugRepository = Depends(get_drug_repository)
 ):
-    drugs = repo.get_all(include_deleted=include_deleted)
-    return {'data': drugs[skip: skip + limit], 'total': len(drugs)}
+    return repo.get_page(skip, limit, include_deleted)
 
 
 @drug_router.get("/{drug_id}", response_model=DrugDTO)
@@ -95,6 +95,38 @@ def restore_drug(
     return db_drug
 
 
+@drug_router.get("/scan/{barcode}")
+def scan_barcode(
+        barcode: str,
+        pharm_id: int = Query(0),
+        db: Session = Depends(get_db)
+):
+    """
+    Resolve a scanned barcode to its package, drug and price, with stock on hand when pharm_id is given.
+    """
+    package = BarcodeRepository(db).scan(barcode, pharm_id)
+    if package is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Barcode not found"
+        )
+    return package
+
+
+@drug_router.get("/search/")
+def search_drugs(
+        q: str = Query(...),
+        skip: int = Query(0),
+        limit: int = Query(20),
+        include_deleted: bool = False,
+        repo: DrugRepository = Depends(get_drug_repository)
+):
+    """
+    Ranked search over brand and product name, description, manufacturer and active ingredients.
+    """
+    return repo.search(q, skip=skip, limit=limit, include_deleted=include_deleted)
+
+
 @drug_router.get("/search/{name}")
 def search_by_name(
         name: str,
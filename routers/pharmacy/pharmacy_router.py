@@ -4,6 +4,8 @@ from sqlalchemy.orm import Session
 
 from db import get_db
 from repos.pharmacy.drug_group_repository import DrugGroupRepository
+from repos.pharmacy.lot_repository import LotRepository
+from repos.pharmacy.stock_repository import StockRepository
 from repos.supply_repository import SupplyRepository
 
 pharmacy_router = APIRouter(
@@ -17,10 +19,61 @@ def get_supply_repository(db: Session = Depends(get_db)):
     return SupplyRepository(db)
 
 
+def get_stock_repository(db: Session = Depends(get_db)):
+    return StockRepository(db)
+
+
+def get_lot_repository(db: Session = Depends(get_db)):
+    return LotRepository(db)
+
+
 @pharmacy_router.get("/stock/")
-def get_all_drug_groups(skip: int = Query(0), limit: int = Query(100),
+def get_all_drug_groups(skip: int = Query(0), limit: int = Query(100), pharm_id: int = Query(0),
                         repo: SupplyRepository = Depends(get_supply_repository)):
     """
     Get all drug groups with optional pagination.
     """
-    return repo.pharmacy_inventory(skip=skip, limit=limit)
+    return repo.pharmacy_inventory(skip=skip, limit=limit, pharm_id=pharm_id)
+
+
+@pharmacy_router.post("/stock/rebuild")
+def rebuild_stock(repo: StockRepository = Depends(get_stock_repository)):
+    """
+    Recompute stock on hand from the drug movement history.
+    """
+    return {'rebuilt': repo.rebuild()}
+
+
+@pharmacy_router.get("/stock/reconcile")
+def reconcile_stock(repo: StockRepository = Depends(get_stock_repository)):
+    """
+    List stock on hand rows that no longer match the drug movement history.
+    """
+    return {'data': repo.reconcile()}
+
+
+@pharmacy_router.get("/stock/lots/near-expiry")
+def get_near_expiry_lots(days: int = Query(90), pharm_id: int = Query(0), skip: int = Query(0),
+                         limit: int = Query(100), repo: LotRepository = Depends(get_lot_repository)):
+    """
+    Lots with stock remaining that expire within the given number of days, soonest first.
+    """
+    return repo.near_expiry(days=days, pharmacy_id=pharm_id, skip=skip, limit=limit)
+
+
+@pharmacy_router.get("/stock/lots/stock-outs")
+def get_stock_outs(pharm_id: int = Query(0), skip: int = Query(0), limit: int = Query(100),
+                   repo: LotRepository = Depends(get_lot_repository)):
+    """
+    Drug packages with no unexpired stock left in a pharmacy.
+    """
+    return repo.stock_outs(pharmacy_id=pharm_id, skip=skip, limit=limit)
+
+
+@pharmacy_router.get("/stock/lots/{drug_id}")
+def get_drug_lots(drug_id: int, pharm_id: int = Query(0), available_only: bool = Query(True),
+                  repo: LotRepository = Depends(get_lot_repository)):
+    """
+    Lots of a drug in first-expiry-first-out order.
+    """
+    return repo.get_lots(drug_id=drug_id, pharmacy_id=pharm_id, available_only=available_only)
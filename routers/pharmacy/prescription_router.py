@@ -5,8 +5,11 @@ from sqlalchemy.orm import Session
 
 from db import get_db
 from dtos.auth import UserDTO
-from dtos.pharmacy.prescription import PrescriptionDTO
+from dtos.pharmacy.prescription import PrescriptionDTO, PrescriptionCheckDTO, PrescriptionWarningDTO
+from dtos.pharmacy.stock import DispenseDTO, StockAllocationDTO
+from repos.pharmacy.lot_repository import LotRepository
 from repos.pharmacy.prescription_repository import PrescriptionRepository
+from repos.pharmacy.safety_repository import SafetyRepository
 from security.dependencies import get_current_active_user
 
 prescription_router = APIRouter(
@@ -20,6 +23,14 @@ def get_prescription_repository(db: Session = Depends(get_db)):
     return PrescriptionRepository(db)
 
 
+def get_lot_repository(db: Session = Depends(get_db)):
+    return LotRepository(db)
+
+
+def get_safety_repository(db: Session = Depends(get_db)):
+    return SafetyRepository(db)
+
+
 @prescription_router.post("/", response_model=PrescriptionDTO, status_code=status.HTTP_201_CREATED)
 def create_prescription(
         prescription: PrescriptionDTO,
@@ -30,6 +41,14 @@ def create_prescription(
     return repo.create(prescription, current_user)
 
 
+@prescription_router.post("/check", response_model=List[PrescriptionWarningDTO])
+def check_prescription(check: PrescriptionCheckDTO, repo: SafetyRepository = Depends(get_safety_repository)):
+    """
+    Allergy, duplicate ingredient and interaction warnings for drugs about to be prescribed to a client.
+    """
+    return repo.check(check.drug_ids, check.client_id)
+
+
 @prescription_router.get("/", status_code=status.HTTP_200_OK)
 def get_prescription(skip: int = Query(0), limit: int = Query(100),
                      status: str = Query("All"),
@@ -40,3 +59,22 @@ def get_prescription(skip: int = Query(0), limit: int = Query(100),
     Get all prescriptions with optional filters and pagination.
     """
     return repo.get_all(skip=skip, limit=limit, status=status, start_date=start_date, end_date=end_date)
+
+
+@prescription_router.post("/{prescription_id}/dispense", response_model=List[StockAllocationDTO])
+def dispense_prescription(
+        prescription_id: int,
+        dispense: DispenseDTO,
+        current_user: Annotated[UserDTO, Depends(get_current_active_user)],
+        repo: LotRepository = Depends(get_lot_repository)
+):
+    """
+    Dispense prescription items from the earliest expiring lots of the prescribing pharmacy.
+    """
+    try:
+        allocations = repo.dispense(prescription_id, dispense.items, current_user.id, dispense.transaction_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if allocations is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prescription not found")
+    return allocations
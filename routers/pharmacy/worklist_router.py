@@ -0,0 +1,83 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+from cache.redis import get_async_redis_client
+from db import get_db
+from models.pharmacy import PrescriptionStatus
+from repos.pharmacy.prescription_repository import PrescriptionRepository
+from repos.pharmacy.worklist_repository import WorklistRepository, worklist_channel
+
+worklist_router = APIRouter(
+    prefix="/api/pharmacy/worklist",
+    tags=["prescription", "pharmacy"]
+)
+
+# seconds between keep-alive comments on an idle event stream
+KEEPALIVE_SECONDS = 15
+
+
+# Dependency
+def get_prescription_repository(db: Session = Depends(get_db)):
+    return PrescriptionRepository(db)
+
+
+def get_worklist_repository(db: Session = Depends(get_db)):
+    return WorklistRepository(db)
+
+
+@worklist_router.post("/counts/rebuild")
+def rebuild_counts(repo: WorklistRepository = Depends(get_worklist_repository)):
+    """
+    Recount prescriptions per pharmacy and status.
+    """
+    return {'rebuilt': repo.rebuild_counts()}
+
+
+@worklist_router.get("/{pharmacy_id}")
+def get_worklist(pharmacy_id: int,
+                 status_filter: PrescriptionStatus = Query(PrescriptionStatus.Pending, alias="status"),
+                 cursor: Optional[str] = Query(None),
+                 limit: int = Query(50),
+                 repo: PrescriptionRepository = Depends(get_prescription_repository)):
+    """
+    Oldest first prescriptions of a pharmacy. Pass the returned next_cursor to get the following page.
+    """
+    try:
+        return repo.get_worklist(pharmacy_id, status_filter, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@worklist_router.get("/{pharmacy_id}/counts")
+def get_worklist_counts(pharmacy_id: int, repo: WorklistRepository = Depends(get_worklist_repository)):
+    return repo.get_counts(pharmacy_id)
+
+
+@worklist_router.get("/{pharmacy_id}/events")
+async def worklist_events(pharmacy_id: int, request: Request):
+    """
+    Server-sent events with every prescription created or updated in the pharmacy.
+    """
+
+    async def events():
+        redis = get_async_redis_client()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(worklist_channel(pharmacy_id))
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {message['data'].decode('utf-8')}\n\n"
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+            await redis.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -1,12 +1,12 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from sqlalchemy.orm import Session
 from starlette import status
 
 from db import get_db
 from dtos.auth import UserDTO
-from dtos.supply import SupplyDTO
+from dtos.supply import SupplyDTO, SupplyIntakeDTO
 from repos.supply_repository import SupplyRepository
 from security.dependencies import get_current_active_user
 
@@ -22,10 +22,32 @@ def create_supply(
     # current_user: Annotated[UserDTO, Depends(get_current_active_user())],
     supply: SupplyDTO, repo: SupplyRepository = Depends(supply_repository),
                   ):
-    instock = repo.process_supply(supply)
+    try:
+        repo.process_supply(supply)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
     return supply
 
 
+@supply_router.post("/delivery-note", response_model=SupplyIntakeDTO, status_code=status.HTTP_201_CREATED)
+def import_delivery_note(
+        supplier_id: int = Form(...),
+        pharmacy_id: int = Form(...),
+        discount: float = Form(0.0),
+        file: UploadFile = File(...),
+        repo: SupplyRepository = Depends(supply_repository)):
+    """
+    Receive a delivery from a csv or json delivery note. Columns: drug_id, package_id, quantity and
+    optionally drug_form, buying_price, manufacture_date and expiry_date.
+    """
+    file_format = (file.filename or '').rsplit('.', 1)[-1].lower()
+    try:
+        lines = repo.parse_delivery_note(file.file.read(), file_format)
+        return repo.intake(supplier_id, pharmacy_id, lines, discount)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
 @supply_router.post("/inventory", status_code=status.HTTP_201_CREATED)
 def pharmacy_inventory(
         skip: int, limit: int, repo: SupplyRepository = Depends(supply_repository)):
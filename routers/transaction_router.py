@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
@@ -6,16 +6,19 @@ from starlette import status
 from starlette.responses import JSONResponse
 
 from dtos.lab import DateFilterDTO
-from dtos.transaction import TransactionDTO, PaymentDTO, ReferredTransactionDTO, TransactionPackageDTO
+from dtos.transaction import TransactionDTO, PaymentDTO, ReferredTransactionDTO, TransactionPackageDTO, \
+    TransactionBalanceDTO, PaymentJournalDTO
 from db import get_db
 from models.services.services import BookingStatus
-from models.transaction import TransactionType
-from repos import transaction_repository
+from models.transaction import TransactionType, PaymentMethod
 from repos.client.referral_repository import ReferralRepository
 from repos.consultation.consultant_repository import ConsultantRepository
 from repos.lab.lab_repository import LabRepository
+from repos.ledger_repository import LedgerRepository
 from repos.payment_repository import PaymentRepository
+from repos.reconciliation_repository import ReconciliationRepository
 from repos.transaction_repository import TransactionRepository
+from utils.export import export_response
 
 transaction_router = APIRouter(prefix="/api/transaction", tags=["Transaction"])
 
@@ -40,6 +43,14 @@ def payment_repo(db: Session = Depends(get_db)) -> PaymentRepository:
     return PaymentRepository(db)
 
 
+def ledger_repo(db: Session = Depends(get_db)) -> LedgerRepository:
+    return LedgerRepository(db)
+
+
+def reconciliation_repo(db: Session = Depends(get_db)) -> ReconciliationRepository:
+    return ReconciliationRepository(db)
+
+
 @transaction_router.get("/")
 def get_transaction(transaction_id: int,
                     # current_user: Annotated[UserDTO, Depends(require_access_privilege(11))],
@@ -118,6 +129,25 @@ def read_collated_results(limit: int = 15, skip: int = 0, booking_status: Bookin
     return results
 
 
+@transaction_router.get("/laboratories/export")
+def export_transactions(file_format: str = 'csv', booking_status: BookingStatus = None,
+                        search_text: str = '', client_id: int = 0, only_referred_transactions: int = 0,
+                        start_date: str = '', last_date: str = '',
+                        transaction_type: TransactionType = TransactionType.All):
+    date_filter: DateFilterDTO = {
+        "start_date": start_date,
+        "last_date": last_date,
+        "status": ''
+    }
+    headers = ['Transaction ID', 'Transaction Time', 'Booking ID', 'Booking Status', 'Transaction Status',
+               'Client ID', 'First Name', 'Last Name', 'Discount', 'Total Billed', 'Total Paid', 'Outstanding']
+    return export_response(
+        lambda db: TransactionRepository(db).export_transactions(booking_status, search_text, transaction_type,
+                                                                 client_id, date_filter,
+                                                                 only_referred_transactions == 1),
+        headers, file_format, 'transactions')
+
+
 @transaction_router.get("/transactions/{transaction_id}/payments", tags=["Payment"], response_model=List[PaymentDTO])
 def get_payments_by_transaction(transaction_id: int, db: Session = Depends(get_db)):
     prp = PaymentRepository(db)
@@ -129,9 +159,12 @@ def get_payments_by_transaction(transaction_id: int, db: Session = Depends(get_d
 
 @transaction_router.post("/payments/", response_model=PaymentDTO, tags=["Payment"])
 def create_payment(payment: PaymentDTO,
-                   db: Session = Depends(get_db)):
-    repo = PaymentRepository(db)
-    return repo.create_payment(payment=payment)
+                   repo: PaymentRepository = Depends(payment_repo),
+                   reconciliation: ReconciliationRepository = Depends(reconciliation_repo)):
+    db_payment = repo.create_payment(payment=payment)
+    # payments may be back-dated into a closed, cached day
+    reconciliation.invalidate_day(db_payment.payment_date)
+    return db_payment
 
 
 @transaction_router.get("/payments/{payment_id}", response_model=PaymentDTO, tags=["Payment"])
@@ -147,19 +180,27 @@ def read_payment(payment_id: int,
 @transaction_router.put("/payments/{payment_id}", response_model=PaymentDTO)
 def update_payment(payment_id: int,
                    payment: PaymentDTO,
-                   db: Session = Depends(get_db)):
-    db_payment = transaction_repository.update_payment(db=db, payment_id=payment_id, payment=payment)
-    if db_payment is None:
+                   repo: PaymentRepository = Depends(payment_repo),
+                   reconciliation: ReconciliationRepository = Depends(reconciliation_repo)):
+    original = repo.get_payment(payment_id)
+    if original is None:
         raise HTTPException(status_code=404, detail="Payment not found")
+    payment_date = original.payment_date
+    db_payment = repo.update_payment(payment_id=payment_id, payment=payment)
+    # the edit may move the payment to another day
+    reconciliation.invalidate_day(payment_date)
+    reconciliation.invalidate_day(db_payment.payment_date)
     return db_payment
 
 
 @transaction_router.delete("/payments")
 def delete_payment(payment_id: int,
-                   repo: PaymentRepository = Depends(payment_repo)):
+                   repo: PaymentRepository = Depends(payment_repo),
+                   reconciliation: ReconciliationRepository = Depends(reconciliation_repo)):
     payment = repo.delete_payment(payment_id)
     if payment is None:
         raise HTTPException(status_code=404, detail="Payment not found")
+    reconciliation.invalidate_day(payment.payment_date)
     return payment
 
 
@@ -170,3 +211,44 @@ def get_payments(limit: int = 15, skip: int = 0,
                  repo: PaymentRepository = Depends(payment_repo)):
     return repo.get_payments(limit, skip, transaction_type, client_id,
                              start_date, last_date)
+
+
+@transaction_router.get("/reconciliation/", tags=["Payment"])
+def get_reconciliation(start_date: str, last_date: str = '', user_id: int = 0,
+                       payment_method: Optional[PaymentMethod] = None, refresh: int = 0,
+                       repo: ReconciliationRepository = Depends(reconciliation_repo)):
+    """
+    Cashier end of day report: payments per teller and payment method, discounts and referral
+    settlements for each day between start_date and last_date (YYYY-MM-DD).
+    """
+    try:
+        return repo.get_reconciliation(start_date, last_date, user_id,
+                                       payment_method.value if payment_method else '', refresh == 1)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates must be in YYYY-MM-DD format")
+
+
+@transaction_router.get("/balances/outstanding", tags=["Payment"])
+def get_outstanding_balances(limit: int = 20, skip: int = 0, client_id: int = 0,
+                             repo: LedgerRepository = Depends(ledger_repo)):
+    return repo.get_outstanding_balances(skip=skip, limit=limit, client_id=client_id)
+
+
+@transaction_router.post("/balances/rebuild", tags=["Payment"])
+def rebuild_balances(repo: LedgerRepository = Depends(ledger_repo)):
+    return {'rebuilt': repo.rebuild_all_balances()}
+
+
+@transaction_router.get("/{transaction_id}/balance", response_model=TransactionBalanceDTO, tags=["Payment"])
+def get_transaction_balance(transaction_id: int,
+                            repo: LedgerRepository = Depends(ledger_repo)):
+    balance = repo.get_balance(transaction_id)
+    if balance is None:
+        raise HTTPException(status_code=404, detail="No balance recorded for this transaction")
+    return balance
+
+
+@transaction_router.get("/{transaction_id}/journal", response_model=List[PaymentJournalDTO], tags=["Payment"])
+def get_transaction_journal(transaction_id: int,
+                            repo: LedgerRepository = Depends(ledger_repo)):
+    return repo.get_journal(transaction_id)
@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import event
+
+from dtos.consultation import ClinicalExaminationDTO
+from models.consultation import ClinicalExamination, PresentingSymptom, Symptom
+from models.transaction import Transaction
+from repos.consultation.clinical_examination_repository import ClinicalExaminationRepository
+
+
+def seed(db):
+    db.add(Transaction(id=1, user_id=1))
+    for symptom_id in range(1, 4):
+        db.add(Symptom(id=symptom_id, symptom=f'Symptom {symptom_id}'))
+    db.commit()
+
+
+def examination(*severities):
+    return ClinicalExaminationDTO(transaction_id=1, presenting_complaints='Headache', symptoms=[
+        {'symptom_id': symptom_id, 'severity': severity, 'frequency': 'Daily'}
+        for symptom_id, severity in enumerate(severities, start=1)
+    ])
+
+
+def test_an_examination_and_its_symptoms_are_written_in_one_transaction(db, engine):
+    seed(db)
+    statements, commits = [], []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+    event.listen(db, 'after_commit', lambda session: commits.append(session))
+
+    created = ClinicalExaminationRepository(db).create(examination('Low', 'Medium', 'High'), conducted_by=4)
+
+    # one insert for the examination and one executemany for all its symptoms
+    assert sum(statement.startswith('INSERT') for statement in statements) == 2
+    assert len(commits) == 1
+
+    assert created.conducted_by == 4
+    assert [(symptom.symptom_id, symptom.severity) for symptom in created.symptoms] == [
+        (1, 'Low'), (2, 'Medium'), (3, 'High'),
+    ]
+    assert all(symptom.clinical_examination_id == created.id for symptom in created.symptoms)
+    assert db.query(PresentingSymptom).filter(PresentingSymptom.clinical_examination_id == created.id).count() == 3
+
+
+def test_a_bad_symptom_rolls_back_the_whole_examination(db):
+    seed(db)
+
+    with pytest.raises(LookupError):
+        ClinicalExaminationRepository(db).create(examination('Low', 'Unbearable'))
+
+    assert db.query(ClinicalExamination).count() == 0
+    assert db.query(PresentingSymptom).count() == 0
+
+
+def test_an_examination_without_symptoms(db):
+    seed(db)
+
+    created = ClinicalExaminationRepository(db).create(examination())
+
+    assert created.symptoms == []
+    assert db.query(ClinicalExamination).one().id == created.id
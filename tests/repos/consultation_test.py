@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+
+from dtos.consultation import ConsultationDetailDTO
+from models.consultation import Consultations, ClinicalExamination, PresentingSymptom, ConsultationQueue, Symptom
+from models.lab.lab import QueueStatus
+from models.services.service_cart import ClientServiceCart, ClientServiceCartDetail
+from models.transaction import Transaction
+from repos.consultation import consultation_repository
+from repos.consultation.consultation_repository import ConsultationsRepository
+
+DOCTOR = SimpleNamespace(id=1)
+
+
+def seed(db):
+    db.add(ConsultationQueue(id=1, status=QueueStatus.Waiting))
+    db.add(Symptom(id=1, symptom='Headache'))
+    db.commit()
+
+
+def consultation():
+    return ConsultationDetailDTO(
+        consultation={'queue_id': 1, 'reason_for_visit': 'Headache'},
+        clinical_examination={'transaction_id': 0, 'symptoms': [
+            {'symptom_id': 1, 'severity': 'High', 'frequency': 'Daily'}
+        ]},
+        client_service_cart={'client_id': 1, 'client_service_cart_details': [
+            {'price_code_id': 1, 'service_id': 1}
+        ]},
+    )
+
+
+def rows(db):
+    return [db.query(model).count() for model in
+            (Consultations, Transaction, ClinicalExamination, PresentingSymptom, ClientServiceCart,
+             ClientServiceCartDetail)]
+
+
+def test_a_consultation_is_written_with_one_commit(db):
+    seed(db)
+    commits = []
+    event.listen(db, 'after_commit', lambda session: commits.append(session))
+
+    created = ConsultationsRepository(db).create(consultation(), DOCTOR)
+
+    assert len(commits) == 1
+    assert created.queue_id == 1
+    assert rows(db) == [1, 1, 1, 1, 1, 1]
+    assert db.get(ConsultationQueue, 1).status == QueueStatus.Processed
+
+
+def test_a_failed_prescription_leaves_nothing_of_the_consultation(db, monkeypatch):
+    seed(db)
+
+    def fail(self, prescription, user):
+        raise RuntimeError("prescription failed")
+
+    monkeypatch.setattr(consultation_repository.PrescriptionRepository, 'create', fail)
+    detail = consultation()
+    detail.prescription = SimpleNamespace()
+
+    with pytest.raises(RuntimeError):
+        ConsultationsRepository(db).create(detail, DOCTOR)
+
+    # the service cart was written before the prescription and is rolled back with the rest
+    assert rows(db) == [0, 0, 0, 0, 0, 0]
+    assert db.get(ConsultationQueue, 1).status == QueueStatus.Waiting
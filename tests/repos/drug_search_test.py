@@ -0,0 +1,53 @@
+from models.pharmacy import Drug
+from models.product import Product
+from repos.pharmacy.drug_search_repository import DrugSearchRepository, invalidate_search_index
+
+
+def seed(db):
+    drugs = [
+        (1, 'Panadol Extra', 'Paracetamol tablets', 'paracetamol, caffeine'),
+        (2, 'Emzor Paracetamol', 'Paracetamol syrup', 'paracetamol'),
+        (3, 'Augmentin', 'Amoxicillin and clavulanate', 'amoxicillin, clavulanic acid'),
+    ]
+    for drug_id, brand_name, product_name, ingredients in drugs:
+        db.add(Product(id=drug_id, brand_name=brand_name, product_name=product_name, product_desc=product_name,
+                       manufacturer='GSK'))
+        db.add(Drug(id=drug_id, product_id=drug_id, active_ingredients=ingredients))
+    db.commit()
+
+
+def test_search_falls_back_to_the_memory_index_on_sqlite(db):
+    seed(db)
+    repo = DrugSearchRepository(db)
+
+    hits, total = repo.search('paracetamol')
+    assert total == 2
+    assert {drug_id for drug_id, _ in hits} == {1, 2}
+
+    # a misspelt word still matches through its trigrams
+    hits, total = repo.search('amoxicilin')
+    assert [drug_id for drug_id, _ in hits] == [3]
+    assert 0 < hits[0][1] < 1
+
+
+def test_search_ranks_pages_and_skips_deleted_drugs(db):
+    seed(db)
+    repo = DrugSearchRepository(db)
+
+    hits, total = repo.search('emzor paracetamol', limit=1)
+    assert total == 2
+    assert hits[0][0] == 2
+
+    db.get(Drug, 2).is_deleted = True
+    db.commit()
+    invalidate_search_index(db)
+
+    hits, total = repo.search('paracetamol')
+    assert [drug_id for drug_id, _ in hits] == [1]
+    hits, total = repo.search('paracetamol', include_deleted=True)
+    assert total == 2
+
+
+def test_search_of_a_blank_term_returns_nothing(db):
+    seed(db)
+    assert DrugSearchRepository(db).search('  ') == ([], 0)
@@ -0,0 +1,64 @@
+from datetime import date
+
+from dtos.services import ServiceBookingDTO, ServiceBookingDetailDTO
+from dtos.transaction import PaymentDTO
+from models.client import Client, Person, Sex, MaritalStatus
+from models.services.services import PriceCode
+from models.transaction import Transaction, TransactionBalance, PaymentMethod
+from repos.ledger_repository import LedgerRepository
+from repos.payment_repository import PaymentRepository
+from repos.services.service_repository import ServiceRepository
+from repos.transaction_repository import TransactionRepository
+
+
+def seed(db):
+    db.add(Person(id=1, first_name='Ada', last_name='Obi', sex=Sex.Female))
+    db.add(Client(id=1, person_id=1, marital_status=MaritalStatus.Single, date_of_birth=date(1990, 1, 1)))
+    db.add(Transaction(id=5, user_id=1, discount=0))
+    db.add(PriceCode(id=1, service_price=1000, discount=0))
+    db.add(PriceCode(id=2, service_price=400, discount=0))
+    db.commit()
+
+
+def book(db, price_code):
+    services = ServiceRepository(db)
+    booking = services.create_service_booking(ServiceBookingDTO(client_id=1, transaction_id=5))
+    services.create_service_booking_detail(ServiceBookingDetailDTO(service_id=1, price_code=price_code,
+                                                                   booking_id=booking['id']))
+
+
+def outstanding(db):
+    return [(row['transaction_id'], row['outstanding']) for row in LedgerRepository(db).get_outstanding_balances()['data']]
+
+
+def test_a_billed_transaction_is_owed_before_any_payment(db):
+    seed(db)
+    book(db, 1)
+
+    balance = db.get(TransactionBalance, 5)
+    assert (balance.client_id, balance.total_billed, balance.total_paid, balance.outstanding) == (1, 1000, 0, 1000)
+
+    listed = LedgerRepository(db).get_outstanding_balances()
+    assert listed['total'] == 1 and listed['volume'] == 1000
+    assert listed['data'][0]['client_first_name'] == 'Ada'
+
+
+def test_a_paid_transaction_is_owed_again_after_another_booking(db):
+    seed(db)
+    book(db, 1)
+    PaymentRepository(db).create_payment(PaymentDTO(amount=1000, transaction_id=5, payment_method=PaymentMethod.Cash))
+    assert outstanding(db) == []
+
+    book(db, 2)
+
+    assert outstanding(db) == [(5, 400)]
+    assert LedgerRepository(db).get_outstanding_balances(client_id=2)['data'] == []
+
+
+def test_a_discount_edit_reprices_the_snapshot(db):
+    seed(db)
+    book(db, 1)
+
+    TransactionRepository(db).update_transaction_discount(5, 10)
+
+    assert outstanding(db) == [(5, 900)]
@@ -0,0 +1,45 @@
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from models.pharmacy import PharmacyStockLot
+from repos.pharmacy.lot_repository import LotRepository
+
+SOON = date.today() + timedelta(days=30)
+LATER = date.today() + timedelta(days=300)
+
+
+def test_lots_without_a_pharmacy_or_package_are_allocated_first_expiry_first(db):
+    repo = LotRepository(db)
+    repo.receive_lots([
+        {'drug_id': 1, 'quantity': 5, 'expiry_date': LATER},
+        {'drug_id': 1, 'quantity': 5, 'expiry_date': SOON},
+        {'drug_id': 1, 'quantity': 5, 'expiry_date': SOON, 'pharmacy_id': 2},
+    ])
+    db.commit()
+
+    allocations = repo.allocate(None, 1, 7)
+
+    assert [(allocation.quantity, allocation.expiry_date) for allocation in allocations] == [(5, SOON), (2, LATER)]
+    assert {lot.pharmacy_id: lot.quantity_remaining for lot in db.query(PharmacyStockLot)
+            if lot.expiry_date == SOON} == {None: 0, 2: 5}
+
+
+def test_stock_outs_match_lots_on_their_keys(db):
+    repo = LotRepository(db)
+    repo.receive_lot(1, 5)
+    repo.receive_lot(2, 5, pharmacy_id=3, package_id=4)
+    repo.receive_lot(2, 0, pharmacy_id=3, package_id=4)
+    repo.receive_lot(5, 0, pharmacy_id=3)
+    db.commit()
+
+    assert [(row['pharmacy_id'], row['drug_id']) for row in repo.stock_outs()['data']] == [(3, 5)]
+
+
+def test_available_lots_are_an_index_search_on_the_lot_keys(db):
+    query = LotRepository(db).available_lots(None, 1, package_id=4).statement
+    sql = str(query.compile(db.get_bind(), compile_kwargs={'literal_binds': True}))
+
+    plan = ' '.join(str(row) for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert 'SEARCH pharmacy_stock_lot USING INDEX' in plan
+    assert 'pharmacy_key=? AND drug_id=? AND package_key=?' in plan
@@ -0,0 +1,70 @@
+from datetime import date
+
+from dtos.transaction import PaymentDTO
+from models.services.services import PriceCode, ServiceBooking, ServiceBookingDetail
+from models.transaction import Transaction, Payments, PaymentMethod, JournalEntryType
+from repos.ledger_repository import LedgerRepository
+from repos.payment_repository import PaymentRepository
+
+
+def seed(db):
+    db.add(Transaction(id=5, user_id=1, discount=10))
+    db.add(PriceCode(id=1, service_price=1000, discount=5))
+    db.add(ServiceBooking(id=1, client_id=1, transaction_id=5))
+    db.add(ServiceBookingDetail(id=1, price_code=1, booking_id=1, service_id=1))
+    db.commit()
+
+
+def test_payment_edit_keeps_its_date_and_user(db):
+    seed(db)
+    repo = PaymentRepository(db)
+    repo.create_payment(PaymentDTO(amount=200, transaction_id=5, payment_method=PaymentMethod.Cash))
+    created = db.query(Payments).one()
+
+    # a payment taken on an earlier day by another cashier
+    created.payment_date = date(2026, 1, 15)
+    created.user_id = 7
+    db.commit()
+
+    updated = repo.update_payment(created.id, PaymentDTO(amount=250, transaction_id=5,
+                                                         payment_method=PaymentMethod.PoS))
+
+    assert updated.amount == 250
+    assert updated.payment_method == PaymentMethod.PoS
+    assert updated.payment_date == date(2026, 1, 15)
+    assert updated.user_id == 7
+
+
+def test_payment_edit_moves_the_date_only_when_sent(db):
+    seed(db)
+    repo = PaymentRepository(db)
+    repo.create_payment(PaymentDTO(amount=200, transaction_id=5, payment_method=PaymentMethod.Cash))
+    created = db.query(Payments).one()
+
+    updated = repo.update_payment(created.id, PaymentDTO(amount=200, transaction_id=5, payment_date=date(2026, 2, 1),
+                                                         user_id=9, payment_method=PaymentMethod.Cash))
+
+    assert updated.payment_date == date(2026, 2, 1)
+    # the user is set by the backend only
+    assert updated.user_id == 1
+
+
+def test_payment_edit_reverses_and_records_in_the_journal(db):
+    seed(db)
+    repo = PaymentRepository(db)
+    repo.create_payment(PaymentDTO(amount=200, transaction_id=5, payment_method=PaymentMethod.Cash))
+    created = db.query(Payments).one()
+    repo.update_payment(created.id, PaymentDTO(amount=250, transaction_id=5, payment_method=PaymentMethod.PoS))
+
+    ledger = LedgerRepository(db)
+    journal = ledger.get_journal(5)
+    assert [(entry.entry_type, entry.amount) for entry in journal] == [
+        (JournalEntryType.Payment, 200),
+        (JournalEntryType.Reversal, -200),
+        (JournalEntryType.Payment, 250),
+    ]
+    assert all(entry.user_id == 1 for entry in journal)
+
+    balance = ledger.get_balance(5)
+    assert balance.total_paid == 250
+    assert balance.outstanding == balance.total_billed - balance.discount - balance.bundle_discount - 250
@@ -0,0 +1,38 @@
+from datetime import date
+
+from models.client import Referral, OrganizationPeople, Person, Sex
+from models.services.services import PriceCode, ServiceBooking, ServiceBookingDetail
+from models.transaction import Transaction, ReferredTransaction, ReferredTransactionStatus
+from repos.client.referral_settlement_repository import ReferralSettlementRepository
+
+
+def seed(db):
+    db.add(Person(id=1, first_name='Ngozi', last_name='Eze', sex=Sex.Female))
+    db.add(OrganizationPeople(id=1, person_id=1, organization_id=1))
+    db.add(Referral(id=1, org_people_id=1))
+    db.add(PriceCode(id=1, service_price=1000, discount=10))
+    for transaction_id, day in [(5, date(2026, 3, 2)), (6, date(2026, 3, 3)), (7, date(2026, 4, 1))]:
+        db.add(Transaction(id=transaction_id, user_id=1, discount=5, transaction_date=day))
+        db.add(ServiceBooking(id=transaction_id, client_id=1, transaction_id=transaction_id))
+        db.add(ServiceBookingDetail(id=transaction_id, price_code=1, booking_id=transaction_id, service_id=1))
+        db.add(ReferredTransaction(id=transaction_id, transaction_id=transaction_id, referral_id=1))
+    db.commit()
+
+
+def test_settlement_prices_only_the_transactions_in_its_range(db):
+    seed(db)
+    repo = ReferralSettlementRepository(db)
+
+    preview = repo.get_unsettled('2026-03-01', '2026-03-31')
+    assert preview['total'] == 2
+    # 1000 billed, less 10% on the line and 5% on the transaction
+    assert preview['data'][0]['net_total'] == 2 * 850
+
+    settled = repo.settle('2026-03-01', '2026-03-31', user_id=1)
+    assert settled['volume'] == 2 * 850
+    assert {row.id: row.status for row in db.query(ReferredTransaction)} == {
+        5: ReferredTransactionStatus.Settled,
+        6: ReferredTransactionStatus.Settled,
+        7: ReferredTransactionStatus.UnSettled,
+    }
+    assert repo.get_unsettled('2026-03-01', '2026-03-31')['total'] == 0
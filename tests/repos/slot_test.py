@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from db import get_db
+from models.consultation import Specialist, InHours, InHourFrequency, ConsultationQueue
+from models.services.services import PriceCode, BusinessServices
+from repos.consultation.slot_repository import FREE_SLOTS_KEY, slot_member
+from routers.consultation_router import consultation_router
+
+QUEUE_URL = "/api/clinicals/consultation/consultant/queue/"
+RESERVE_URL = "/api/clinicals/consultation/consultant/queue/reserve"
+
+# a day ahead, so every slot of the session is bookable
+DAY = date.today() + timedelta(days=2)
+SLOT = f"{DAY.isoformat()} 09:30:00"
+
+
+@pytest.fixture
+def client(db, redis):
+    db.add(PriceCode(id=1, service_price=100, discount=0))
+    db.add(BusinessServices(service_id=1, price_code=1, ext_turn_around_time=30))
+    db.add(Specialist(id=1, user_id=1, title='Dr'))
+    db.add(InHours(id=1, specialist_id=1, service_id=1, frequency=InHourFrequency.Daily,
+                   start_time=datetime(2026, 1, 1, 9), end_time=datetime(2026, 1, 1, 11)))
+    db.commit()
+
+    app = FastAPI()
+    app.include_router(consultation_router)
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+def test_double_booking_a_slot_is_a_conflict(client, db):
+    first = client.post(QUEUE_URL, json={'schedule_id': 1, 'consultation_time': SLOT})
+    assert first.status_code == 200
+    assert first.json()['consultation_time'] == SLOT
+
+    second = client.post(QUEUE_URL, json={'schedule_id': 1, 'consultation_time': SLOT})
+    assert second.status_code == 409
+    assert db.query(ConsultationQueue).count() == 1
+
+
+def test_a_held_slot_cannot_be_reserved_or_booked_by_someone_else(client, db):
+    held = client.post(RESERVE_URL, json={'schedule_id': 1, 'consultation_time': SLOT})
+    assert held.status_code == 200
+    token = held.json()['token']
+
+    assert client.post(RESERVE_URL, json={'schedule_id': 1, 'consultation_time': SLOT}).status_code == 409
+    assert client.post(QUEUE_URL, json={'schedule_id': 1, 'consultation_time': SLOT}).status_code == 409
+
+    booked = client.post(QUEUE_URL, json={'schedule_id': 1, 'consultation_time': SLOT, 'reservation': token})
+    assert booked.status_code == 200
+    assert db.query(ConsultationQueue).count() == 1
+
+
+def test_the_database_refuses_a_double_booking_a_stale_cache_lets_through(client, db, redis):
+    assert client.post(QUEUE_URL, json={'schedule_id': 1, 'consultation_time': SLOT}).status_code == 200
+
+    # the free slot set still lists the booked slot
+    redis.sadd(FREE_SLOTS_KEY.format(consultant_id=1, day=DAY.isoformat()),
+               slot_member(1, datetime.fromisoformat(SLOT)))
+
+    second = client.post(QUEUE_URL, json={'schedule_id': 1, 'consultation_time': SLOT})
+    assert second.status_code == 409
+    assert second.json()['detail'] == "This appointment slot is already booked"
+    assert db.query(ConsultationQueue).count() == 1
@@ -0,0 +1,55 @@
+from models.pharmacy import Form, PharmacyStock
+from repos.pharmacy.stock_repository import StockRepository, stock_key
+
+
+def stock(db):
+    return {row.stock_key: row.quantity for row in db.query(PharmacyStock.stock_key, PharmacyStock.quantity)}
+
+
+def test_movements_are_projected_per_stock_key(db):
+    repo = StockRepository(db)
+    repo.record_movement(1, 1, 10, Form.Tablet, pharmacy_id=1)
+    repo.record_movement(1, 1, -3, Form.Tablet, pharmacy_id=1)
+    repo.record_movement(1, 1, 5, Form.Tablet, pharmacy_id=2)
+    # movements without a form, package or pharmacy share one row
+    repo.record_movement(2, None, 4)
+    repo.record_movement(2, None, 4)
+    db.commit()
+
+    assert stock(db) == {
+        '1:1:Tablet:1': 7,
+        '2:1:Tablet:1': 5,
+        ':2::': 8,
+    }
+    assert stock_key(None, 2, None, None) == ':2::'
+    assert repo.reconcile() == []
+
+
+def test_bulk_movements_match_single_movements(db):
+    repo = StockRepository(db)
+    repo.record_movements([
+        {'drug_id': 1, 'package_id': 1, 'quantity': 10, 'drug_form': Form.Tablet, 'pharmacy_id': 1},
+        {'drug_id': 1, 'package_id': 1, 'quantity': -3, 'drug_form': Form.Tablet, 'pharmacy_id': 1},
+        {'drug_id': 2, 'quantity': 4},
+    ])
+    repo.record_movement(2, None, 4)
+    db.commit()
+
+    assert stock(db) == {'1:1:Tablet:1': 7, ':2::': 8}
+    assert repo.reconcile() == []
+
+
+def test_rebuild_restores_a_drifted_projection(db):
+    repo = StockRepository(db)
+    repo.record_movement(1, 1, 10, Form.Tablet, pharmacy_id=1)
+    repo.record_movement(2, None, 4)
+    db.commit()
+
+    db.query(PharmacyStock).filter(PharmacyStock.drug_id == 1).update({'quantity': 99})
+    db.commit()
+    drift = repo.reconcile()
+    assert [(row['drug_id'], row['movements'], row['stock']) for row in drift] == [(1, 10, 99)]
+
+    assert repo.rebuild() == 2
+    assert stock(db) == {'1:1:Tablet:1': 10, ':2::': 4}
+    assert repo.reconcile() == []
@@ -0,0 +1,48 @@
+from datetime import date
+
+from dtos.services import ServiceBookingDTO, ServiceBookingDetailDTO
+from dtos.transaction import PaymentDTO
+from models.client import Client, Person, Sex, MaritalStatus
+from models.services.services import PriceCode
+from models.transaction import Transaction, PaymentMethod, TransactionType
+from repos.payment_repository import PaymentRepository
+from repos.services.service_repository import ServiceRepository
+from repos.transaction_repository import TransactionRepository
+
+
+def seed(db):
+    db.add(Person(id=1, first_name='Ada', last_name='Obi', sex=Sex.Female))
+    db.add(Client(id=1, person_id=1, marital_status=MaritalStatus.Single, date_of_birth=date(1990, 1, 1)))
+    db.add(Transaction(id=5, user_id=1, discount=0))
+    db.add(PriceCode(id=1, service_price=1000, discount=0))
+    db.add(PriceCode(id=2, service_price=400, discount=0))
+    db.commit()
+
+
+def book(db, price_code):
+    services = ServiceRepository(db)
+    booking = services.create_service_booking(ServiceBookingDTO(client_id=1, transaction_id=5))
+    services.create_service_booking_detail(ServiceBookingDetailDTO(service_id=1, price_code=price_code,
+                                                                   booking_id=booking['id']))
+
+
+def export(db):
+    rows = TransactionRepository(db).export_transactions(None, '', TransactionType.All, 0, {})
+    # Total Billed, Total Paid and Outstanding of each exported booking
+    return [row[-3:] for row in rows]
+
+
+def test_an_unpaid_transaction_exports_what_it_owes(db):
+    seed(db)
+    book(db, 1)
+
+    assert export(db) == [(1000, 0, 1000)]
+
+
+def test_a_booking_after_a_payment_shows_in_the_export(db):
+    seed(db)
+    book(db, 1)
+    PaymentRepository(db).create_payment(PaymentDTO(amount=1000, transaction_id=5, payment_method=PaymentMethod.Cash))
+    book(db, 2)
+
+    assert export(db) == [(1400, 1000, 400), (1400, 1000, 400)]
@@ -0,0 +1,50 @@
+from models.pharmacy import Prescription, PrescriptionStatus, PrescriptionStatusCount
+from repos.pharmacy.worklist_repository import WorklistRepository
+
+
+def counters(db):
+    return {(row.pharmacy_id, row.status): row.count for row in db.query(PrescriptionStatusCount)}
+
+
+def test_counters_without_a_pharmacy_share_one_row(db):
+    repo = WorklistRepository(db)
+    # two first prescriptions for the same pharmacy and status, back to back in one transaction
+    repo.adjust_count(None, PrescriptionStatus.Pending, 1)
+    repo.adjust_count(None, PrescriptionStatus.Pending, 1)
+    repo.adjust_count(3, PrescriptionStatus.Pending, 1)
+    repo.adjust_count(3, PrescriptionStatus.Pending, 1)
+    db.commit()
+
+    assert db.query(PrescriptionStatusCount).count() == 2
+    assert counters(db) == {(None, PrescriptionStatus.Pending): 2, (3, PrescriptionStatus.Pending): 2}
+
+
+def test_a_status_change_moves_one_count(db):
+    repo = WorklistRepository(db)
+    repo.status_changed(None, None, PrescriptionStatus.Pending)
+    repo.status_changed(None, None, PrescriptionStatus.Pending)
+    repo.status_changed(None, PrescriptionStatus.Pending, PrescriptionStatus.PatiallyDispensed)
+    db.commit()
+
+    assert counters(db) == {(None, PrescriptionStatus.Pending): 1, (None, PrescriptionStatus.PatiallyDispensed): 1}
+
+
+def test_rebuild_counts_keys_missing_pharmacies_like_the_upsert(db):
+    db.add_all([
+        Prescription(id=1, status=PrescriptionStatus.Pending),
+        Prescription(id=2, status=PrescriptionStatus.Pending),
+        Prescription(id=3, pharmacy_id=3, status=PrescriptionStatus.Dispensed),
+    ])
+    db.commit()
+    repo = WorklistRepository(db)
+
+    assert repo.rebuild_counts() == 2
+    # a counter written after the rebuild lands on the rebuilt row
+    repo.adjust_count(None, PrescriptionStatus.Pending, 1)
+    db.commit()
+
+    assert {(row.pharmacy_key, row.status): row.count for row in db.query(PrescriptionStatusCount)} == {
+        (0, PrescriptionStatus.Pending): 3,
+        (3, PrescriptionStatus.Dispensed): 1,
+    }
+    assert repo.get_counts(3)[PrescriptionStatus.All.value] == 1
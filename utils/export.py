@@ -0,0 +1,173 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from enum import Enum
+from typing import Callable, Iterable, Iterator, List, Sequence
+from xml.sax.saxutils import escape
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+from db import SessionLocal
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# rows buffered before a chunk is handed to the response
+CHUNK_ROWS = 500
+
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def cell_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(headers: Sequence[str], rows: Iterable[Sequence]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([cell_value(value) for value in row])
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkWriter:
+    """Write only, unseekable sink for zipfile; whatever was written is collected with drain()."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _xlsx_cell(value) -> str:
+    value = cell_value(value)
+    if isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, (int, float)):
+        return f'<c t="n"><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values: Sequence) -> str:
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>',
+    '_rels/.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>',
+    'xl/_rels/workbook.xml.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>',
+}
+
+
+def stream_xlsx(headers: Sequence[str], rows: Iterable[Sequence], sheet_name: str = 'Export') -> Iterator[bytes]:
+    """
+    Writes a single sheet workbook with inline strings, so nothing but the current chunk of rows
+    is held in memory. The zip is written with data descriptors since the output cannot seek.
+    """
+    sink = _ChunkWriter()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        workbook.writestr(
+            'xl/workbook.xml',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        )
+        yield sink.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', mode='w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            sheet.write(_xlsx_row(headers).encode('utf-8'))
+            buffer = []
+            for count, row in enumerate(rows, 1):
+                buffer.append(_xlsx_row(row))
+                if count % CHUNK_ROWS == 0:
+                    sheet.write(''.join(buffer).encode('utf-8'))
+                    buffer = []
+                    yield sink.drain()
+            sheet.write(''.join(buffer).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def export_response(rows: Callable[[Session], Iterable[Sequence]], headers: List[str],
+                    file_format: str, filename: str) -> StreamingResponse:
+    """
+    Stream rows as csv or xlsx.
+
+    `rows` is called with a session owned by the response, since the request session is closed
+    before the body is sent. It should return an iterator backed by a server-side cursor
+    (Query.yield_per) so memory stays flat regardless of the number of rows.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Unsupported export format '{file_format}'")
+
+    def body():
+        db = SessionLocal()
+        try:
+            if file_format == 'xlsx':
+                yield from stream_xlsx(headers, rows(db), filename)
+            else:
+                yield from stream_csv(headers, rows(db))
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[file_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{file_format}"'}
+    )